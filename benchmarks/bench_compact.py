@@ -0,0 +1,68 @@
+"""
+This is a script to compare the memory used by the data frame of valid
+rows with the default object columns and with the compact layout.
+
+The sample data in data/log.json is repeated into a temporary file to
+get a bigger input.
+Run it from the top directory with:  python -m benchmarks.bench_compact
+"""
+
+import os
+import io
+import sys
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from log_reader.LogFileAnalyzer import LogFileAnalyzer
+from benchmarks.bench_parallel import make_log
+
+
+def main(log_path, scale):
+    """
+    Read the scaled up log with each layout and print the memory used
+    per row and by each column.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    big_log = os.path.join(tmp_dir, 'log.json')
+    try:
+        make_log(log_path, scale, big_log)
+        frames = []
+        for compact in [False, True]:
+            analyzer = LogFileAnalyzer(log_path=big_log, compact=compact)
+            stdout = sys.stdout
+            sys.stdout = io.StringIO()
+            start = time.time()
+            try:
+                rows = analyzer.read_and_validate()
+            finally:
+                sys.stdout = stdout
+            seconds = time.time() - start
+            layout = 'compact' if compact else 'object'
+            print('%-8s %8d rows %8.3f s %8.1f bytes/row %8.1f MB' %
+                  (layout, rows, seconds, analyzer.memory_per_row(), analyzer.memory_per_row() * rows / 1e6))
+            frames.append(analyzer.data_frame)
+
+        print('')
+        print('%-8s %14s %14s' % ('column', 'object', 'compact'))
+        before, after = [frame.memory_usage(deep=True, index=False) / len(frame) for frame in frames]
+        for column in before.index:
+            print('%-8s %8.1f bytes %8.1f bytes  %s' % (column, before[column], after[column], frames[1][column].dtype))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    default_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'log.json')
+    ap = ArgumentParser('Benchmark the memory used by the data frame layouts.')
+    ap.add_argument('-l', '--logfile', action='store', type=str, default=default_log,
+                    help='The path to logfile.')
+    ap.add_argument('-s', '--scale', action='store', type=int, default=20,
+                    help='How many times to repeat the log file.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    main(args.logfile, args.scale)
@@ -0,0 +1,65 @@
+"""
+This is a script to compare the speed of decoding the lines of a log
+file with eval(), as read_and_validate() used to do, against the
+JsonDecoder backends available on this system.
+
+The sample data in data/log.json is repeated to get a bigger input.
+Run it from the top directory with:  python -m benchmarks.bench_decode
+"""
+
+import os
+import time
+from argparse import ArgumentParser
+from log_reader.Decoder import JsonDecoder, available_backends
+
+
+def time_it(func, lines):
+    """
+    Time how long it takes func to decode all of the lines.
+
+    :return: (float) - Number of seconds taken.
+    """
+    start = time.time()
+    func(lines)
+    return time.time() - start
+
+def decode_with_eval(lines):
+    return [eval(line) for line in lines]
+
+def main(log_path, scale, batch_size):
+    """
+    Decode the scaled up log with each method and print the throughput.
+    """
+    with open(log_path, 'r') as fp:
+        lines = fp.readlines() * scale
+    print('Decoding ' + str(len(lines)) + ' lines')
+
+    results = [('eval', time_it(decode_with_eval, lines))]
+    for backend in available_backends():
+        decoder = JsonDecoder(backend)
+        def decode(lines):
+            for start in range(0, len(lines), batch_size):
+                decoder.decode_batch(lines[start:start + batch_size], start + 1)
+        results.append((backend, time_it(decode, lines)))
+
+    base = results[0][1]
+    for name, seconds in results:
+        print('%-12s %8.3f s %12.0f lines/s %6.1fx' % (name, seconds, len(lines) / seconds, base / seconds))
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    default_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'log.json')
+    ap = ArgumentParser('Benchmark decoding the lines of a log file.')
+    ap.add_argument('-l', '--logfile', action='store', type=str, default=default_log,
+                    help='The path to logfile.')
+    ap.add_argument('-s', '--scale', action='store', type=int, default=20,
+                    help='How many times to repeat the log file.')
+    ap.add_argument('-b', '--batch-size', action='store', type=int, default=10000,
+                    help='Number of lines decoded per call.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    main(args.logfile, args.scale, args.batch_size)
@@ -0,0 +1,75 @@
+"""
+This is a script to time read_and_validate() with different numbers of
+worker processes.
+
+The sample data in data/log.json is repeated into a temporary file to
+get a bigger input.
+Run it from the top directory with:  python -m benchmarks.bench_parallel
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from log_reader.LogFileAnalyzer import LogFileAnalyzer
+
+
+def make_log(log_path, scale, out_path):
+    """
+    Write the log file scale times over to out_path.
+    """
+    with open(out_path, 'w') as out:
+        for i in range(scale):
+            with open(log_path, 'r') as fp:
+                shutil.copyfileobj(fp, out)
+
+def main(log_path, scale, workers):
+    """
+    Read the scaled up log with each number of workers and print the
+    time taken and the speed-up over a single worker.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    big_log = os.path.join(tmp_dir, 'log.json')
+    try:
+        make_log(log_path, scale, big_log)
+        print('Reading ' + str(os.path.getsize(big_log)) + ' bytes')
+
+        base = None
+        for num in workers:
+            analyzer = LogFileAnalyzer(log_path=big_log, workers=num)
+
+            # The warnings are not of interest here
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                start = time.time()
+                rows = analyzer.read_and_validate()
+                seconds = time.time() - start
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+            base = base or seconds
+            print('%2d workers %8.3f s %10d rows %6.1fx' % (num, seconds, rows, base / seconds))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    default_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'log.json')
+    ap = ArgumentParser('Benchmark reading a log file with several processes.')
+    ap.add_argument('-l', '--logfile', action='store', type=str, default=default_log,
+                    help='The path to logfile.')
+    ap.add_argument('-s', '--scale', action='store', type=int, default=50,
+                    help='How many times to repeat the log file.')
+    ap.add_argument('-w', '--workers', action='store', type=int, nargs='+', default=[1, 2, 4, 8],
+                    help='The numbers of workers to time.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    main(args.logfile, args.scale, args.workers)
@@ -0,0 +1,188 @@
+"""
+This is a script to time each stage of reading a log file: reading the
+lines, parsing the JSON, validating the rows, finding the extensions,
+building the data frame and show_file_type_counts(), and then the whole
+of read_and_validate().  The throughput of each stage and the peak memory
+of the process are printed.
+
+The results can be saved as a baseline, and compared with a saved
+baseline, in which case the script exits with status 1 if any stage is
+slower, or the peak memory bigger, by more than the tolerance.
+
+A synthetic log file is written for the run unless one is given.
+Run it from the top directory with:
+    python -m benchmarks.bench_pipeline --lines 1M --baseline benchmarks/baseline.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+from argparse import ArgumentParser
+import pandas as pd
+from log_reader.FileIO import MyFileIO
+from log_reader.Decoder import JsonDecoder
+from log_reader.Validator import SchemaValidator
+from log_reader.LogFileAnalyzer import LogFileAnalyzer
+from benchmarks.generate_log import generate_log, parse_count
+
+STAGES = ['read', 'parse', 'validate', 'extension', 'data frame', 'type counts', 'read_and_validate']
+
+
+def peak_rss_mb():
+    """
+    :return: (float) - The peak resident memory of this process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives KB, macOS bytes
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+def time_stages(log_path, batch_size):
+    """
+    Run the stages of read_and_validate() one after the other on each
+    batch of the file, timing each one.
+
+    :return: (int, dict) - The number of lines and the seconds spent in
+             each stage.
+    """
+    analyzer = LogFileAnalyzer()
+    validator = SchemaValidator(analyzer.valid_keys)
+    decoder = JsonDecoder()
+    seconds = dict((stage, 0.0) for stage in STAGES)
+
+    lines = 0
+    frames = []
+    batches = MyFileIO(log_path).iter_batches(batch_size)
+    while True:
+        start = time.perf_counter()
+        batch = next(batches, None)
+        seconds['read'] += time.perf_counter() - start
+        if batch is None: break
+
+        start = time.perf_counter()
+        rows, failures = decoder.decode_batch(batch, lines + 1)
+        seconds['parse'] += time.perf_counter() - start
+        lines += len(batch)
+
+        start = time.perf_counter()
+        valid_entries = []
+        for line_no, row in rows:
+            if 'nm' in row and row['nm'] == row.get('ph'):
+                row['ph'] = '.'
+            if validator.validate(row)[0]:
+                valid_entries.append(row)
+        seconds['validate'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for row in valid_entries:
+            row['ext'] = os.path.splitext(row['nm'])[1][1:]
+        seconds['extension'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        frames.append(pd.DataFrame(valid_entries))
+        seconds['data frame'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    frame = pd.concat(frames, ignore_index=True)
+    del frames
+    seconds['data frame'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    frame.groupby(['ext']).size()
+    seconds['type counts'] += time.perf_counter() - start
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    start = time.perf_counter()
+    try:
+        LogFileAnalyzer(log_path=log_path, batch_size=batch_size).read_and_validate()
+    finally:
+        sys.stdout = stdout
+    seconds['read_and_validate'] = time.perf_counter() - start
+    return lines, seconds
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the results of a run with a baseline.
+
+    :return: (list of str) - A message for each regression.
+    """
+    regressions = []
+    if baseline['lines'] != results['lines']:
+        print('WARNING: the baseline was run with ' + str(baseline['lines']) + ' lines, not ' + str(results['lines']))
+    for stage in STAGES:
+        base = baseline['lines_per_second'].get(stage)
+        now = results['lines_per_second'][stage]
+        if base is not None and now < base * (1.0 - tolerance):
+            regressions.append('%s is %.1f%% slower than the baseline' % (stage, 100.0 * (1.0 - now / base)))
+    if results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1.0 + tolerance):
+        regressions.append('peak RSS is %.1f%% more than the baseline' %
+                           (100.0 * (results['peak_rss_mb'] / baseline['peak_rss_mb'] - 1.0)))
+    return regressions
+
+def main(log_path, num_lines, batch_size, baseline_path, save, tolerance):
+    """
+    Time the stages, print the results and compare or save the baseline.
+
+    :return: (int) - The exit status, 1 if there was a regression.
+    """
+    tmp_dir = None
+    if log_path is None:
+        tmp_dir = tempfile.mkdtemp()
+        log_path = os.path.join(tmp_dir, 'log.json')
+        generate_log(log_path, num_lines)
+    try:
+        lines, seconds = time_stages(log_path, batch_size)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    results = {'lines': lines,
+               'lines_per_second': dict((stage, lines / seconds[stage]) for stage in STAGES),
+               'peak_rss_mb': peak_rss_mb()}
+    print('%-18s %10s %14s' % ('stage', 'seconds', 'lines/s'))
+    for stage in STAGES:
+        print('%-18s %10.3f %14.0f' % (stage, seconds[stage], results['lines_per_second'][stage]))
+    print('%-18s %10.1f MB' % ('peak RSS', results['peak_rss_mb']))
+
+    if baseline_path is None:
+        return 0
+    if save:
+        with open(baseline_path, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        print('Baseline saved to ' + baseline_path)
+        return 0
+
+    with open(baseline_path, 'r') as fp:
+        baseline = json.load(fp)
+    regressions = compare(results, baseline, tolerance)
+    for msg in regressions:
+        print('REGRESSION: ' + msg)
+    return 1 if regressions else 0
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    ap = ArgumentParser('Benchmark each stage of reading a log file.')
+    ap.add_argument('-l', '--logfile', action='store', type=str, default=None,
+                    help='The path to logfile, a synthetic one is written if not given.')
+    ap.add_argument('-n', '--lines', action='store', type=parse_count, default=1000000,
+                    help='Number of lines in the synthetic log, e.g. 1M, 10M or 100M.')
+    ap.add_argument('-b', '--batch-size', action='store', type=int, default=10000,
+                    help='Number of lines per batch.')
+    ap.add_argument('--baseline', action='store', type=str, default=None,
+                    help='Baseline file to compare with, or to save to with --save.')
+    ap.add_argument('--save', action='store_true',
+                    help='Save the results as the baseline.')
+    ap.add_argument('-t', '--tolerance', action='store', type=float, default=0.2,
+                    help='How much slower, or bigger, than the baseline is a regression.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    sys.exit(main(args.logfile, args.lines, args.batch_size, args.baseline, args.save, args.tolerance))
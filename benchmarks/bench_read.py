@@ -0,0 +1,75 @@
+"""
+This is a script to compare reading and decoding a log file in batches
+with MyFileIO.iter_batches() against get_file_contents().
+
+The sample data in data/log.json is repeated into a temporary file to
+get a bigger input.
+Run it from the top directory with:  python -m benchmarks.bench_read
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from log_reader.FileIO import MyFileIO
+from log_reader.Decoder import JsonDecoder
+from benchmarks.bench_parallel import make_log
+
+
+def read_contents(path, decoder, batch_size):
+    lines = MyFileIO(path).get_file_contents()
+    if decoder is not None:
+        for start in range(0, len(lines), batch_size):
+            decoder.decode_batch(lines[start:start + batch_size], start + 1)
+    return len(lines)
+
+def read_batches(path, decoder, batch_size):
+    count = 0
+    for batch in MyFileIO(path).iter_batches(batch_size):
+        if decoder is not None:
+            decoder.decode_batch(batch, count + 1)
+        count += len(batch)
+    return count
+
+def main(log_path, scale, batch_size):
+    """
+    Read, and then read and decode, the scaled up log with each method
+    and print the throughput.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    big_log = os.path.join(tmp_dir, 'log.json')
+    try:
+        make_log(log_path, scale, big_log)
+        size = os.path.getsize(big_log)
+        print('Reading ' + str(size) + ' bytes')
+
+        methods = [('get_file_contents', read_contents),
+                   ('iter_batches', read_batches)]
+        for decoder in [None, JsonDecoder()]:
+            stage = 'read' if decoder is None else 'read+decode (' + decoder.backend + ')'
+            for name, read in methods:
+                start = time.time()
+                read(big_log, decoder, batch_size)
+                seconds = time.time() - start
+                print('%-28s %-18s %8.3f s %8.1f MB/s' % (stage, name, seconds, size / seconds / 1e6))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    default_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'log.json')
+    ap = ArgumentParser('Benchmark reading a log file in batches.')
+    ap.add_argument('-l', '--logfile', action='store', type=str, default=default_log,
+                    help='The path to logfile.')
+    ap.add_argument('-s', '--scale', action='store', type=int, default=50,
+                    help='How many times to repeat the log file.')
+    ap.add_argument('-b', '--batch-size', action='store', type=int, default=10000,
+                    help='Number of lines per batch.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    main(args.logfile, args.scale, args.batch_size)
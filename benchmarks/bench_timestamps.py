@@ -0,0 +1,91 @@
+"""
+This is a script to compare the speed of checking and normalizing the ts
+of each row the way LogFileAnalyzer used to, parse_timestamp() for every
+row and again for every later stage, against the compiled datetime check
+with a TimestampNormalizer, which only parses a ts it has not just seen
+and turns it into the epoch column once.
+
+The ts of data/log.json are all the same second, a synthetic log has a
+mix of epoch ints and date strings, see --str-ts-ratio.
+
+Run it from the top directory with:  python -m benchmarks.bench_timestamps
+"""
+
+import os
+import json
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from log_reader.LogFileAnalyzer import LogFileAnalyzer
+from log_reader.Validator import SchemaValidator, parse_timestamp
+from benchmarks.generate_log import generate_log, parse_count
+
+
+def old_epoch(value, dt_min, dt_max):
+    """
+    Check a ts as the validator used to and then turn it into the epoch,
+    as the windows and the index did, parsing it twice.
+    """
+    rvalue = parse_timestamp(value)
+    if rvalue is None or (dt_min is not None and rvalue < dt_min) or (dt_max is not None and rvalue > dt_max):
+        return None
+    return int(parse_timestamp(value).timestamp())
+
+def time_values(name, values, spec):
+    """
+    Time both methods on a list of ts values and print the time per value.
+    """
+    dt_min = None if spec.get('min') is None else datetime.fromtimestamp(spec['min'])
+    dt_max = None if spec.get('max') is None else datetime.fromtimestamp(spec['max'])
+    start = time.perf_counter()
+    old = [old_epoch(value, dt_min, dt_max) for value in values]
+    old_time = time.perf_counter() - start
+
+    validator = SchemaValidator({'ts': spec})
+    check = validator.checks[0][1]
+    normalize = validator.normalizer.normalize
+    start = time.perf_counter()
+    new = [normalize(value) if check(value) is None else None for value in values]
+    new_time = time.perf_counter() - start
+
+    assert old == new, "The normalizer gave different epochs."
+    print('%-10s %8d values  old %7.3f us  new %7.3f us  speed-up %5.1fx' %
+          (name, len(values), old_time / len(values) * 1e6, new_time / len(values) * 1e6, old_time / new_time))
+
+def main(log_path, num_lines, str_ts_ratio, scale):
+    """
+    Time both methods on the sample log and on a synthetic one.
+    """
+    spec = LogFileAnalyzer().valid_keys['ts']
+    with open(log_path, 'r') as fp:
+        values = [json.loads(line)['ts'] for line in fp] * scale
+    time_values('repeated', values, spec)
+
+    out_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ts_bench.json')
+    generate_log(out_path, num_lines, invalid_ratio=0.0, str_ts_ratio=str_ts_ratio)
+    try:
+        with open(out_path, 'r') as fp:
+            values = [json.loads(line)['ts'] for line in fp]
+    finally:
+        os.remove(out_path)
+    time_values('synthetic', values, spec)
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    default_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'log.json')
+    ap = ArgumentParser('Benchmark checking and normalizing the ts of each row.')
+    ap.add_argument('-l', '--logfile', action='store', type=str, default=default_log,
+                    help='The path to logfile.')
+    ap.add_argument('-n', '--lines', action='store', type=parse_count, default=200000,
+                    help='Number of lines in the synthetic log.')
+    ap.add_argument('--str-ts-ratio', action='store', type=float, default=0.5,
+                    help='Share of rows of the synthetic log with ts as a date string.')
+    ap.add_argument('-s', '--scale', action='store', type=int, default=10,
+                    help='How many times to repeat the log file.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    main(args.logfile, args.lines, args.str_ts_ratio, args.scale)
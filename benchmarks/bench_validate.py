@@ -0,0 +1,108 @@
+"""
+This is a script to compare the speed of validating rows with the
+compiled SchemaValidator against interpreting the valid_keys dictionary
+for every row, which is how LogFileAnalyzer._validate_row() used to work.
+
+Run it from the top directory with:  python -m benchmarks.bench_validate
+"""
+
+import os
+import json
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from log_reader.LogFileAnalyzer import LogFileAnalyzer
+from log_reader.utilities import StrPattern
+
+
+def interpret_row(valid_keys, row):
+    """
+    Validate a row by walking valid_keys, a copy of the original
+    LogFileAnalyzer._validate_row() kept for comparison.
+    """
+    if len( set(row.keys()) - set(valid_keys.keys())) > 0:
+        return False, "extra keys found."
+    if len(set(row.keys()) and set(valid_keys.keys())) != len(valid_keys.keys()):
+        return False, "not all keys found."
+
+    for vkey, vvalue in valid_keys.items():
+        if vvalue['type'] == StrPattern:
+            test = StrPattern(pattern=vvalue['pattern'], string=row[vkey])
+            if not test.is_match():
+                return False, str(vkey) + ' value "' + str(row[vkey]) + '" does not match expected pattern.'
+        elif vvalue['type'] in [int, float]:
+            if  vvalue['type'] == int: rvalue = int(row[vkey])
+            if  vvalue['type'] == float: rvalue = float(row[vkey])
+
+            if "values" in vvalue.keys() and rvalue not in vvalue['values']:
+                return False, str(vkey) + ' value is "' + str(rvalue) + '" exepcted to be one of ' + str(vvalue['values'])
+            if "min" in vvalue.keys() and rvalue<vvalue['min']:
+                return False, str(vkey) + ' value "' + str(rvalue) + '" must be greater than ' + str(vvalue['min'])
+            if "max" in vvalue.keys() and rvalue>vvalue['max']:
+                return False, str(vkey) + ' value "' + str(rvalue) + '" must be smaller than ' + str(vvalue['max'])
+        elif vvalue['type'] in [str]:
+            rvalue = row[vkey]
+            if "values" in vvalue.keys() and rvalue not in vvalue['values']:
+                return False, str(vkey) + ' value is "' + str(rvalue) + '" exepcted to be one of ' + str(vvalue['values'])
+            if "min_len" in vvalue.keys() and len(rvalue)<vvalue['min_len']:
+                return False, str(vkey) + ' value "' + str(rvalue) + '" must be longer than ' + str(vvalue['min_len']) + ' characters.'
+            if "max_len" in vvalue.keys() and len(rvalue)>vvalue['max_len']:
+                return False, str(vkey) + ' value "' + str(rvalue) + '" must be shorter than ' + str(vvalue['max_len']) + ' characters.'
+        elif vvalue['type'] is datetime:
+            try:
+                seconds = int(row[vkey])
+                rvalue = datetime.fromtimestamp(seconds)
+            except:
+                try:
+                    rvalue =  datetime.strptime(row[vkey], "%Y-%m-%d %H:%M:%S")
+                except:
+                    return False, str(vkey) + ' value "' + str(row[vkey]) + '" is not in the expected format.'
+
+            if "min" in vvalue.keys() and rvalue < datetime.fromtimestamp(int(vvalue['min'])):
+                return False, str(vkey) + ' value "' + str(rvalue) + '" must be after ' + str(vvalue['min'])
+            if "max" in vvalue.keys() and rvalue > datetime.fromtimestamp(int(vvalue['max'])):
+                return False, str(vkey) + ' value "' + str(rvalue) + '" must be before ' + str(vvalue['max'])
+        else:
+            return False, "Unrecognized value type: " + str(vvalue['type'])
+
+    return True, ''
+
+def main(log_path, scale):
+    """
+    Validate the rows of the log with both methods and print the time
+    per row.
+    """
+    with open(log_path, 'r') as fp:
+        rows = [json.loads(line) for line in fp] * scale
+    analyzer = LogFileAnalyzer()
+    valid_keys = analyzer.valid_keys
+
+    start = time.time()
+    interpreted = [interpret_row(valid_keys, row) for row in rows]
+    interpret_time = time.time() - start
+
+    start = time.time()
+    compiled = [analyzer._validate_row(row) for row in rows]
+    compiled_time = time.time() - start
+
+    assert interpreted == compiled, "The compiled validator gave different results."
+    print('Validated ' + str(len(rows)) + ' rows')
+    print('interpreted %8.3f us/row' % (interpret_time / len(rows) * 1e6))
+    print('compiled    %8.3f us/row' % (compiled_time / len(rows) * 1e6))
+    print('speed-up    %8.1fx' % (interpret_time / compiled_time))
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    default_log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'log.json')
+    ap = ArgumentParser('Benchmark validating the rows of a log file.')
+    ap.add_argument('-l', '--logfile', action='store', type=str, default=default_log,
+                    help='The path to logfile.')
+    ap.add_argument('-s', '--scale', action='store', type=int, default=10,
+                    help='How many times to repeat the log file.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    main(args.logfile, args.scale)
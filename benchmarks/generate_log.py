@@ -0,0 +1,152 @@
+"""
+This is a script to write synthetic log files for the benchmarks, of any
+number of lines, that pass the default valid_keys of LogFileAnalyzer apart
+from the lines that are made invalid on purpose.
+
+The mix of the rows can be set: how many are invalid, how many have the
+ts as a "YYYY-MM-DD HH:mm:ss" string rather than seconds since the epoch,
+how many have the same name and path so the path is set to ".", and how
+many different file extensions there are.  The same seed always gives the
+same file.
+
+Run it from the top directory with, e.g. for 10 million lines:
+    python -m benchmarks.generate_log -o /tmp/log_10m.json -n 10M
+"""
+
+import random
+import string
+from datetime import datetime
+from argparse import ArgumentParser
+
+# Share of file names without an extension, about the same as data/log.json
+_NO_EXT_RATIO = 0.2
+# Start of the timestamps written, the ts of every row in data/log.json,
+# and how many seconds they are spread over.
+_FIRST_TS = 1551140352
+_TS_SPAN = 24 * 3600
+_NUM_USERS = 500
+_NUM_BUSINESSES = 26
+_NUM_SESSIONS = 1000
+_INVALID_KINDS = ['json', 'uuid', 'sha', 'dp']
+
+
+def parse_count(value):
+    """
+    Parse a number of lines, with an optional k or M suffix.
+
+    :param value: (str) - e.g. "1000", "500k", "10M".
+    :return: (int)
+    """
+    scale = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}.get(value[-1:], 1)
+    if scale != 1:
+        value = value[:-1]
+    return int(float(value) * scale)
+
+def generate_log(out_path, num_lines, invalid_ratio=0.0015, str_ts_ratio=0.5, collision_ratio=0.2,
+                 num_exts=40, seed=0):
+    """
+    Write a synthetic log file.
+
+    :param out_path:        (str) - The file to write.
+    :param num_lines:       (int) - Number of lines to write.
+    :param invalid_ratio:   (float) - Share of lines that are not valid, either
+                            not JSON or with a bad ID, sha or disposition.
+    :param str_ts_ratio:    (float) - Share of rows with ts as a date string.
+    :param collision_ratio: (float) - Share of rows where the path is the
+                            same as the name.
+    :param num_exts:        (int) - Number of different file extensions.
+    :param seed:            (int) - Seed for the random numbers.
+    :return: (dict) - Number of lines written of each kind: "valid",
+             "invalid", "str_ts" and "collisions".
+    """
+    assert isinstance(num_lines, int) and num_lines >= 0, "Invalid number of lines given: " + str(num_lines)
+    assert isinstance(num_exts, int) and num_exts > 0, "Invalid number of extensions given: " + str(num_exts)
+    rng = random.Random(seed)
+
+    def uuid():
+        text = '%032x' % rng.getrandbits(128)
+        return text[:8] + '-' + text[8:12] + '-' + text[12:16] + '-' + text[16:20] + '-' + text[20:]
+
+    def word(low, high):
+        return ''.join(rng.choice(string.ascii_lowercase) for i in range(rng.randint(low, high)))
+
+    exts = set()
+    while len(exts) < num_exts:
+        exts.add(word(2, 4))
+    exts = sorted(exts)
+    users = [uuid() for i in range(_NUM_USERS)]
+    businesses = [uuid() for i in range(_NUM_BUSINESSES)]
+    sessions = [uuid() for i in range(_NUM_SESSIONS)]
+    dirs = [word(3, 10) for i in range(200)]
+
+    counts = {'valid': 0, 'invalid': 0, 'str_ts': 0, 'collisions': 0}
+    with open(out_path, 'w') as out:
+        lines = []
+        for i in range(num_lines):
+            ts = _FIRST_TS + rng.randrange(_TS_SPAN)
+            if rng.random() < str_ts_ratio:
+                ts = '"' + datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S') + '"'
+                counts['str_ts'] += 1
+            nm = word(3, 10)
+            if rng.random() >= _NO_EXT_RATIO:
+                nm += '.' + rng.choice(exts)
+            if rng.random() < collision_ratio:
+                ph = nm
+                counts['collisions'] += 1
+            else:
+                ph = '/' + '/'.join(rng.choice(dirs) for j in range(rng.randint(1, 5))) + '/' + nm
+            row = {'si': rng.choice(sessions), 'sha': '%064x' % rng.getrandbits(256), 'dp': rng.randint(1, 3)}
+
+            kind = None
+            if rng.random() < invalid_ratio:
+                kind = rng.choice(_INVALID_KINDS)
+                counts['invalid'] += 1
+            else:
+                counts['valid'] += 1
+            if kind == 'uuid':
+                row['si'] = row['si'][:9] + 'q' + row['si'][10:]
+            elif kind == 'sha':
+                row['sha'] = row['sha'][:20] + 'p' + row['sha'][21:]
+            elif kind == 'dp':
+                row['dp'] = 4
+
+            line = '{"ts":%s,"pt":%d,"si":"%s","uu":"%s","bg":"%s","sha":"%s","nm":"%s","ph":"%s","dp":%d}' % \
+                   (ts, rng.randrange(100), row['si'], rng.choice(users), rng.choice(businesses),
+                    row['sha'], nm, ph, row['dp'])
+            if kind == 'json':
+                line = line[:len(line) // 2]
+            lines.append(line)
+
+            if len(lines) == 10000:
+                out.write('\n'.join(lines) + '\n')
+                lines = []
+        if len(lines) > 0:
+            out.write('\n'.join(lines) + '\n')
+    return counts
+
+def parse_args():
+    """
+    Parse the command-line arguments.
+    """
+    ap = ArgumentParser('Write a synthetic log file.')
+    ap.add_argument('-o', '--output', action='store', type=str, required=True,
+                    help='The path of the log file to write.')
+    ap.add_argument('-n', '--lines', action='store', type=parse_count, default=1000000,
+                    help='Number of lines, e.g. 1M, 10M or 100M.')
+    ap.add_argument('--invalid-ratio', action='store', type=float, default=0.0015,
+                    help='Share of lines that are not valid.')
+    ap.add_argument('--str-ts-ratio', action='store', type=float, default=0.5,
+                    help='Share of rows with ts as a "YYYY-MM-DD HH:mm:ss" string.')
+    ap.add_argument('--collision-ratio', action='store', type=float, default=0.2,
+                    help='Share of rows with the same name and path.')
+    ap.add_argument('--exts', action='store', type=int, default=40,
+                    help='Number of different file extensions.')
+    ap.add_argument('--seed', action='store', type=int, default=0,
+                    help='Seed for the random numbers.')
+    return ap.parse_args()
+
+if __name__  == '__main__':
+    args = parse_args()
+    counts = generate_log(args.output, args.lines, args.invalid_ratio, args.str_ts_ratio,
+                          args.collision_ratio, args.exts, args.seed)
+    print(args.output + ': ' + ', '.join(key + ' ' + str(counts[key]) for key in sorted(counts)))
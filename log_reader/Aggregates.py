@@ -0,0 +1,1144 @@
+"""
+Module: Aggregates
+
+Description:
+
+This module contains aggregates that are built up from the valid rows
+of a log file a batch at a time, so the results can be found without
+keeping all of the rows.  Aggregates of different parts of a file, or
+of different runs, can be merged and saved as JSON.
+
+Each aggregate has the same methods: add_rows() and add_frame() to add
+valid rows, merge() to add another aggregate of the same kind, reset(),
+result() for the answer as a pandas Series, and to_dict() and from_dict()
+to save it.  Several are filled in the same pass over the rows by
+LogFileAnalyzer, see REPORTS for the ones it knows by name.
+
+The approximate aggregates use the sketches of the Sketches module, so
+their memory does not grow with the number of different values, for
+counts over weeks of logs.
+"""
+
+from collections import Counter, OrderedDict
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from log_reader.Compact import unpack_hex
+from log_reader.Sketches import HyperLogLog, CountMinSketch, hash_values
+from log_reader.Validator import parse_epochs
+
+# Number of candidates a HeavyHitterAggregate keeps for each value of its result
+_CANDIDATES_PER_VALUE = 10
+
+
+class CountAggregate(object):
+    """
+    Count the number of rows with each value of a key.
+
+    Attributes:
+      - key:    The key, or data frame column, whose values are counted.
+      - counts: dict of value to the number of rows that had it.
+      - labels: dict of value to the label it is shown with in result(),
+                e.g. the names of the dispositions.  None, the default,
+                shows the values.
+    """
+
+    @property
+    def key(self):
+        return self.__key
+
+    @property
+    def counts(self):
+        return dict(self.__counts)
+
+    @property
+    def labels(self):
+        return self.__labels
+
+
+    def __init__(self, key, counts=None, labels=None):
+        assert isinstance(key, str), "Invalid key given: " + str(key)
+        assert labels is None or isinstance(labels, dict), "Invalid labels given: " + str(labels)
+        self.__key = key
+        self.__labels = labels
+        self.__counts = Counter()
+        if counts is not None:
+            self.__counts.update(counts)
+
+    def reset(self):
+        """
+        Forget the rows counted so far.
+        """
+        self.__counts = Counter()
+
+    def add_rows(self, rows):
+        """
+        Count a batch of rows.
+
+        :param rows: (list of dict) - The rows to count.
+        """
+        key = self.__key
+        self.__counts.update(row[key] for row in rows)
+
+    def add_frame(self, frame):
+        """
+        Count the rows of a data frame.
+
+        :param frame: (DataFrame) - The rows to count.
+        """
+        if len(frame) == 0: return
+        for value, count in _value_counts(_column(frame, self.__key)):
+            self.__counts[value] += count
+
+    def merge(self, other):
+        """
+        Add the counts of another aggregate of the same key to this one.
+
+        :param other: (CountAggregate) - The aggregate to merge in.
+        """
+        assert isinstance(other, CountAggregate) and other.key == self.key, "Can only merge counts of the same key."
+        self.__counts.update(other.counts)
+
+    def result(self):
+        """
+        The counts in the same form as a groupby([key]).size() of the rows.
+
+        :return: (pandas.Series) - Number of rows for each value, sorted by value.
+        """
+        values = sorted(self.__counts.keys())
+        labels = values
+        if self.__labels is not None:
+            labels = [self.__labels.get(value, value) for value in values]
+        index = pd.Index(labels, name=self.__key)
+        return pd.Series([self.__counts[value] for value in values], index=index, dtype='int64')
+
+    def to_dict(self):
+        """
+        The aggregate as a dict that can be saved as JSON.
+
+        JSON object keys are always strings, so the counts are kept as a
+        list of [value, count] pairs to keep the type of the values.
+
+        :return: (dict)
+        """
+        data = {'type': 'count', 'key': self.__key,
+                'counts': [[value, count] for value, count in self.__counts.items()]}
+        if self.__labels is not None:
+            data['labels'] = [[value, label] for value, label in self.__labels.items()]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make an aggregate from the output of to_dict().
+
+        :param data: (dict)
+        :return: (CountAggregate)
+        """
+        assert data.get('type') == 'count', "Not a count aggregate: " + str(data.get('type'))
+        labels = None
+        if 'labels' in data:
+            labels = dict((value, label) for value, label in data['labels'])
+        return cls(data['key'], dict((value, count) for value, count in data['counts']), labels)
+
+
+class TopAggregate(object):
+    """
+    The most common values of a key.
+
+    All of the values are counted, so memory grows with the number of
+    different values.
+
+    Attributes:
+      - key:    The key, or data frame column, whose values are counted.
+      - size:   How many of the most common values are in result(), default is 10.
+    """
+
+    @property
+    def key(self):
+        return self.__key
+
+    @property
+    def size(self):
+        return self.__size
+
+
+    def __init__(self, key, size=10, counts=None):
+        assert isinstance(key, str), "Invalid key given: " + str(key)
+        assert isinstance(size, int) and size > 0, "Invalid size given: " + str(size)
+        self.__key = key
+        self.__size = size
+        self.__counts = Counter()
+        if counts is not None:
+            self.__counts.update(counts)
+
+    def reset(self):
+        """
+        Forget the rows counted so far.
+        """
+        self.__counts = Counter()
+
+    def add_rows(self, rows):
+        """
+        Count a batch of rows.
+
+        :param rows: (list of dict) - The rows to count.
+        """
+        key = self.__key
+        self.__counts.update(row[key] for row in rows)
+
+    def add_frame(self, frame):
+        """
+        Count the rows of a data frame.
+
+        :param frame: (DataFrame) - The rows to count.
+        """
+        if len(frame) == 0: return
+        for value, count in _value_counts(_column(frame, self.__key)):
+            self.__counts[value] += count
+
+    def merge(self, other):
+        """
+        Add the counts of another aggregate of the same key to this one.
+
+        :param other: (TopAggregate) - The aggregate to merge in.
+        """
+        assert isinstance(other, TopAggregate) and other.key == self.key, "Can only merge top values of the same key."
+        self.__counts.update(other.__counts)
+
+    def result(self):
+        """
+        The most common values, ties in the order of the values.
+
+        :return: (pandas.Series) - Number of rows for each value, most common first.
+        """
+        top = sorted(self.__counts.items(), key=lambda item: (-item[1], item[0]))[:self.__size]
+        index = pd.Index([value for value, count in top], name=self.__key)
+        return pd.Series([count for value, count in top], index=index, dtype='int64')
+
+    def to_dict(self):
+        """
+        The aggregate as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        return {'type': 'top', 'key': self.__key, 'size': self.__size,
+                'counts': [[value, count] for value, count in self.__counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make an aggregate from the output of to_dict().
+
+        :param data: (dict)
+        :return: (TopAggregate)
+        """
+        assert data.get('type') == 'top', "Not a top aggregate: " + str(data.get('type'))
+        return cls(data['key'], data['size'], dict((value, count) for value, count in data['counts']))
+
+
+class DistinctAggregate(object):
+    """
+    The number of different values of a key for each value of another,
+    e.g. the number of users of each business.
+
+    Attributes:
+      - key:    The key whose different values are counted.
+      - by:     The key the rows are grouped by.
+    """
+
+    @property
+    def key(self):
+        return self.__key
+
+    @property
+    def by(self):
+        return self.__by
+
+
+    def __init__(self, key, by, groups=None):
+        assert isinstance(key, str), "Invalid key given: " + str(key)
+        assert isinstance(by, str), "Invalid by key given: " + str(by)
+        self.__key = key
+        self.__by = by
+        self.__groups = {}
+        for group, values in (groups or {}).items():
+            self.__groups[group] = set(values)
+
+    def reset(self):
+        """
+        Forget the rows seen so far.
+        """
+        self.__groups = {}
+
+    def add_rows(self, rows):
+        """
+        Add a batch of rows.
+
+        :param rows: (list of dict) - The rows to add.
+        """
+        key = self.__key
+        by = self.__by
+        groups = self.__groups
+        for row in rows:
+            values = groups.get(row[by])
+            if values is None:
+                values = groups[row[by]] = set()
+            values.add(row[key])
+
+    def add_frame(self, frame):
+        """
+        Add the rows of a data frame.
+
+        :param frame: (DataFrame) - The rows to add.
+        """
+        if len(frame) == 0: return
+        pairs = pd.DataFrame({'by': _column(frame, self.__by), 'key': _column(frame, self.__key)})
+        for group, values in pairs.drop_duplicates().groupby('by', sort=False, observed=True)['key']:
+            self.__groups.setdefault(group, set()).update(values)
+
+    def merge(self, other):
+        """
+        Add the values of another aggregate of the same keys to this one.
+
+        :param other: (DistinctAggregate) - The aggregate to merge in.
+        """
+        assert isinstance(other, DistinctAggregate) and (other.key, other.by) == (self.key, self.by), \
+            "Can only merge distinct values of the same keys."
+        for group, values in other.__groups.items():
+            self.__groups.setdefault(group, set()).update(values)
+
+    def result(self):
+        """
+        The number of different values, the same as a
+        groupby([by])[key].nunique() of the rows.
+
+        :return: (pandas.Series) - Number of different values of key for each
+                 value of by, sorted by the value of by.
+        """
+        groups = sorted(self.__groups.keys())
+        index = pd.Index(groups, name=self.__by)
+        return pd.Series([len(self.__groups[group]) for group in groups], index=index, name=self.__key,
+                         dtype='int64')
+
+    def to_dict(self):
+        """
+        The aggregate as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        return {'type': 'distinct', 'key': self.__key, 'by': self.__by,
+                'groups': [[group, sorted(values)] for group, values in self.__groups.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make an aggregate from the output of to_dict().
+
+        :param data: (dict)
+        :return: (DistinctAggregate)
+        """
+        assert data.get('type') == 'distinct', "Not a distinct aggregate: " + str(data.get('type'))
+        return cls(data['key'], data['by'], dict((group, values) for group, values in data['groups']))
+
+
+class PercentileAggregate(object):
+    """
+    Percentiles of a numeric key.
+
+    The number of rows with each value is kept, so the percentiles are
+    exact and memory grows with the number of different values, which
+    has no bound when reading a long stream.
+
+    Attributes:
+      - key:         The numeric key.
+      - percentiles: The percentiles in result(), default is 50, 90, 95 and 99.
+    """
+
+    @property
+    def key(self):
+        return self.__key
+
+    @property
+    def percentiles(self):
+        return list(self.__percentiles)
+
+
+    def __init__(self, key, percentiles=(50, 90, 95, 99), counts=None):
+        assert isinstance(key, str), "Invalid key given: " + str(key)
+        assert all(0 <= percentile <= 100 for percentile in percentiles), "Invalid percentiles given: " + str(percentiles)
+        self.__key = key
+        self.__percentiles = list(percentiles)
+        self.__counts = Counter()
+        if counts is not None:
+            self.__counts.update(counts)
+
+    def reset(self):
+        """
+        Forget the rows seen so far.
+        """
+        self.__counts = Counter()
+
+    def add_rows(self, rows):
+        """
+        Add a batch of rows.
+
+        :param rows: (list of dict) - The rows to add.
+        """
+        key = self.__key
+        self.__counts.update(row[key] for row in rows)
+
+    def add_frame(self, frame):
+        """
+        Add the rows of a data frame.
+
+        :param frame: (DataFrame) - The rows to add.
+        """
+        if len(frame) == 0: return
+        for value, count in _value_counts(frame[self.__key]):
+            self.__counts[value] += count
+
+    def merge(self, other):
+        """
+        Add the values of another aggregate of the same key to this one.
+
+        :param other: (PercentileAggregate) - The aggregate to merge in.
+        """
+        assert isinstance(other, PercentileAggregate) and other.key == self.key, \
+            "Can only merge percentiles of the same key."
+        self.__counts.update(other.__counts)
+
+    def result(self):
+        """
+        The percentiles, worked out the same way as Series.quantile(),
+        with linear interpolation between values.
+
+        :return: (pandas.Series) - The value at each percentile, NaN when
+                 there are no rows.
+        """
+        index = pd.Index([float(percentile) for percentile in self.__percentiles], name='percentile')
+        if len(self.__counts) == 0:
+            return pd.Series([np.nan] * len(index), index=index, name=self.__key, dtype='float64')
+        values = np.array(sorted(self.__counts.keys()), dtype='float64')
+        ends = np.cumsum([self.__counts[value] for value in sorted(self.__counts.keys())])
+        total = ends[-1]
+
+        result = []
+        for percentile in self.__percentiles:
+            position = percentile / 100.0 * (total - 1)
+            lower = int(np.floor(position))
+            upper = min(lower + 1, total - 1)
+            # The value of the row at each position in sorted order
+            low_value = values[np.searchsorted(ends, lower, side='right')]
+            high_value = values[np.searchsorted(ends, upper, side='right')]
+            result.append(low_value + (high_value - low_value) * (position - lower))
+        return pd.Series(result, index=index, name=self.__key, dtype='float64')
+
+    def to_dict(self):
+        """
+        The aggregate as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        return {'type': 'percentile', 'key': self.__key, 'percentiles': self.__percentiles,
+                'counts': [[value, count] for value, count in self.__counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make an aggregate from the output of to_dict().
+
+        :param data: (dict)
+        :return: (PercentileAggregate)
+        """
+        assert data.get('type') == 'percentile', "Not a percentile aggregate: " + str(data.get('type'))
+        return cls(data['key'], data['percentiles'], dict((value, count) for value, count in data['counts']))
+
+
+class ApproxDistinctAggregate(object):
+    """
+    The approximate number of different values of a key for each value of
+    another, with a HyperLogLog sketch for each group.
+
+    Attributes:
+      - key:    The key whose different values are counted.
+      - by:     The key the rows are grouped by.
+      - error:  The relative standard error of the counts, default is 0.01.
+    """
+
+    @property
+    def key(self):
+        return self.__key
+
+    @property
+    def by(self):
+        return self.__by
+
+    @property
+    def error(self):
+        return self.__error
+
+
+    def __init__(self, key, by, error=0.01, groups=None):
+        assert isinstance(key, str), "Invalid key given: " + str(key)
+        assert isinstance(by, str), "Invalid by key given: " + str(by)
+        self.__key = key
+        self.__by = by
+        self.__error = error
+        self.__precision = HyperLogLog(error).precision
+        self.__groups = dict(groups or {})
+
+    def reset(self):
+        """
+        Forget the rows seen so far.
+        """
+        self.__groups = {}
+
+    def _add(self, groups, values):
+        """
+        Add the values of each group, by their hashes.
+        """
+        hashes = hash_values(values)
+        codes, uniques = pd.factorize(np.asarray(groups, dtype=object))
+        for code, group in enumerate(uniques):
+            sketch = self.__groups.get(group)
+            if sketch is None:
+                sketch = self.__groups[group] = HyperLogLog(precision=self.__precision)
+            sketch.add(hashes[codes == code])
+
+    def add_rows(self, rows):
+        """
+        Add a batch of rows.
+
+        :param rows: (list of dict) - The rows to add.
+        """
+        if len(rows) == 0: return
+        self._add([row[self.__by] for row in rows], [row[self.__key] for row in rows])
+
+    def add_frame(self, frame):
+        """
+        Add the rows of a data frame.
+
+        :param frame: (DataFrame) - The rows to add.
+        """
+        if len(frame) == 0: return
+        self._add(_column(frame, self.__by), _column(frame, self.__key))
+
+    def merge(self, other):
+        """
+        Add the sketches of another aggregate of the same keys and error.
+
+        :param other: (ApproxDistinctAggregate) - The aggregate to merge in.
+        """
+        assert isinstance(other, ApproxDistinctAggregate) and \
+            (other.key, other.by, other.error) == (self.key, self.by, self.error), \
+            "Can only merge approximate distinct values of the same keys and error."
+        for group, sketch in other.__groups.items():
+            if group in self.__groups:
+                self.__groups[group].merge(sketch)
+            else:
+                self.__groups[group] = HyperLogLog.from_dict(sketch.to_dict())
+
+    def result(self):
+        """
+        The approximate number of different values, in the same form as
+        the result() of DistinctAggregate.
+
+        :return: (pandas.Series) - Number of different values of key for each
+                 value of by, sorted by the value of by.
+        """
+        groups = sorted(self.__groups.keys())
+        index = pd.Index(groups, name=self.__by)
+        return pd.Series([self.__groups[group].count() for group in groups], index=index, name=self.__key,
+                         dtype='int64')
+
+    def to_dict(self):
+        """
+        The aggregate as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        return {'type': 'approx_distinct', 'key': self.__key, 'by': self.__by, 'error': self.__error,
+                'groups': [[group, sketch.to_dict()] for group, sketch in self.__groups.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make an aggregate from the output of to_dict().
+
+        :param data: (dict)
+        :return: (ApproxDistinctAggregate)
+        """
+        assert data.get('type') == 'approx_distinct', "Not an approximate distinct aggregate: " + str(data.get('type'))
+        groups = dict((group, HyperLogLog.from_dict(sketch)) for group, sketch in data['groups'])
+        return cls(data['key'], data['by'], data['error'], groups)
+
+
+class HeavyHitterAggregate(object):
+    """
+    The approximate most common values of a key, with a count-min sketch
+    of every value and the current top values kept as candidates.  The
+    counts are never less than the true ones, and are more by at most
+    error times the number of rows, with probability confidence.
+
+    More candidates than size are kept, so that a value that is common
+    overall but not among the top of each file or worker is still found
+    when their aggregates are merged.
+
+    Attributes:
+      - key:        The key, or data frame column, whose values are counted.
+      - size:       How many of the most common values are in result(), default is 10.
+      - error:      The error of the counts as a share of the rows, default 0.001.
+      - confidence: The probability that a count is within the error, default 0.99.
+      - where:      dict of key to value that a row must have to be counted,
+                    e.g. {"dp": 1} for malicious files only.  None counts all rows.
+    """
+
+    @property
+    def key(self):
+        return self.__key
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def error(self):
+        return self.__error
+
+    @property
+    def confidence(self):
+        return self.__confidence
+
+    @property
+    def where(self):
+        return self.__where
+
+
+    def __init__(self, key, size=10, error=0.001, confidence=0.99, where=None, sketch=None, candidates=None):
+        assert isinstance(key, str), "Invalid key given: " + str(key)
+        assert isinstance(size, int) and size > 0, "Invalid size given: " + str(size)
+        assert where is None or isinstance(where, dict), "Invalid where given: " + str(where)
+        self.__key = key
+        self.__size = size
+        self.__error = error
+        self.__confidence = confidence
+        self.__where = where
+        self.__sketch = sketch if sketch is not None else CountMinSketch(error, confidence)
+        self.__candidates = dict(candidates or {})
+
+    def reset(self):
+        """
+        Forget the rows counted so far.
+        """
+        self.__sketch = CountMinSketch(self.__error, self.__confidence)
+        self.__candidates = {}
+
+    def _add(self, value_counts):
+        """
+        Add the number of times each value was seen, and keep the values
+        that are now among the most common as candidates.
+        """
+        if len(value_counts) == 0: return
+        values = [value for value, count in value_counts]
+        hashes = hash_values(values)
+        self.__sketch.add(hashes, [count for value, count in value_counts])
+        estimates = self.__sketch.estimate(hashes)
+
+        least = 0
+        if len(self.__candidates) >= self.__size * _CANDIDATES_PER_VALUE:
+            least = min(self.__candidates.values())
+        for index in np.flatnonzero(estimates >= least):
+            self.__candidates[values[index]] = int(estimates[index])
+        self._trim()
+
+    def _trim(self):
+        """
+        Keep only the most common candidates.
+        """
+        if len(self.__candidates) > self.__size * _CANDIDATES_PER_VALUE:
+            top = sorted(self.__candidates.items(), key=lambda item: (-item[1], item[0]))
+            top = top[:self.__size * _CANDIDATES_PER_VALUE]
+            self.__candidates = dict(top)
+
+    def add_rows(self, rows):
+        """
+        Count a batch of rows.
+
+        :param rows: (list of dict) - The rows to count.
+        """
+        key = self.__key
+        if self.__where is not None:
+            rows = [row for row in rows if all(row.get(name) == value for name, value in self.__where.items())]
+        self._add(list(Counter(row[key] for row in rows).items()))
+
+    def add_frame(self, frame):
+        """
+        Count the rows of a data frame.
+
+        :param frame: (DataFrame) - The rows to count.
+        """
+        if len(frame) == 0: return
+        if self.__where is not None:
+            keep = np.ones(len(frame), dtype=bool)
+            for name, value in self.__where.items():
+                keep &= np.asarray(frame[name] == value)
+            frame = frame[keep]
+        self._add(_value_counts(_column(frame, self.__key)))
+
+    def merge(self, other):
+        """
+        Add the sketch of another aggregate of the same settings to this one.
+
+        :param other: (HeavyHitterAggregate) - The aggregate to merge in.
+        """
+        assert isinstance(other, HeavyHitterAggregate) and \
+            (other.key, other.size, other.where) == (self.key, self.size, self.where), \
+            "Can only merge heavy hitters of the same key, size and where."
+        self.__sketch.merge(other.__sketch)
+        values = list(set(self.__candidates) | set(other.__candidates))
+        estimates = self.__sketch.estimate(hash_values(values))
+        self.__candidates = dict((value, int(estimate)) for value, estimate in zip(values, estimates))
+        self._trim()
+
+    def result(self):
+        """
+        The approximate most common values, in the same form as the
+        result() of TopAggregate.
+
+        :return: (pandas.Series) - The estimated number of rows for each value,
+                 most common first.
+        """
+        top = sorted(self.__candidates.items(), key=lambda item: (-item[1], item[0]))[:self.__size]
+        index = pd.Index([value for value, count in top], name=self.__key)
+        return pd.Series([count for value, count in top], index=index, dtype='int64')
+
+    def to_dict(self):
+        """
+        The aggregate as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        data = {'type': 'heavy_hitter', 'key': self.__key, 'size': self.__size, 'error': self.__error,
+                'confidence': self.__confidence, 'sketch': self.__sketch.to_dict(),
+                'candidates': [[value, count] for value, count in self.__candidates.items()]}
+        if self.__where is not None:
+            data['where'] = [[name, value] for name, value in self.__where.items()]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make an aggregate from the output of to_dict().
+
+        :param data: (dict)
+        :return: (HeavyHitterAggregate)
+        """
+        assert data.get('type') == 'heavy_hitter', "Not a heavy hitter aggregate: " + str(data.get('type'))
+        where = None
+        if 'where' in data:
+            where = dict((name, value) for name, value in data['where'])
+        return cls(data['key'], data['size'], data['error'], data['confidence'], where,
+                   CountMinSketch.from_dict(data['sketch']),
+                   dict((value, count) for value, count in data['candidates']))
+
+
+class WindowAggregate(object):
+    """
+    Counts by ext and by dp, and statistics of pt, for each time window of
+    the ts of the rows, as a time series.
+
+    Windows are size seconds long and start every slide seconds, so with
+    slide the same as size they are tumbling windows that do not overlap,
+    and with a smaller slide they are sliding windows.  The rows are kept
+    as counts for each slide long pane, a window is made from its panes.
+
+    When emit is set the windows are given to it as soon as they are
+    complete, that is when the watermark, the latest ts seen less lateness,
+    has passed their end, and then they and their panes are dropped, so
+    only the panes of the open windows are kept however long the log is.
+    A row that comes after its windows were emitted is late, it is counted
+    in late_rows and left out of them.  Without emit nothing is dropped,
+    so that aggregates of parts of a log can be merged.
+
+    Each window is a dict of "start" and "end", in seconds since the epoch,
+    "rows", "ext" and "dp", dicts of value to number of rows, and "pt_min",
+    "pt_mean" and "pt_max".
+
+    Attributes:
+      - size:      Length of a window in seconds, default is 60.
+      - slide:     Seconds between the starts of windows, size must be a
+                   multiple of it.  Default is size.
+      - lateness:  Seconds the watermark is kept behind the latest ts, for
+                   logs that are not quite in time order.  Default is 0.
+      - emit:      Function called with each window when it is complete,
+                   None, the default, keeps all windows until result().
+      - windows:   The complete windows kept, in time order, always empty
+                   with emit.
+      - late_rows: Number of rows left out for being too late.
+    """
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def slide(self):
+        return self.__slide
+
+    @property
+    def lateness(self):
+        return self.__lateness
+
+    @property
+    def emit(self):
+        return self.__emit
+    @emit.setter
+    def emit(self, value):
+        assert value is None or callable(value), "Invalid emit given: " + str(value)
+        self.__emit = value
+
+    @property
+    def windows(self):
+        return list(self.__windows)
+
+    @property
+    def late_rows(self):
+        return self.__late_rows
+
+
+    def __init__(self, size=60, slide=None, lateness=0, emit=None):
+        if slide is None:
+            slide = size
+        assert isinstance(size, int) and size > 0, "Invalid window size given: " + str(size)
+        assert isinstance(slide, int) and slide > 0 and size % slide == 0, "Invalid slide given: " + str(slide)
+        assert isinstance(lateness, int) and lateness >= 0, "Invalid lateness given: " + str(lateness)
+        self.__size = size
+        self.__slide = slide
+        self.__lateness = lateness
+        self.emit = emit
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the rows seen so far.
+        """
+        self.__panes = {}
+        self.__windows = []
+        self.__next_start = None
+        self.__latest = None
+        self.__late_rows = 0
+
+    def _add(self, epochs, exts, dps, pts):
+        """
+        Add the rows of a batch, as columns, to their panes and emit the
+        windows that are complete.
+        """
+        epochs = np.asarray(epochs, dtype='int64')
+        if len(epochs) == 0: return
+        panes = epochs // self.__slide
+        if self.__next_start is not None:
+            late = panes < self.__next_start // self.__slide
+            if late.any():
+                self.__late_rows += int(late.sum())
+                keep = np.flatnonzero(~late)
+                panes, epochs = panes[keep], epochs[keep]
+                exts, dps, pts = [np.asarray(values, dtype=object)[keep] for values in (exts, dps, pts)]
+                if len(epochs) == 0: return
+
+        codes, uniques = pd.factorize(panes, sort=True)
+        pts = np.asarray(pts, dtype='float64')
+        counts = np.bincount(codes)
+        sums = np.bincount(codes, weights=pts)
+        lows = np.full(len(uniques), np.inf)
+        highs = np.full(len(uniques), -np.inf)
+        np.minimum.at(lows, codes, pts)
+        np.maximum.at(highs, codes, pts)
+        ext_counts = Counter(zip(codes.tolist(), exts))
+        dp_counts = Counter(zip(codes.tolist(), dps))
+
+        states = []
+        for code, pane in enumerate(uniques.tolist()):
+            state = self.__panes.get(pane)
+            if state is None:
+                state = self.__panes[pane] = {'rows': 0, 'ext': Counter(), 'dp': Counter(), 'pt_sum': 0.0,
+                                              'pt_min': lows[code], 'pt_max': highs[code]}
+            state['rows'] += int(counts[code])
+            state['pt_sum'] += float(sums[code])
+            state['pt_min'] = min(state['pt_min'], float(lows[code]))
+            state['pt_max'] = max(state['pt_max'], float(highs[code]))
+            states.append(state)
+        for (code, ext), count in ext_counts.items():
+            states[code]['ext'][ext] += count
+        for (code, dp), count in dp_counts.items():
+            states[code]['dp'][dp] += count
+
+        latest = int(epochs.max())
+        if self.__latest is None or latest > self.__latest:
+            self.__latest = latest
+        if self.__emit is not None:
+            self._emit_until(self.__latest - self.__lateness)
+
+    def _window(self, start):
+        """
+        :return: (dict) - The window that starts at start, None if it has no rows.
+        """
+        first = start // self.__slide
+        panes = [self.__panes[pane] for pane in range(first, first + self.__size // self.__slide)
+                 if pane in self.__panes]
+        if len(panes) == 0:
+            return None
+        window = {'start': start, 'end': start + self.__size, 'rows': 0, 'ext': Counter(), 'dp': Counter(),
+                  'pt_min': min(pane['pt_min'] for pane in panes), 'pt_max': max(pane['pt_max'] for pane in panes)}
+        pt_sum = 0.0
+        for pane in panes:
+            window['rows'] += pane['rows']
+            window['ext'].update(pane['ext'])
+            window['dp'].update(pane['dp'])
+            pt_sum += pane['pt_sum']
+        window['ext'] = dict(window['ext'])
+        window['dp'] = dict(window['dp'])
+        window['pt_mean'] = pt_sum / window['rows']
+        return window
+
+    def _emit_until(self, watermark):
+        """
+        Emit the windows that end by the watermark, in time order, or keep
+        them without emit, and drop the panes that no window still to come
+        needs.
+        """
+        if len(self.__panes) == 0:
+            return
+        if self.__next_start is None:
+            # The first window with the first pane in it
+            self.__next_start = (min(self.__panes) + 1) * self.__slide - self.__size
+        while self.__next_start + self.__size <= watermark:
+            if len(self.__panes) == 0:
+                break
+            first_pane = min(self.__panes)
+            if first_pane * self.__slide >= self.__next_start + self.__size:
+                # Nothing until the first window with the next pane in it
+                self.__next_start = (first_pane + 1) * self.__slide - self.__size
+                continue
+            window = self._window(self.__next_start)
+            if window is not None and self.__emit is not None:
+                self.__emit(window)
+            elif window is not None:
+                self.__windows.append(window)
+            self.__next_start += self.__slide
+            for pane in [pane for pane in self.__panes if pane < self.__next_start // self.__slide]:
+                del self.__panes[pane]
+
+    def finish(self):
+        """
+        Emit all of the windows that are left, at the end of the log.
+        """
+        if self.__latest is not None:
+            self._emit_until(self.__latest + self.__size + self.__slide)
+
+    def add_rows(self, rows):
+        """
+        Add a batch of rows.
+
+        :param rows: (list of dict) - The rows to add.
+        """
+        if len(rows) == 0: return
+        if 'epoch' in rows[0]:
+            epochs = np.array([row['epoch'] for row in rows], dtype='int64')
+        else:
+            epochs = parse_epochs(pd.Series([row['ts'] for row in rows], dtype=object))
+        self._add(epochs, [row['ext'] for row in rows], [row['dp'] for row in rows], [row['pt'] for row in rows])
+
+    def add_frame(self, frame):
+        """
+        Add the rows of a data frame.
+
+        :param frame: (DataFrame) - The rows to add.
+        """
+        if len(frame) == 0: return
+        epochs = frame['epoch'].values if 'epoch' in frame else parse_epochs(frame['ts'])
+        self._add(epochs, np.asarray(frame['ext'], dtype=object).tolist(),
+                  np.asarray(frame['dp'], dtype=object).tolist(), frame['pt'])
+
+    def merge(self, other):
+        """
+        Add the panes and windows of another aggregate of the same windows
+        to this one, such as one of a worker reading part of the log.  No
+        windows are emitted until finish(), as more parts may follow.
+
+        :param other: (WindowAggregate) - The aggregate to merge in.
+        """
+        assert isinstance(other, WindowAggregate) and (other.size, other.slide) == (self.size, self.slide), \
+            "Can only merge windows of the same size and slide."
+        for pane, other_state in other.__panes.items():
+            if self.__next_start is not None and pane < self.__next_start // self.__slide:
+                self.__late_rows += other_state['rows']
+                continue
+            state = self.__panes.get(pane)
+            if state is None:
+                state = self.__panes[pane] = {'rows': 0, 'ext': Counter(), 'dp': Counter(), 'pt_sum': 0.0,
+                                              'pt_min': other_state['pt_min'], 'pt_max': other_state['pt_max']}
+            state['rows'] += other_state['rows']
+            state['ext'].update(other_state['ext'])
+            state['dp'].update(other_state['dp'])
+            state['pt_sum'] += other_state['pt_sum']
+            state['pt_min'] = min(state['pt_min'], other_state['pt_min'])
+            state['pt_max'] = max(state['pt_max'], other_state['pt_max'])
+        self.__windows = sorted(self.__windows + other.__windows, key=lambda window: window['start'])
+        self.__late_rows += other.__late_rows
+        if other.__latest is not None and (self.__latest is None or other.__latest > self.__latest):
+            self.__latest = other.__latest
+
+    def result(self):
+        """
+        The windows kept and those still open, as a time series, with emit
+        the windows already given to it are not in it.
+
+        :return: (DataFrame) - A row for each window with rows, indexed by the
+                 local time of its start, with columns "rows", "pt_min",
+                 "pt_mean", "pt_max" and "dp=<value>" and "ext=<value>" for
+                 the counts.
+        """
+        windows = list(self.__windows)
+        if len(self.__panes) > 0:
+            start = self.__next_start
+            if start is None:
+                start = (min(self.__panes) + 1) * self.__slide - self.__size
+            last = max(self.__panes) * self.__slide
+            while start <= last:
+                window = self._window(start)
+                if window is not None:
+                    windows.append(window)
+                start += self.__slide
+
+        records = []
+        for window in windows:
+            record = OrderedDict([('rows', window['rows']), ('pt_min', window['pt_min']),
+                                  ('pt_mean', window['pt_mean']), ('pt_max', window['pt_max'])])
+            for key in ['dp', 'ext']:
+                for value in sorted(window[key]):
+                    record[key + '=' + str(value)] = window[key][value]
+            records.append(record)
+        index = pd.Index([datetime.fromtimestamp(window['start']) for window in windows], name='start')
+        frame = pd.DataFrame(records, index=index)
+        counts = [column for column in frame.columns if '=' in column]
+        frame[counts] = frame[counts].fillna(0).astype('int64')
+        return frame
+
+    def to_dict(self):
+        """
+        The aggregate as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        panes = []
+        for pane, state in self.__panes.items():
+            panes.append([pane, dict(state, ext=[[value, count] for value, count in state['ext'].items()],
+                                     dp=[[value, count] for value, count in state['dp'].items()])])
+        windows = []
+        for window in self.__windows:
+            windows.append(dict(window, ext=[[value, count] for value, count in window['ext'].items()],
+                                dp=[[value, count] for value, count in window['dp'].items()]))
+        return {'type': 'window', 'size': self.__size, 'slide': self.__slide, 'lateness': self.__lateness,
+                'panes': panes, 'windows': windows, 'next_start': self.__next_start, 'latest': self.__latest,
+                'late_rows': self.__late_rows}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make an aggregate from the output of to_dict(), emit is not saved
+        so has to be set again.
+
+        :param data: (dict)
+        :return: (WindowAggregate)
+        """
+        assert data.get('type') == 'window', "Not a window aggregate: " + str(data.get('type'))
+        aggregate = cls(data['size'], data['slide'], data['lateness'])
+        for pane, state in data['panes']:
+            aggregate.__panes[pane] = dict(state, ext=Counter(dict((value, count) for value, count in state['ext'])),
+                                           dp=Counter(dict((value, count) for value, count in state['dp'])))
+        for window in data['windows']:
+            aggregate.__windows.append(dict(window, ext=dict((value, count) for value, count in window['ext']),
+                                            dp=dict((value, count) for value, count in window['dp'])))
+        aggregate.__next_start = data['next_start']
+        aggregate.__latest = data['latest']
+        aggregate.__late_rows = data['late_rows']
+        return aggregate
+
+
+# The aggregates that can be asked for by name, each made from valid_keys and
+# a dict of options: "distinct_error" the relative standard error of the
+# approximate distinct counts, "count_error" and "confidence" those of the
+# approximate most common values, "window", "slide" and "lateness" the
+# seconds of the time windows.
+REPORTS = OrderedDict([
+    ('ext', lambda valid_keys, options: CountAggregate('ext')),
+    ('dispositions', lambda valid_keys, options:
+        CountAggregate('dp', labels=(valid_keys or {}).get('dp', {}).get('values'))),
+    ('top_sha', lambda valid_keys, options: TopAggregate('sha', 10)),
+    ('users_per_business', lambda valid_keys, options: DistinctAggregate('uu', 'bg')),
+    ('sessions_per_business', lambda valid_keys, options: DistinctAggregate('si', 'bg')),
+    ('pt_percentiles', lambda valid_keys, options: PercentileAggregate('pt')),
+    ('approx_users_per_business', lambda valid_keys, options:
+        ApproxDistinctAggregate('uu', 'bg', options.get('distinct_error', 0.01))),
+    ('approx_sessions_per_business', lambda valid_keys, options:
+        ApproxDistinctAggregate('si', 'bg', options.get('distinct_error', 0.01))),
+    ('approx_files_per_business', lambda valid_keys, options:
+        ApproxDistinctAggregate('sha', 'bg', options.get('distinct_error', 0.01))),
+    ('heavy_sha', lambda valid_keys, options:
+        HeavyHitterAggregate('sha', 10, options.get('count_error', 0.001), options.get('confidence', 0.99))),
+    ('heavy_malicious_sha', lambda valid_keys, options:
+        HeavyHitterAggregate('sha', 10, options.get('count_error', 0.001), options.get('confidence', 0.99),
+                             where={'dp': 1})),
+    ('windows', lambda valid_keys, options:
+        WindowAggregate(options.get('window', 60), options.get('slide'), options.get('lateness', 0))),
+])
+
+_TYPES = {'count': CountAggregate, 'top': TopAggregate, 'distinct': DistinctAggregate,
+          'percentile': PercentileAggregate, 'approx_distinct': ApproxDistinctAggregate,
+          'heavy_hitter': HeavyHitterAggregate, 'window': WindowAggregate}
+
+
+def make_report(name, valid_keys=None, options=None):
+    """
+    Make the aggregate for one of the REPORTS.
+
+    :param name:       (str) - The name of the report.
+    :param valid_keys: (dict) - The valid_keys of the analyzer, for labels.
+    :param options:    (dict) - The error bounds of the approximate reports,
+                       see REPORTS, the defaults are used for any not given.
+    :return: The aggregate.
+    """
+    assert name in REPORTS, "Unknown report: " + str(name)
+    return REPORTS[name](valid_keys, options or {})
+
+def aggregate_from_dict(data):
+    """
+    Make an aggregate of any kind from the output of its to_dict().
+
+    :param data: (dict)
+    :return: The aggregate.
+    """
+    assert data.get('type') in _TYPES, "Unknown aggregate type: " + str(data.get('type'))
+    return _TYPES[data['type']].from_dict(data)
+
+def _value_counts(values):
+    """
+    :return: (list of (value, int)) - The number of times each value is in a
+             column, only the values that are there, as python values.
+    """
+    counts = []
+    for value, count in values.value_counts(sort=False).items():
+        if count > 0:
+            counts.append((value.item() if hasattr(value, 'item') else value, int(count)))
+    return counts
+
+def _column(frame, key):
+    """
+    :return: (Series) - A column of a frame, binary columns of the compact
+             layout are turned back into the strings they were packed from.
+    """
+    values = frame[key]
+    if values.dtype.kind == 'S':
+        return pd.Series(unpack_hex(values, key), index=values.index)
+    return values
@@ -0,0 +1,338 @@
+"""
+Module: Cache
+
+Description:
+
+This module keeps validated data frames on disk so that a log file that
+has not changed does not have to be read and validated again.  Frames are
+saved a column at a time in a numpy .npz file, with the strings of a column
+packed together as a JSON list, so they come back with the same dtypes,
+bytes columns and columns of mixed values included.  Nothing in the file
+can run code when it is loaded, so a cache directory that others can
+write to is safe to read.  The cache directory is kept under a size limit
+by removing the least recently used frames.
+
+With content_hash the frames are keyed by the digest of the log rather
+than where it is and when it was changed, so a log that is copied, moved
+or touched is still found.  The digest worked out while a log is read is
+remembered, with the size and modification time of the log, so the log
+is only read for its digest again once it has changed.
+"""
+
+import os
+import json
+import hashlib
+import zipfile
+import numpy as np
+import pandas as pd
+from log_reader.FileIO import MyFileIO
+# Version of the cached frames, 2 added the epoch column and 3 keeps
+# every frame in a .npz file
+_FRAME_VERSION = 3
+# The digests of the logs read, by their path, kept in the cache directory
+_DIGESTS_FILE = 'digests.json'
+
+
+class FrameCache(object):
+    """
+    A directory of cached data frames, each one keyed by the fingerprint
+    of the log file it was read from and the valid_keys used.
+
+    Attributes:
+      - cache_dir:    The directory the frames are kept in.
+      - max_bytes:    The most space the cache may use, default is 1 GiB.
+      - content_hash: Whether the digest of the whole log file is the key,
+                      rather than its path, size and modification time.  The
+                      digest is remembered from the last read of the log, so
+                      only a log changed since then is read for it, see
+                      known_digest().
+      - enabled:      Whether frames are loaded and stored at all.
+    """
+
+    @property
+    def cache_dir(self):
+        return self.__cache_dir
+    @cache_dir.setter
+    def cache_dir(self, value):
+        assert isinstance(value, str), "Invalid cache directory given: " + str(value)
+        self.__cache_dir = value
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+    @max_bytes.setter
+    def max_bytes(self, value):
+        assert isinstance(value, int) and value > 0, "Invalid cache size given: " + str(value)
+        self.__max_bytes = value
+
+    @property
+    def content_hash(self):
+        return self.__content_hash
+    @content_hash.setter
+    def content_hash(self, value):
+        assert isinstance(value, bool), "Invalid content_hash value given: " + str(value)
+        self.__content_hash = value
+
+    @property
+    def enabled(self):
+        return self.__enabled
+    @enabled.setter
+    def enabled(self, value):
+        assert isinstance(value, bool), "Invalid enabled value given: " + str(value)
+        self.__enabled = value
+
+
+    def __init__(self, cache_dir, max_bytes=1024**3, content_hash=False, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        self.enabled = enabled
+
+    def get_key(self, log_path, valid_keys_digest, layout='object', digest=None, checksum='sha256'):
+        """
+        The key of the cached frame for a log file.
+
+        :param log_path:          (str) - Path to the log file.
+        :param valid_keys_digest: (str) - Digest of the valid_keys used.
+        :param layout:            (str) - The column layout of the frame,
+                                  "object" or "compact".
+        :param digest:            (str) - The digest of the log, when it is
+                                  known, the frame is then keyed by it.  With
+                                  content_hash and no digest the log is read
+                                  for it, unless it is remembered.
+        :param checksum:          (str) - The checksum of the digest, see
+                                  FileIO.new_checksum().
+        :return: (str) - The key, a hex digest.
+        """
+        if digest is None and self.content_hash:
+            digest = self.known_digest(log_path, checksum)
+            if digest is None:
+                digest = MyFileIO(log_path).get_content_digest(checksum)
+        if digest is not None:
+            fingerprint = [checksum, digest, valid_keys_digest, layout, _FRAME_VERSION]
+        else:
+            stat = os.stat(log_path)
+            fingerprint = [os.path.abspath(log_path), stat.st_size, stat.st_mtime, valid_keys_digest, layout,
+                           _FRAME_VERSION]
+        return hashlib.sha256(json.dumps(fingerprint).encode('utf-8')).hexdigest()
+
+    def known_digest(self, log_path, checksum='sha256'):
+        """
+        The digest of a log remembered from when it was last read, if it
+        has not changed since.
+
+        :param log_path: (str) - Path to the log file.
+        :param checksum: (str) - The checksum of the digest.
+        :return: (str) - The hex digest, None if it is not known.
+        """
+        entry = self._load_digests().get(os.path.abspath(log_path))
+        if entry is None or entry['checksum'] != checksum or entry['stat'] != _stat_of(log_path):
+            return None
+        return entry['digest']
+
+    def remember_digest(self, log_path, file_stat, digest, checksum='sha256'):
+        """
+        Keep the digest of a log worked out while it was read, if it did
+        not change while it was being read.
+
+        :param log_path:  (str) - Path to the log file.
+        :param file_stat: (list) - From _stat_of() before the log was read.
+        :param digest:    (str) - The hex digest.
+        :param checksum:  (str) - The checksum of the digest.
+        """
+        if not self.enabled or digest is None or _stat_of(log_path) != file_stat:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        digests = self._load_digests()
+        # The logs that are gone are forgotten
+        digests = dict((path, entry) for path, entry in digests.items() if os.path.exists(path))
+        digests[os.path.abspath(log_path)] = {'stat': file_stat, 'checksum': checksum, 'digest': digest}
+        digests_path = os.path.join(self.cache_dir, _DIGESTS_FILE)
+        with open(digests_path + '.tmp', 'w') as fp:
+            json.dump(digests, fp)
+        os.replace(digests_path + '.tmp', digests_path)
+
+    def _load_digests(self):
+        """
+        :return: (dict) - The digests remembered, by the absolute path of the log.
+        """
+        digests_path = os.path.join(self.cache_dir, _DIGESTS_FILE)
+        if not os.path.exists(digests_path):
+            return {}
+        try:
+            with open(digests_path, 'r') as fp:
+                return json.load(fp)
+        except (IOError, ValueError):
+            return {}
+
+    def load(self, key):
+        """
+        Load a cached frame.
+
+        :param key: (str) - The key from get_key().
+        :return: (DataFrame, dict) - The frame and the information stored
+                 with it, (None, None) if it is not in the cache.
+        """
+        if not self.enabled:
+            return None, None
+        frame_path, info_path = self._paths(key)
+        if not (os.path.exists(frame_path) and os.path.exists(info_path)):
+            return None, None
+
+        try:
+            frame = _read_npz(frame_path)
+        except (ValueError, KeyError, zipfile.BadZipFile):
+            # Not a frame saved by store(), such as a pickle
+            return None, None
+        with open(info_path, 'r') as fp:
+            info = json.load(fp)
+
+        # Used frames are the last to be evicted
+        os.utime(frame_path, None)
+        return frame, info
+
+    def store(self, key, frame, info=None):
+        """
+        Store a frame in the cache and then evict the least recently used
+        frames until the cache is within max_bytes.
+
+        :param key:   (str) - The key from get_key().
+        :param frame: (DataFrame) - The frame to keep.
+        :param info:  (dict) - Other information to keep with the frame,
+                      must be JSON serializable.
+        """
+        if not self.enabled:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        frame_path, info_path = self._paths(key)
+
+        # Written under other names first so a reader never sees half a file
+        _write_npz(frame, frame_path + '.tmp')
+        with open(info_path + '.tmp', 'w') as fp:
+            json.dump(info or {}, fp)
+        os.replace(frame_path + '.tmp', frame_path)
+        os.replace(info_path + '.tmp', info_path)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used frames until the cache uses no more
+        than max_bytes.
+
+        :return: (int) - The number of frames removed.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.frame'): continue
+            frame_path = os.path.join(self.cache_dir, name)
+            info_path = frame_path[:-len('.frame')] + '.json'
+            size = os.path.getsize(frame_path)
+            if os.path.exists(info_path):
+                size += os.path.getsize(info_path)
+            entries.append((os.path.getmtime(frame_path), size, frame_path, info_path))
+            total += size
+
+        removed = 0
+        for mtime, size, frame_path, info_path in sorted(entries):
+            if total <= self.max_bytes: break
+            os.remove(frame_path)
+            if os.path.exists(info_path):
+                os.remove(info_path)
+            total -= size
+            removed += 1
+        return removed
+
+    def _paths(self, key):
+        """
+        :return: (str, str) - Paths to the frame and information files for a key.
+        """
+        base = os.path.join(self.cache_dir, key)
+        return base + '.frame', base + '.json'
+
+
+def _stat_of(log_path):
+    """
+    :return: (list) - What tells that a file has changed, its device, inode,
+             size and modification time in nanoseconds.
+    """
+    stat = os.stat(log_path)
+    return [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def _write_npz(frame, path):
+    """
+    Save a frame as a .npz file, a numpy array or two for each column.
+
+    Numeric, datetime and bytes columns are saved as they are, categorical
+    ones as their codes and categories, and columns of python objects, such
+    as strings or ts with both epochs and date strings, as the UTF-8 bytes
+    of a JSON list of the values, which is loaded much faster than the
+    values one at a time.  The number of rows and how each column was saved
+    are kept in the "layout" array as JSON.
+
+    :param frame: (DataFrame) - The frame, with the default index.
+    :param path:  (str) - The file to write.
+    """
+    arrays = {}
+    columns = []
+    for i, name in enumerate(frame.columns):
+        column = frame[name]
+        prefix = 'c' + str(i)
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            arrays[prefix + '_codes'] = column.cat.codes.values
+            columns.append({'name': name, 'kind': 'category', 'ordered': bool(column.cat.ordered),
+                            'categories': _pack(pd.Series(column.cat.categories), prefix, arrays)})
+        else:
+            columns.append(dict(_pack(column, prefix, arrays), name=name))
+    arrays['layout'] = np.array(json.dumps({'rows': len(frame), 'columns': columns}))
+    with open(path, 'wb') as fp:
+        np.savez(fp, **arrays)
+
+def _pack(values, prefix, arrays):
+    """
+    Add the array for a column of values to those of a .npz file.
+
+    :return: (dict) - How the values were saved.
+    """
+    array = values.to_numpy()
+    if array.dtype.kind in 'biufcmMS':
+        arrays[prefix] = array
+        return {'kind': 'array'}
+    text = json.dumps(array.tolist(), ensure_ascii=False)
+    arrays[prefix] = np.frombuffer(text.encode('utf-8'), dtype='uint8')
+    return {'kind': 'json', 'dtype': str(values.dtype)}
+
+def _read_npz(path):
+    """
+    Load a frame saved by _write_npz(), no pickled objects are loaded.
+
+    :param path: (str) - The file to read.
+    :return: (DataFrame)
+    """
+    with np.load(path, allow_pickle=False) as data:
+        layout = json.loads(str(data['layout']))
+        # Columns are set one at a time so that bytes columns keep their dtype
+        frame = pd.DataFrame(index=pd.RangeIndex(layout['rows']))
+        for i, column in enumerate(layout['columns']):
+            prefix = 'c' + str(i)
+            if column['kind'] == 'category':
+                dtype = pd.CategoricalDtype(_unpack(column['categories'], prefix, data), column['ordered'])
+                frame[column['name']] = pd.Categorical.from_codes(data[prefix + '_codes'], dtype=dtype)
+            else:
+                frame[column['name']] = _unpack(column, prefix, data)
+    return frame
+
+def _unpack(column, prefix, data):
+    """
+    :return: (numpy.ndarray or Series) - The values of a column saved by _pack().
+    """
+    if column['kind'] == 'array':
+        return data[prefix]
+    values = json.loads(data[prefix].tobytes().decode('utf-8'))
+    return pd.Series(values, dtype=object).astype(column['dtype'])
@@ -0,0 +1,166 @@
+"""
+Module: Compact
+
+Description:
+
+This module packs a data frame of valid log rows into narrow typed
+columns.  A frame built from a list of dicts keeps every value as a
+python object, the three UUIDs and the sha256 alone take several hundred
+bytes a row.  In the compact layout:
+
+   ts:           datetime64, the local time as parse_timestamp() gives it
+   pt:           the narrowest numeric dtype that holds the values
+   si:           16 byte binary, the 128 bits of the UUID
+   uu, bg:       categorical, there are few users and businesses
+   sha:          32 byte binary, the 256 bits of the hash
+   dp, ext:      categorical
+   nm, ph:       left as they are
+
+Binary columns are numpy fixed width bytes ("S16", "S32"), a value is only
+packed if it can be unpacked to exactly the same string, i.e. lower case hex.
+When a column can not be packed it is left as it is.
+"""
+
+import binascii
+import numpy as np
+import pandas as pd
+from log_reader.Validator import parse_timestamp
+
+# Column name to the number of bytes of its binary form, and the positions
+# of the dashes that are put back when it is unpacked.
+_BINARY_COLUMNS = {'si': (16, [8, 12, 16, 20]),
+                   'sha': (32, [])}
+_CATEGORY_COLUMNS = ['uu', 'bg', 'dp', 'ext']
+
+
+def compact_frame(frame):
+    """
+    Pack the columns of a data frame of valid rows into the compact layout.
+
+    :param frame: (DataFrame) - The valid rows, one column per key.
+    :return: (DataFrame) - A new frame with the compact columns.
+    """
+    compact = pd.DataFrame(index=frame.index)
+    for column in frame.columns:
+        values = frame[column]
+        if column == 'ts':
+            values = _pack_timestamps(values)
+        elif column == 'pt':
+            values = _pack_numbers(values)
+        elif column in _BINARY_COLUMNS:
+            values = _pack_hex(values, *_BINARY_COLUMNS[column])
+        elif column in _CATEGORY_COLUMNS:
+            values = values.astype('category')
+        compact[column] = values
+    return compact
+
+def unpack_hex(values, column):
+    """
+    Turn a binary column back into the strings it was packed from.
+
+    :param values: (Series) - The values of the column.
+    :param column: (str) - The column name, 'si' or 'sha'.
+    :return: (list of str)
+    """
+    num_bytes, dashes = _BINARY_COLUMNS[column]
+    unpacked = []
+    for value in values:
+        # numpy drops trailing zero bytes from fixed width values
+        text = binascii.hexlify(bytes(value).ljust(num_bytes, b'\0')).decode('ascii')
+        for position in reversed(dashes):
+            text = text[:position] + '-' + text[position:]
+        unpacked.append(text)
+    return unpacked
+
+def align_frames(frames):
+    """
+    Make the compact columns of each frame the same type so that
+    concatenating them keeps the compact layout.  Categorical columns are
+    given the same categories, and a binary column that could not be
+    packed in every frame is unpacked again in all of them.
+
+    :param frames: (list of DataFrame) - Frames with the same columns.
+    :return: (list of DataFrame) - The aligned frames.
+    """
+    if len(frames) < 2:
+        return frames
+    frames = [frame.copy(deep=False) for frame in frames]
+    for column in frames[0].columns:
+        if not all(column in frame for frame in frames):
+            continue
+        if all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+            categories = frames[0][column].cat.categories
+            for frame in frames[1:]:
+                categories = categories.union(frame[column].cat.categories)
+            for frame in frames:
+                frame[column] = frame[column].cat.set_categories(categories)
+        elif column in _BINARY_COLUMNS:
+            packed = [frame[column].dtype.kind == 'S' for frame in frames]
+            if any(packed) and not all(packed):
+                for frame, is_packed in zip(frames, packed):
+                    if is_packed:
+                        frame[column] = unpack_hex(frame[column], column)
+    return frames
+
+def memory_per_row(frame):
+    """
+    The memory used by a data frame for each of its rows, including the
+    python objects held in object columns.
+
+    :param frame: (DataFrame)
+    :return: (float) - Bytes per row, 0.0 for an empty frame.
+    """
+    if len(frame) == 0:
+        return 0.0
+    return float(frame.memory_usage(deep=True).sum()) / len(frame)
+
+def _pack_timestamps(values):
+    """
+    :return: (numpy.ndarray or Series) - The timestamps as datetime64, or
+             values if one of them is not a timestamp.
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = [parse_timestamp(value) for value in uniques]
+    if len(parsed) == 0 or any(value is None for value in parsed) or (codes < 0).any():
+        return values
+    return np.asarray(pd.to_datetime(parsed))[codes]
+
+def _pack_numbers(values):
+    """
+    :return: (Series) - The values in the narrowest numeric dtype, or values
+             if they are not all numbers.
+    """
+    if values.dtype.kind in 'iu':
+        return pd.to_numeric(values, downcast='unsigned' if (values >= 0).all() else 'integer')
+    if values.dtype.kind == 'f':
+        return pd.to_numeric(values, downcast='float')
+    return values
+
+def _pack_hex(values, num_bytes, dashes):
+    """
+    :return: (numpy.ndarray or Series) - The values as fixed width bytes, or
+             values if one of them is not lower case hex of the right length
+             with dashes in the right places.
+    """
+    if values.dtype.kind == 'S':
+        return values
+    try:
+        text = ''.join(np.asarray(values, dtype=object))
+        text.encode('ascii')
+    except (TypeError, UnicodeEncodeError):
+        return values
+    length = 2 * num_bytes + len(dashes)
+    if len(text) != length * len(values) or text != text.lower():
+        return values
+    if dashes:
+        digits = np.frombuffer(text.encode('ascii'), dtype='S1').reshape(-1, length)
+        if len(values) > 0 and not (digits[:, dashes + np.arange(len(dashes))] == b'-').all():
+            return values
+        text = text.replace('-', '')
+    try:
+        packed = binascii.unhexlify(text)
+    except (binascii.Error, ValueError):
+        return values
+    if len(packed) != num_bytes * len(values):
+        return values
+    return np.frombuffer(packed, dtype='S' + str(num_bytes))
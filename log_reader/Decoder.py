@@ -0,0 +1,120 @@
+"""
+Module: Decoder
+
+Description:
+
+This module turns the raw lines of a JSON log file into python
+dictionaries.  The standard library json module is always available,
+faster drop-in decoders are used instead when they are installed.
+"""
+
+import json
+from collections import OrderedDict
+
+# Optional decoders in order of preference, the first one that can be
+# imported is used unless a backend is asked for by name.
+_BACKENDS = OrderedDict()
+try:
+    import orjson
+    _BACKENDS['orjson'] = orjson.loads
+except ImportError:
+    pass
+try:
+    import ujson
+    _BACKENDS['ujson'] = ujson.loads
+except ImportError:
+    pass
+try:
+    import simplejson
+    _BACKENDS['simplejson'] = simplejson.loads
+except ImportError:
+    pass
+_BACKENDS['json'] = json.loads
+
+
+def available_backends():
+    """
+    The names of the JSON decoders that can be used on this system.
+
+    :return: (list of str) - Backend names, fastest first.
+    """
+    return list(_BACKENDS.keys())
+
+
+class JsonDecoder(object):
+    """
+    Decode batches of lines where each line is a single JSON object.
+
+    Lines that are not valid JSON objects do not raise, they are returned
+    as failures along with their line number so the caller can report them.
+
+    Attributes:
+      - backend:      Name of the JSON library used, default is the fastest
+                      one installed.
+      - decoded:      Running count of lines decoded.
+      - failed:       Running count of lines that could not be decoded.
+      - blank:        Running count of blank lines skipped.
+    """
+
+    @property
+    def backend(self):
+        return self.__backend
+    @backend.setter
+    def backend(self, value):
+        if value is None: value = available_backends()[0]
+        assert value in _BACKENDS, "JSON backend is not available: " + str(value)
+        self.__backend = value
+        self.__loads = _BACKENDS[value]
+
+    @property
+    def decoded(self):
+        return self.__decoded
+
+    @property
+    def failed(self):
+        return self.__failed
+
+    @property
+    def blank(self):
+        return self.__blank
+
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.__decoded = 0
+        self.__failed = 0
+        self.__blank = 0
+
+    def decode_batch(self, lines, first_line=1):
+        """
+        Decode a batch of lines.
+
+        :param lines:      (list of str or bytes) - The raw lines.
+        :param first_line: (int) - Line number of the first line in the batch.
+        :return: (list, list) - The (line number, dict) pairs that were decoded
+                 and the (line number, error message) pairs that were not.
+        """
+        loads = self.__loads
+        rows = []
+        failures = []
+        blank = 0
+        line_no = first_line
+        for line in lines:
+            if len(line.strip()) == 0:
+                blank += 1
+            else:
+                try:
+                    row = loads(line)
+                except ValueError as err:
+                    failures.append((line_no, 'invalid JSON: ' + str(err)))
+                else:
+                    if isinstance(row, dict):
+                        rows.append((line_no, row))
+                    else:
+                        failures.append((line_no, 'line is not a JSON object.'))
+            line_no += 1
+
+        self.__decoded += len(rows)
+        self.__failed += len(failures)
+        self.__blank += blank
+        return rows, failures
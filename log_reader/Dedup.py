@@ -0,0 +1,392 @@
+"""
+Module: Dedup
+
+Description:
+
+This module finds the rows of a log that were already seen, such as the
+lines written again when an agent retries.  A row is a duplicate when the
+values of its keys, e.g. si, sha and ts, or the whole line, are the same
+as those of an earlier row.  Duplicates are counted, with the first few
+line numbers of them, rather than dropped without a trace.
+
+   ExactDeduplicator:  remembers every key seen, never wrong, but the memory
+                       used grows with the number of different rows.
+   BloomDeduplicator:  remembers the keys in two Bloom filters of a fixed
+                       size, see max_bytes.  A new row is taken for a
+                       duplicate with probability error, and once a filter
+                       is full the oldest one is dropped, so a duplicate is
+                       only found within the last capacity to twice
+                       capacity different rows.
+
+The rows seen can be written to a file, kept next to the checkpoint of an
+incremental read, so that the next read carries on from them.  The exact
+keys are written as JSON lines, and only the keys seen since the file was
+last written are added to it.  The filters are written as they are, and
+only when they changed.
+"""
+
+import json
+import math
+from itertools import islice
+import numpy as np
+from log_reader.Sketches import hash_values
+
+# The keys of an event, the same file seen in the same session at the same time
+DEFAULT_KEYS = ['si', 'sha', 'ts']
+# Separates the values of the keys when they are joined to be hashed
+_SEPARATOR = '\x1f'
+
+
+class Deduplicator(object):
+    """
+    The parts shared by the deduplicators, see ExactDeduplicator and
+    BloomDeduplicator for how the keys are remembered.
+
+    Attributes:
+      - keys:        The keys of a row that make it a duplicate, None for the
+                     whole line.  Default is si, sha and ts.
+      - max_samples: How many line numbers of duplicates are kept, default 10.
+      - duplicates:  Number of duplicates found since the last reset().
+      - samples:     Line numbers of the first duplicates, of the file each
+                     one was in.
+      - changed:     Whether rows were remembered since the rows seen were
+                     last written or loaded, see save_seen().
+      - appends:     Whether save_seen() can add the rows remembered since
+                     to a file, rather than write all of them again.
+    """
+
+    @property
+    def keys(self):
+        return self.__keys
+
+    @property
+    def max_samples(self):
+        return self.__max_samples
+
+    @property
+    def duplicates(self):
+        return self.__duplicates
+
+    @property
+    def samples(self):
+        return self.__samples
+
+    @property
+    def changed(self):
+        raise NotImplementedError
+
+    @property
+    def appends(self):
+        return False
+
+
+    def __init__(self, keys=DEFAULT_KEYS, max_samples=10):
+        assert keys is None or (isinstance(keys, list) and len(keys) > 0 and all(isinstance(key, str) for key in keys)), \
+            "Invalid keys given: " + str(keys)
+        assert isinstance(max_samples, int) and max_samples >= 0, "Invalid max_samples given: " + str(max_samples)
+        self.__keys = None if keys is None else list(keys)
+        self.__max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the rows seen and the duplicates found, for a new read.
+        """
+        self.__duplicates = 0
+        self.__samples = []
+
+    def check(self, rows, lines, line_nos):
+        """
+        Find the duplicates in a batch of rows, both of earlier rows and of
+        rows earlier in the batch, and remember the rest.
+
+        :param rows:     (list of dict) - The valid rows.
+        :param lines:    (list of str) - The line of each row, used when keys is None.
+        :param line_nos: (list of int) - The line number of each row.
+        :return: (numpy.ndarray of bool) - True for the rows that are duplicates.
+        """
+        if len(rows) == 0:
+            return np.zeros(0, dtype=bool)
+        if self.__keys is None:
+            values = [line.rstrip('\r\n') if isinstance(line, str) else line for line in lines]
+        elif len(self.__keys) == 1:
+            key = self.__keys[0]
+            values = [row.get(key) for row in rows]
+        else:
+            values = [tuple(row.get(key) for key in self.__keys) for row in rows]
+        duplicate = self._seen(values)
+        found = np.flatnonzero(duplicate)
+        self.__duplicates += len(found)
+        if len(self.__samples) < self.__max_samples:
+            self.__samples += [line_nos[index] for index in found[:self.__max_samples - len(self.__samples)]]
+        return duplicate
+
+    def _seen(self, values):
+        """
+        :param values: (list) - The key of each row, a value or a tuple of them.
+        :return: (numpy.ndarray of bool) - Whether each key was seen before,
+                 the keys are remembered.
+        """
+        raise NotImplementedError
+
+    def settings(self):
+        """
+        :return: (dict) - What the deduplicator was made with, rows are only
+                 duplicates of rows seen with the same settings.
+        """
+        return {'keys': self.__keys}
+
+    def to_dict(self):
+        """
+        The duplicates found as a dict that can be saved as JSON.
+
+        :return: (dict) - The number of duplicates and their sample line numbers.
+        """
+        return {'duplicates': self.__duplicates, 'samples': list(self.__samples)}
+
+    def restore(self, data):
+        """
+        Set the duplicates found to those of an earlier read, from the
+        output of to_dict(), such as when the results are loaded from a
+        cache.  The rows seen are not restored, see load_state().
+
+        :param data: (dict)
+        """
+        self.reset()
+        self.__duplicates = data.get('duplicates', 0)
+        self.__samples = list(data.get('samples', []))
+
+    def save_state(self):
+        """
+        What is needed to carry on later, other than the rows seen, the
+        settings and the duplicates found, as a dict that can be saved as
+        JSON, such as in the checkpoint of an incremental read.
+
+        :return: (dict)
+        """
+        return dict(self.to_dict(), settings=self.settings())
+
+    def load_state(self, data):
+        """
+        Carry on from the output of save_state(), the rows seen are
+        forgotten until they are loaded with load_seen().
+
+        :param data: (dict) - Saved with the same settings.
+        """
+        assert data['settings'] == self.settings(), "Can only load the state of a deduplicator with the same settings."
+        self.restore(data)
+
+    def save_seen(self, path, size=None):
+        """
+        Write the rows seen to a file.
+
+        :param path: (str) - The file to write.
+        :param size: (int) - When appends is True, the size of the file as it
+                     was last written or loaded, only the rows remembered
+                     since are added after that.  None writes all of them.
+        :return: (int) - The size of the file, for load_seen().
+        """
+        raise NotImplementedError
+
+    def load_seen(self, path, size):
+        """
+        Carry on from the rows seen written by save_seen(), after load_state().
+
+        :param path: (str) - The file written.
+        :param size: (int) - The size save_seen() returned, anything written
+                     after that is not loaded.
+        """
+        raise NotImplementedError
+
+    def summary(self):
+        """
+        :return: (str) - The duplicates found as text.
+        """
+        return str(self.__duplicates) + ' duplicate rows skipped' + \
+            ('' if len(self.__samples) == 0 else ' (lines ' + ', '.join(str(n) for n in self.__samples) + ')') + '.'
+
+
+class ExactDeduplicator(Deduplicator):
+    """
+    Find duplicates by keeping every key seen in a set, for logs whose
+    different rows fit in memory.
+    """
+
+    @property
+    def changed(self):
+        return len(self.__seen) > self.__saved
+
+    @property
+    def appends(self):
+        return True
+
+    def reset(self):
+        Deduplicator.reset(self)
+        # A dict keeps the keys in the order they were seen, so those not
+        # yet written are the last ones
+        self.__seen = {}
+        self.__saved = 0
+
+    def _seen(self, values):
+        seen = self.__seen
+        duplicate = np.zeros(len(values), dtype=bool)
+        for index, value in enumerate(values):
+            if value in seen:
+                duplicate[index] = True
+            else:
+                seen[value] = None
+        return duplicate
+
+    def settings(self):
+        return dict(Deduplicator.settings(self), type='exact')
+
+    def save_seen(self, path, size=None):
+        with open(path, 'wb' if size is None else 'r+b') as fp:
+            if size is not None:
+                fp.seek(size)
+                fp.truncate()
+            unsaved = islice(self.__seen, 0 if size is None else self.__saved, None)
+            lines = [json.dumps(list(value) if isinstance(value, tuple) else value) for value in unsaved]
+            if len(lines) > 0:
+                fp.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            size = fp.tell()
+        self.__saved = len(self.__seen)
+        return size
+
+    def load_seen(self, path, size):
+        with open(path, 'rb') as fp:
+            text = fp.read(size).decode('utf-8')
+        # The lines are turned into one JSON list, loaded far faster than each line
+        values = json.loads('[' + text.rstrip('\n').replace('\n', ',') + ']')
+        self.__seen = dict.fromkeys(tuple(value) if isinstance(value, list) else value for value in values)
+        self.__saved = len(self.__seen)
+
+
+class BloomDeduplicator(Deduplicator):
+    """
+    Find duplicates with Bloom filters of a fixed size, for logs too big to
+    keep every key of.  The keys are hashed by their text, so 1 and "1" are
+    the same.
+
+    Attributes:
+      - error:     The probability that a row that was not seen is taken for
+                   a duplicate, default is 0.001.
+      - max_bytes: The most memory used by the filters, default is 64 MB.
+      - capacity:  Number of different keys a filter holds before it is full,
+                   the most that fit in max_bytes with the error.
+      - num_hashes: Number of bits set for each key.
+    """
+
+    @property
+    def error(self):
+        return self.__error
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def num_hashes(self):
+        return self.__num_hashes
+
+    @property
+    def changed(self):
+        return self.__changed
+
+
+    def __init__(self, keys=DEFAULT_KEYS, error=0.001, max_bytes=64 * 1024**2, max_samples=10):
+        assert isinstance(error, float) and 0.0 < error < 1.0, "Invalid error given: " + str(error)
+        assert isinstance(max_bytes, int) and max_bytes >= 16, "Invalid max_bytes given: " + str(max_bytes)
+        self.__error = error
+        self.__max_bytes = max_bytes
+        # A row is looked for in both filters, so each one has half of the error
+        self.__num_bits = (max_bytes // 2) * 8
+        self.__num_hashes = max(1, int(round(-math.log(error / 2.0, 2))))
+        self.__capacity = max(1, int(self.__num_bits * math.log(2) ** 2 / -math.log(error / 2.0)))
+        Deduplicator.__init__(self, keys, max_samples)
+
+    def reset(self):
+        Deduplicator.reset(self)
+        self.__current = np.zeros(self.__num_bits // 8, dtype='uint8')
+        self.__previous = None
+        self.__added = 0
+        self.__changed = False
+
+    def _positions(self, hashes):
+        """
+        :return: (numpy.ndarray) - The bits of each hash, one row per hash
+                 function, from two halves of the hash combined differently.
+        """
+        low = (hashes & np.uint64(0xffffffff)).astype('int64')
+        high = (hashes >> np.uint64(32)).astype('int64')
+        rounds = np.arange(self.__num_hashes, dtype='int64').reshape(-1, 1)
+        return (low + rounds * high) % self.__num_bits
+
+    @staticmethod
+    def _contains(bits, positions):
+        """
+        :return: (numpy.ndarray of bool) - Whether all of the bits of each key are set.
+        """
+        found = (bits[positions >> 3] >> (positions & 7).astype('uint8')) & 1
+        return found.all(axis=0)
+
+    def _seen(self, values):
+        if len(self.keys or []) > 1:
+            values = [_SEPARATOR.join(str(part) for part in value) for value in values]
+        hashes = hash_values(values)
+        # Only the first of the same keys in the batch is looked up
+        unique, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        positions = self._positions(unique)
+        seen = self._contains(self.__current, positions)
+        if self.__previous is not None:
+            seen |= self._contains(self.__previous, positions)
+
+        new = positions[:, ~seen]
+        if self.__added + new.shape[1] > self.__capacity:
+            # The current filter is full, keep it to look in and start another
+            self.__previous = self.__current
+            self.__current = np.zeros(self.__num_bits // 8, dtype='uint8')
+            self.__added = 0
+            new = positions
+        flat = new.reshape(-1)
+        np.bitwise_or.at(self.__current, flat >> 3, np.left_shift(1, flat & 7).astype('uint8'))
+        self.__added += new.shape[1]
+        self.__changed = self.__changed or new.shape[1] > 0
+
+        duplicate = seen[inverse.reshape(-1)]
+        repeated = np.ones(len(hashes), dtype=bool)
+        repeated[first] = False
+        return duplicate | repeated
+
+    def settings(self):
+        return dict(Deduplicator.settings(self), type='bloom', error=self.__error, max_bytes=self.__max_bytes)
+
+    def save_state(self):
+        state = Deduplicator.save_state(self)
+        state['added'] = self.__added
+        return state
+
+    def load_state(self, data):
+        Deduplicator.load_state(self, data)
+        self.__added = data['added']
+
+    def save_seen(self, path, size=None):
+        # The filters change all over, so they are always written whole
+        with open(path, 'wb') as fp:
+            np.save(fp, self.__current)
+            if self.__previous is not None:
+                np.save(fp, self.__previous)
+            size = fp.tell()
+        self.__changed = False
+        return size
+
+    def load_seen(self, path, size):
+        with open(path, 'rb') as fp:
+            self.__current = np.load(fp, allow_pickle=False)
+            self.__previous = np.load(fp, allow_pickle=False) if fp.tell() < size else None
+        assert len(self.__current) == self.__num_bits // 8, "The filters saved are not of the size expected."
+        self.__changed = False
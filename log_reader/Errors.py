@@ -0,0 +1,267 @@
+"""
+Module: Errors
+
+Description:
+
+This module collects the lines of a log file that could not be decoded or
+failed validation.  Rather than a warning for every line it keeps the
+number of lines that failed for each field and reason, with the first
+few line numbers of each, prints only a limited number of warnings, and
+can write every rejected line to a side file for later inspection.
+"""
+
+import re
+import json
+from collections import OrderedDict
+
+# Validation messages are '<key> value "<value>" <reason>' or
+# '<key> value is "<value>" <reason>', see the Validator module.
+_VALUE_MESSAGE = re.compile(r'^(\S+) value (?:is )?"(.*)" (.*)$', re.DOTALL)
+
+
+def classify(stage, err):
+    """
+    Find the field and reason of a failure.
+
+    :param stage: (str) - "decode" for lines that were not JSON objects,
+                  "validate" for rows that failed validation.
+    :param err:   (str) - The error message.
+    :return: (str, str) - The field, None if the whole line failed, and the
+             reason without the value so that failures can be counted together.
+    """
+    if stage == 'decode':
+        return None, err.split(':', 1)[0].rstrip('.')
+    match = _VALUE_MESSAGE.match(err)
+    if match is None:
+        return None, err.rstrip('.')
+    return match.group(1), match.group(3).rstrip('.')
+
+
+class ErrorCollector(object):
+    """
+    Collect the lines that failed while reading a log file.
+
+    Warnings are given to add() as (line number, stage, error message, raw
+    line) tuples, where stage is "decode" or "validate".
+
+    Attributes:
+      - max_warnings: The most warnings printed to the console in a read,
+                      None, the default, prints all of them and 0 none.
+      - max_samples:  How many line numbers are kept for each reason,
+                      default is 10.
+      - reject_path:  File to write every rejected line to, as JSON lines
+                      with the line number, field, reason, message and the
+                      raw line.  None, the default, writes no file.
+      - spill_size:   Number of rejected lines held before they are written
+                      to reject_path in one go, default is 10000.
+      - counts:       OrderedDict of (field, reason) to the number of lines.
+      - samples:      OrderedDict of (field, reason) to the first line numbers,
+                      as "<file>:<line number>" for lines of more than one file.
+      - total:        Number of lines that failed.
+      - shown:        Number of warnings printed.
+      - notices:      Warnings about the read as a whole rather than a line,
+                      such as a log that was rotated.
+    """
+
+    @property
+    def max_warnings(self):
+        return self.__max_warnings
+    @max_warnings.setter
+    def max_warnings(self, value):
+        assert value is None or (isinstance(value, int) and value >= 0), \
+            "Invalid max_warnings given: " + str(value)
+        self.__max_warnings = value
+
+    @property
+    def max_samples(self):
+        return self.__max_samples
+    @max_samples.setter
+    def max_samples(self, value):
+        assert isinstance(value, int) and value >= 0, "Invalid max_samples given: " + str(value)
+        self.__max_samples = value
+
+    @property
+    def reject_path(self):
+        return self.__reject_path
+    @reject_path.setter
+    def reject_path(self, value):
+        assert value is None or isinstance(value, str), "Invalid reject_path given: " + str(value)
+        self.__reject_path = value
+
+    @property
+    def spill_size(self):
+        return self.__spill_size
+    @spill_size.setter
+    def spill_size(self, value):
+        assert isinstance(value, int) and value > 0, "Invalid spill_size given: " + str(value)
+        self.__spill_size = value
+
+    @property
+    def counts(self):
+        return self.__counts
+
+    @property
+    def samples(self):
+        return self.__samples
+
+    @property
+    def total(self):
+        return self.__total
+
+    @property
+    def shown(self):
+        return self.__shown
+
+    @property
+    def notices(self):
+        return self.__notices
+
+
+    def __init__(self, max_warnings=None, max_samples=10, reject_path=None, spill_size=10000):
+        self.max_warnings = max_warnings
+        self.max_samples = max_samples
+        self.reject_path = reject_path
+        self.spill_size = spill_size
+        self.__reject_file = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the failures collected so far.
+        """
+        self.close()
+        self.__counts = OrderedDict()
+        self.__samples = OrderedDict()
+        self.__total = 0
+        self.__shown = 0
+        self.__notices = []
+        self.__spill = []
+
+    def start(self):
+        """
+        Get ready for a new read, the failures are reset and the reject
+        file, if there is one, is started empty.
+        """
+        self.reset()
+        if self.__reject_path is not None:
+            self.__reject_file = open(self.__reject_path, 'w')
+
+    def add(self, warnings, source=None):
+        """
+        Collect a batch of failed lines.
+
+        :param warnings: (list of (int, str, str, str)) - Line number, stage,
+                         error message and raw line of each failure.
+        :param source:   (str) - The file the lines are from, only needed when
+                         lines of more than one file are collected.
+        """
+        where = 'line ' if source is None else str(source) + ' line '
+        for line_no, stage, err, raw in warnings:
+            key = classify(stage, err)
+            count = self.__counts.get(key, 0)
+            self.__counts[key] = count + 1
+            if count < self.__max_samples:
+                self.__samples.setdefault(key, []).append(line_no if source is None else
+                                                          str(source) + ':' + str(line_no))
+
+            self.__show(where + str(line_no) + _describe(stage, err))
+            self.__total += 1
+
+            if self.__reject_file is not None:
+                if isinstance(raw, bytes):
+                    raw = raw.decode('utf-8', 'replace')
+                reject = {'line': line_no, 'field': key[0], 'reason': key[1], 'message': err,
+                          'raw': raw.rstrip('\r\n')}
+                if source is not None:
+                    reject['file'] = source
+                self.__spill.append(json.dumps(reject))
+                if len(self.__spill) >= self.__spill_size:
+                    self.flush()
+
+    def notice(self, message):
+        """
+        Collect a warning about the read as a whole, it is printed as long
+        as max_warnings allows, and counts towards it.
+
+        :param message: (str) - The warning.
+        """
+        self.__show(message)
+        self.__notices.append(message)
+
+    def __show(self, text):
+        """
+        Print a warning, if max_warnings allows, before it is counted.
+        """
+        if self.__max_warnings is None or self.__shown < self.__max_warnings:
+            print('WARNING: ' + text)
+            self.__shown += 1
+        elif 0 < self.__max_warnings == self.__shown == self.__total + len(self.__notices):
+            print('WARNING: only the first ' + str(self.__max_warnings) + ' warnings are shown.')
+
+    def flush(self):
+        """
+        Write the rejected lines held so far to the reject file.
+        """
+        if self.__reject_file is not None and len(self.__spill) > 0:
+            self.__reject_file.write('\n'.join(self.__spill) + '\n')
+        self.__spill = []
+
+    def close(self):
+        """
+        Write any rejected lines still held and close the reject file, at
+        the end of a read.
+        """
+        if self.__reject_file is not None:
+            self.flush()
+            self.__reject_file.close()
+            self.__reject_file = None
+
+    def to_dict(self):
+        """
+        The failures as a dict that can be saved as JSON.
+
+        :return: (dict) - The total and a list with the field, reason, count
+                 and sample line numbers of each reason, most common first.
+        """
+        reasons = []
+        for key, count in sorted(self.__counts.items(), key=lambda item: -item[1]):
+            reasons.append({'field': key[0], 'reason': key[1], 'count': count,
+                            'samples': list(self.__samples.get(key, []))})
+        return {'total': self.__total, 'shown': self.__shown, 'reasons': reasons}
+
+    def restore(self, data):
+        """
+        Set the failures to those of an earlier read, from the output of
+        to_dict(), such as when the results are loaded from a cache.  No
+        warnings are printed for them.
+
+        :param data: (dict)
+        """
+        self.reset()
+        for reason in data.get('reasons', []):
+            key = (reason['field'], reason['reason'])
+            self.__counts[key] = reason['count']
+            self.__samples[key] = list(reason['samples'])
+        self.__total = data.get('total', 0)
+
+    def summary(self):
+        """
+        The failures as text, one line for each reason, most common first.
+
+        :return: (str)
+        """
+        lines = [str(self.__total) + ' lines failed, ' + str(self.__shown) + ' warnings shown.']
+        for reason in self.to_dict()['reasons']:
+            field = 'line' if reason['field'] is None else reason['field']
+            lines.append('%8d  %-6s %s  (lines %s)' % (reason['count'], field, reason['reason'],
+                                                     ', '.join(str(line_no) for line_no in reason['samples'])))
+        return '\n'.join(lines)
+
+
+def _describe(stage, err):
+    """
+    :return: (str) - The warning text that follows the line number.
+    """
+    if stage == 'decode':
+        return ' could not be decoded, ' + err
+    return ' has failed with ' + err
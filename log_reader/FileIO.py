@@ -6,14 +6,47 @@ Description:
 This module handles reading and writing of files.
 
 
+Files compressed with gzip, bz2 or xz are decompressed as they are read.
+
+A file path of "-" is the standard input, it and named pipes are read as
+streams: from the start to the end only, as the lines come in.
+
+A checksum of the file, such as its sha256, can be worked out from the
+same bytes as they are read, rather than by reading the file again, see
+the checksum and digest attributes of MyFileIO.
+
 Todo:
-  - Add write features
   - Support binary files
-  - Add the ability to us checksums to verify content.
-  - Add support for compression/decompression
 """
 
+import io
 import os
+import sys
+import stat
+import time
+import select
+import locale
+import gzip
+import bz2
+import zlib
+import hashlib
+import itertools
+import numpy as np
+try:
+    import lzma
+except ImportError:
+    lzma = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# How to recognize each type of compressed file, by the first bytes of
+# the file and by the file extension.
+_MAGIC = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz')]
+_EXTENSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+# Checksums of the xxhash package, much faster than sha256 if it is installed
+_XXHASH_CHECKSUMS = ['xxh64', 'xxh3_64', 'xxh128', 'xxh3_128']
 
 class MyFileIO(object):
     """
@@ -23,7 +56,33 @@ class MyFileIO(object):
       - file_path:  Fully specified path to the file to be read or written
       - file_name:  The "name" portion of the file
       - file_ext:   The "ext" of the file, example jpg for my_image.jpg
-      - file_size:  How big the file is in bytes.
+      - file_size:  How big the file is in bytes, as stored on disk.
+      - compression: The compression used for the file, "gzip", "bz2" or
+                    "xz", None if the file is not compressed.
+      - uncompressed_size: How big the file is in bytes once decompressed,
+                    None if that can not be found without decompressing
+                    the whole file, which is the case for every compressed
+                    file.  The size kept at the end of a gzip file is only
+                    that of its last member, modulo 4 GiB, and appending
+                    adds members, so it is not used.
+      - file_id:    The (device, inode) pair that identifies the file on disk,
+                    this changes when a log is rotated.
+      - is_stream:  Whether the file is the standard input, "-", or a pipe,
+                    which can only be read once from the start.
+      - buffer_size: Size in bytes of the read buffer used when streaming
+                     the file, default is 1 MiB.
+      - checksum:   Name of the checksum worked out from the bytes of the
+                    file as it is read from the start to the end, see
+                    new_checksum().  None, the default, works out none.
+      - digest:     The hex digest of the checksum of the last time the whole
+                    file was read, with iter_lines(), iter_batches() or
+                    get_file_contents(), None if it has not been.  It is of
+                    the bytes as stored, before they are decompressed, and is
+                    the same as get_content_digest() would give.
+      - metrics:    A Metrics object to record the time spent reading and
+                    the lines and bytes read in, as the "read" stage, and
+                    the bytes written, as the "write" stage.  None, the
+                    default, records nothing.
     """
 
     @property
@@ -51,13 +110,79 @@ class MyFileIO(object):
 
     @property
     def file_size(self):
-        if self.file_path != None:
+        if self.file_path != None and not self.is_stream:
             return os.path.getsize(self.file_path)
         return -1
 
+    @property
+    def file_id(self):
+        if self.file_path != None:
+            info = os.fstat(sys.stdin.fileno()) if self.file_path == '-' else os.stat(self.file_path)
+            return (info.st_dev, info.st_ino)
+        return None
 
-    def __init__(self, file_path=None):
+    @property
+    def is_stream(self):
+        return is_stream(self.file_path)
+
+    @property
+    def compression(self):
+        # A stream can not be peeked at, it is decompressed before the pipe
+        if self.file_path is None or self.is_stream: return None
+        with open(self.file_path, 'rb') as fp:
+            head = fp.read(6)
+        for magic, compression in _MAGIC:
+            if head.startswith(magic):
+                return compression
+        if len(head) == 0:
+            # Nothing to go on but the name for empty files
+            return _EXTENSIONS.get(self.file_ext)
+        return None
+
+    @property
+    def uncompressed_size(self):
+        if self.compression is None:
+            return self.file_size
+        return None
+
+    @property
+    def buffer_size(self):
+        return self.__buffer_size
+    @buffer_size.setter
+    def buffer_size(self, value):
+        assert isinstance(value, int) and value > 0, "Invalid buffer size given: " + str(value)
+        self.__buffer_size = value
+
+
+    @property
+    def checksum(self):
+        return self.__checksum
+    @checksum.setter
+    def checksum(self, value):
+        if value is not None:
+            new_checksum(value)   # Fails for an unknown checksum
+        self.__checksum = value
+
+    @property
+    def digest(self):
+        return self.__digest
+
+
+    @property
+    def metrics(self):
+        return self.__metrics
+    @metrics.setter
+    def metrics(self, value):
+        assert value is None or hasattr(value, 'record'), "Invalid metrics given: " + str(value)
+        self.__metrics = value
+
+
+    def __init__(self, file_path=None, buffer_size=1024*1024, metrics=None, checksum=None):
         self.file_path = file_path
+        self.buffer_size = buffer_size
+        self.metrics = metrics
+        self.checksum = checksum
+        self.__digest = None
    
     def get_file_contents(self):
         """
@@ -66,14 +191,460 @@ class MyFileIO(object):
         :return: (list of str) - Each item in the list is a line in the file.
         """
         data = []
-        with open(self.file_path, 'r') as fp:
-            data = fp.readlines()
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        if self.checksum is not None and not self.is_stream:
+            checksum = new_checksum(self.checksum)
+            with open(self.file_path, 'rb', 0) as raw:
+                with self._open_text(_DigestReader(raw, checksum)) as fp:
+                    data = fp.readlines()
+            self.__digest = checksum.hexdigest()
+        else:
+            with self._open_text() as fp:
+                data = fp.readlines()
+        if metrics is not None:
+            metrics.record('read', started, rows_out=len(data), num_bytes=_encoded_size(data))
 
         return data
-    
-    
-    
- 
 
+    def write(self, data, append=False, compression=None):
+        """
+        Write to the file in one go, compressing it if asked.  Appending
+        to a compressed file adds another gzip member, or bz2 or xz stream,
+        which are read back as one file.
 
+        :param data:        (str or bytes) - What to write, str is encoded as UTF-8.
+        :param append:      (bool) - Add to the end of the file rather than replace it.
+        :param compression: (str) - "gzip", "bz2" or "xz", default is the one
+                            of the file extension, if any.
+        """
+        if compression is None:
+            compression = _EXTENSIONS.get(self.file_ext)
+        assert compression in [None, 'gzip', 'bz2', 'xz'], "Invalid compression given: " + str(compression)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        mode = 'ab' if append else 'wb'
+        if compression == 'gzip':
+            fp = gzip.open(self.file_path, mode, compresslevel=6)
+        elif compression == 'bz2':
+            fp = bz2.open(self.file_path, mode)
+        elif compression == 'xz':
+            assert lzma is not None, "The lzma module is needed to write xz files."
+            fp = lzma.open(self.file_path, mode)
+        else:
+            fp = open(self.file_path, mode)
+        with fp:
+            fp.write(data)
+        if metrics is not None:
+            metrics.record('write', started, num_bytes=len(data))
+
+    def _open_text(self, raw=None):
+        """
+        Open the file for reading as text, decompressing it if needed.
+
+        :param raw: (file) - The file open for reading bytes, unbuffered, to
+                    read through, such as a _DigestReader.  The caller closes it.
+        :return: (file) - The open file.
+        """
+        compression = self.compression
+        if raw is not None:
+            buffered = io.BufferedReader(raw, self.buffer_size)
+            if compression == 'gzip':
+                return gzip.open(buffered, 'rt')
+            elif compression == 'bz2':
+                return bz2.open(buffered, 'rt')
+            elif compression == 'xz':
+                assert lzma is not None, "The lzma module is needed to read xz files."
+                return lzma.open(buffered, 'rt')
+            return io.TextIOWrapper(buffered)
+        if compression == 'gzip':
+            return gzip.open(self.file_path, 'rt')
+        elif compression == 'bz2':
+            return bz2.open(self.file_path, 'rt')
+        elif compression == 'xz':
+            assert lzma is not None, "The lzma module is needed to read xz files."
+            return lzma.open(self.file_path, 'rt')
+        return open(self.file_path, 'r', self.buffer_size)
+
+    def iter_lines(self, start=0, end=None):
+        """
+        Stream the contents of a file one line at a time, only
+        buffer_size bytes of the file are held in memory at once.
+
+        :param start: (int) - Byte offset to start reading from, this
+                      should be the start of a line.
+        :param end:   (int) - Byte offset to stop at, the line that
+                      contains this offset is the last one read.  Default
+                      is the end of the file.
+        :return: (generator of str) - Each item is a line in the file.
+        """
+        if self.is_stream:
+            assert start == 0 and end is None, "Byte ranges can not be read from a stream."
+            for line in self._iter_stream_lines():
+                if line is not None:
+                    yield line
+            return
+
+        compressed = self.compression is not None
+        if compressed:
+            assert start == 0 and end is None, "Byte ranges can not be read from a compressed file."
+
+        # Only a read of the whole file has a digest
+        self.__digest = None
+        checksum = None
+        if self.checksum is not None and start == 0 and end is None:
+            checksum = new_checksum(self.checksum)
+
+        if checksum is not None:
+            # The bytes are hashed as they are read, in the same pass
+            with open(self.file_path, 'rb', 0) as raw:
+                with self._open_text(_DigestReader(raw, checksum)) as fp:
+                    for line in fp:
+                        yield line
+            self.__digest = checksum.hexdigest()
+            return
+
+        if start == 0 and end is None:
+            with self._open_text() as fp:
+                for line in fp:
+                    yield line
+            return
+
+        # Byte offsets only make sense on the raw bytes, so the lines are
+        # decoded here the same way that open() in text mode would.
+        encoding = locale.getpreferredencoding(False)
+        with open(self.file_path, 'rb', self.buffer_size) as fp:
+            fp.seek(start)
+            position = start
+            for line in fp:
+                if end is not None and position >= end:
+                    break
+                position += len(line)
+                yield line.decode(encoding).replace('\r\n', '\n')
+
+    def _iter_stream_lines(self, max_wait=None):
+        """
+        Read the lines of a stream as they come in, see iter_lines().
+
+        :param max_wait: (float) - Seconds between the None items given while
+                         waiting for lines, None waits without them.
+        :return: (generator of str) - Each line, and None every max_wait
+                 seconds so the caller can do something while it waits.
+        """
+        encoding = locale.getpreferredencoding(False)
+        self.__digest = None
+        checksum = None if self.checksum is None else new_checksum(self.checksum)
+        if self.file_path == '-':
+            fd = sys.stdin.fileno()
+        else:
+            fd = os.open(self.file_path, os.O_RDONLY)
+        try:
+            rest = b''
+            deadline = None if max_wait is None else time.time() + max_wait
+            while True:
+                if deadline is not None:
+                    ready = select.select([fd], [], [], max(deadline - time.time(), 0))[0]
+                    if time.time() >= deadline:
+                        deadline = time.time() + max_wait
+                        yield None
+                    if not ready:
+                        continue
+                block = os.read(fd, self.buffer_size)
+                if len(block) == 0:
+                    break
+                if checksum is not None:
+                    checksum.update(block)
+                lines = (rest + block).split(b'\n')
+                rest = lines.pop()
+                for line in lines:
+                    yield (line + b'\n').decode(encoding).replace('\r\n', '\n')
+            if len(rest) > 0:
+                yield rest.decode(encoding)
+            if checksum is not None:
+                self.__digest = checksum.hexdigest()
+        finally:
+            if self.file_path != '-':
+                os.close(fd)
+
+    def iter_batches(self, batch_size=10000, start=0, end=None, max_wait=None):
+        """
+        Stream the contents of a file in batches of lines.
+
+        :param batch_size: (int) - The maximum number of lines in a batch.
+        :param start:      (int) - Byte offset to start reading from.
+        :param end:        (int) - Byte offset to stop at, see iter_lines().
+        :param max_wait:   (float) - For a stream, the most seconds between
+                           batches, a batch is given when they have passed
+                           with the lines that came in so far, which may be
+                           none.  None, the default, waits for a full batch.
+        :return: (generator of list of str) - Each item is a list of at
+                 most batch_size lines, the last batch may be shorter.
+        """
+        assert isinstance(batch_size, int) and batch_size > 0, "Invalid batch size given: " + str(batch_size)
+        assert max_wait is None or max_wait > 0, "Invalid max_wait given: " + str(max_wait)
+
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        batch = []
+        if max_wait is not None and self.is_stream:
+            lines = self._iter_stream_lines(max_wait)
+        else:
+            lines = self.iter_lines(start, end)
+        for line in lines:
+            if line is not None:
+                batch.append(line)
+            if len(batch) == batch_size or line is None:
+                if metrics is not None:
+                    metrics.record('read', started, rows_out=len(batch), num_bytes=_encoded_size(batch))
+                yield batch
+                if metrics is not None: started = metrics.start()
+                batch = []
+        if len(batch) > 0:
+            if metrics is not None:
+                metrics.record('read', started, rows_out=len(batch), num_bytes=_encoded_size(batch))
+            yield batch
+
+    def get_head_digest(self, num_bytes=4096):
+        """
+        The sha256 digest of the start of the file, used to tell whether
+        a file has been replaced by another one with the same name.
+
+        :param num_bytes: (int) - How many bytes from the start to use.
+        :return: (str) - The hex digest.
+        """
+        with open(self.file_path, 'rb') as fp:
+            return hashlib.sha256(fp.read(num_bytes)).hexdigest()
+
+    def get_content_digest(self, checksum='sha256'):
+        """
+        The digest of the whole file, as stored on disk.  This reads the
+        file just for the digest, see the checksum attribute to have it
+        worked out while the file is read anyway.
 
+        :param checksum: (str) - Name of the checksum, see new_checksum().
+        :return: (str) - The hex digest.
+        """
+        digest = new_checksum(checksum)
+        with open(self.file_path, 'rb') as fp:
+            block = fp.read(self.buffer_size)
+            while len(block) > 0:
+                digest.update(block)
+                block = fp.read(self.buffer_size)
+        return digest.hexdigest()
+
+    def get_last_line_end(self, start=0):
+        """
+        Find where the last complete line of the file ends, a line that
+        is still being written has no newline yet and is left out.
+
+        :param start: (int) - Byte offset to look back to.
+        :return: (int) - The offset just past the last newline, or start if
+                 there is no newline after start.
+        """
+        position = self.file_size
+        with open(self.file_path, 'rb') as fp:
+            while position > start:
+                block_start = max(position - self.buffer_size, start)
+                fp.seek(block_start)
+                block = fp.read(position - block_start)
+                eol = block.rfind(b'\n')
+                if eol >= 0:
+                    return block_start + eol + 1
+                position = block_start
+        return start
+
+    def get_line_offsets(self, every=1, start=0, end=None, first_line=1):
+        """
+        Find the byte offsets of the lines of the file, or of one line in
+        every so many, by looking for the newlines a buffer_size block at a
+        time.
+
+        :param every:      (int) - Keep the offsets of the lines whose number
+                           less one is a multiple of this, default is all of them.
+        :param start:      (int) - Byte offset of a line to start at.
+        :param end:        (int) - Byte offset to stop at, default is the end.
+        :param first_line: (int) - The line number of the line at start.
+        :return: (numpy.ndarray of int64) - The offsets.
+        """
+        assert isinstance(every, int) and every > 0, "Invalid every given: " + str(every)
+        assert self.compression is None, "Byte offsets can not be found in a compressed file."
+        stop = self.file_size if end is None else min(end, self.file_size)
+        offsets = []
+        found = 0   # Lines found so far, from first_line
+        if start < stop:
+            if (first_line - 1) % every == 0:
+                offsets.append(np.array([start], dtype='int64'))
+            found = 1
+        with open(self.file_path, 'rb') as fp:
+            fp.seek(start)
+            position = start
+            while position < stop:
+                block = fp.read(min(self.buffer_size, stop - position))
+                if len(block) == 0: break
+                # A line starts after each newline that is not the last byte
+                starts = np.flatnonzero(np.frombuffer(block, dtype='uint8') == 10) + (position + 1)
+                starts = starts[starts < stop]
+                numbers = np.arange(first_line + found, first_line + found + len(starts))
+                offsets.append(starts[(numbers - 1) % every == 0])
+                found += len(starts)
+                position += len(block)
+        if len(offsets) == 0:
+            return np.zeros(0, dtype='int64')
+        return np.concatenate(offsets).astype('int64')
+
+    def get_line_start(self, offset):
+        """
+        Find the first line that starts at or after a byte offset.
+
+        :param offset: (int) - Any byte offset in the file.
+        :return: (int) - The offset of the start of that line, the file size
+                 if no line starts after offset.
+        """
+        if offset <= 0:
+            return 0
+        with open(self.file_path, 'rb') as fp:
+            # A line starts at offset if the byte before it ends a line
+            fp.seek(offset - 1)
+            fp.readline()
+            return fp.tell()
+
+    def read_lines(self, start, count):
+        """
+        Read a few lines from a byte offset, as iter_lines() gives them.
+
+        :param start: (int) - Byte offset of the first line.
+        :param count: (int) - Number of lines to read.
+        :return: (list of str) - The lines, fewer at the end of the file.
+        """
+        lines = self.iter_lines(start, None)
+        try:
+            return list(itertools.islice(lines, count))
+        finally:
+            lines.close()
+
+    def get_line_ranges(self, num_ranges):
+        """
+        Split the file into byte ranges of about the same size that
+        start and end on line boundaries.
+
+        :param num_ranges: (int) - How many ranges to split the file into.
+        :return: (list of (int, int)) - The start and end offset of each range,
+                 there may be fewer than num_ranges for small files.  A
+                 compressed file is one range of (0, None).
+        """
+        assert isinstance(num_ranges, int) and num_ranges > 0, "Invalid number of ranges given: " + str(num_ranges)
+        if self.compression is not None:
+            return [(0, None)]
+
+        size = self.file_size
+        starts = [0]
+        with open(self.file_path, 'rb') as fp:
+            for i in range(1, num_ranges):
+                # Move on to the start of the line after the split point
+                fp.seek(max(size * i // num_ranges - 1, starts[-1]))
+                fp.readline()
+                position = fp.tell()
+                if position >= size: break
+                if position > starts[-1]:
+                    starts.append(position)
+
+        return list(zip(starts, starts[1:] + [size]))
+
+
+class ChecksumError(ValueError):
+    """
+    A file does not have the digest it was expected to have.
+    """
+
+
+class _DigestReader(io.RawIOBase):
+    """
+    A file open for reading bytes that updates a checksum with each of
+    the bytes read through it.
+    """
+
+    def __init__(self, raw, checksum):
+        io.RawIOBase.__init__(self)
+        self.__raw = raw
+        self.__checksum = checksum
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.__raw.readinto(buffer)
+        if count:
+            self.__checksum.update(memoryview(buffer)[:count])
+        return count
+
+
+class _Crc32(object):
+    """
+    The CRC-32 of bytes, with the interface of the checksums of hashlib.
+    """
+
+    def __init__(self):
+        self.__value = 0
+
+    def update(self, data):
+        self.__value = zlib.crc32(data, self.__value)
+
+    def hexdigest(self):
+        return '%08x' % self.__value
+
+
+def new_checksum(name):
+    """
+    Start a checksum, to be given bytes with update() and finished with
+    hexdigest().
+
+    :param name: (str) - "sha256", or another algorithm of hashlib such as
+                 "md5" or "blake2b", "crc32", or one of the xxhash package,
+                 such as "xxh3_64", when it is installed.
+    :return: The checksum, like a hashlib hash object.
+    """
+    if name == 'crc32':
+        return _Crc32()
+    if name in _XXHASH_CHECKSUMS:
+        assert xxhash is not None, "The xxhash package is needed for " + name + " checksums."
+        return getattr(xxhash, name)()
+    assert isinstance(name, str) and name in hashlib.algorithms_available and not name.startswith('shake'), \
+        "Invalid checksum given: " + str(name)
+    return hashlib.new(name)
+
+
+def is_stream(file_path):
+    """
+    Whether a file path is the standard input, "-", or a pipe, a character
+    device such as /dev/stdin, or a socket.
+
+    :param file_path: (str)
+    :return: (bool)
+    """
+    if file_path is None:
+        return False
+    if file_path == '-':
+        return True
+    try:
+        mode = os.stat(file_path).st_mode
+    except OSError:
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISCHR(mode) or stat.S_ISSOCK(mode)
+
+
+def _encoded_size(lines):
+    """
+    The number of bytes of a batch of lines as they are encoded in the
+    file, once decompressed, rather than their number of characters.  Line
+    endings of "\r\n" are read as "\n", so they count as one byte.
+
+    :param lines: (list of str) - The lines, as read in text mode.
+    :return: (int) - The number of bytes.
+    """
+    text = ''.join(lines)
+    if text.isascii():
+        # One byte for each character, no need to encode
+        return len(text)
+    return len(text.encode(locale.getpreferredencoding(False), 'replace'))
@@ -0,0 +1,281 @@
+"""
+Module: Index
+
+Description:
+
+This module keeps a sidecar index next to a log file so that the rows for
+a sha, user or session, or for a span of time, can be found without reading
+the whole log.  For each valid row the index has the hash of its sha, uu
+and si and the bucket of its ts, with its line number, sorted so that a
+value is found with a binary search.  The byte offset of every so many
+lines is kept too, so a line is read by seeking to the offset before it
+and skipping at most that many lines.
+
+The hashes are only used to find candidate lines, the lines are read and
+checked again, so a collision never gives a wrong row.
+
+The index is saved as a numpy .npz file with the log path and ".index"
+added.  It keeps the identity, size and head digest of the log, so it can
+be extended when lines are added to the log and rebuilt when the log is
+rotated, truncated or replaced.
+"""
+
+import os
+import json
+import numpy as np
+from log_reader.Sketches import hash_values
+from log_reader.Validator import parse_epochs
+
+# Version of the layout of the index files
+_INDEX_VERSION = 1
+# The keys whose values can be looked up
+INDEX_KEYS = ['sha', 'uu', 'si']
+
+
+class LogIndex(object):
+    """
+    The index of one log file.
+
+    Attributes:
+      - log_path:     The log file that is indexed.
+      - index_path:   Where the index is kept, default is the log path with
+                      ".index" added.
+      - bucket_seconds: Length of the ts buckets, default is 60.
+      - every:        The byte offset of one line in this many is kept,
+                      default is 256.
+      - lines:        Number of lines of the log that are indexed.
+      - end:          Byte offset just past the last line indexed.
+      - rows:         Number of valid rows in the index.
+    """
+
+    @property
+    def log_path(self):
+        return self.__log_path
+
+    @property
+    def index_path(self):
+        return self.__index_path
+
+    @property
+    def bucket_seconds(self):
+        return self.__bucket_seconds
+
+    @property
+    def every(self):
+        return self.__every
+
+    @property
+    def lines(self):
+        return self.__lines
+
+    @property
+    def end(self):
+        return self.__end
+
+    @property
+    def rows(self):
+        return sum(len(lines) for lines in self.__lines_of['ts'])
+
+
+    def __init__(self, log_path, index_path=None, bucket_seconds=60, every=256):
+        assert isinstance(log_path, str), "Invalid log path given: " + str(log_path)
+        assert isinstance(bucket_seconds, int) and bucket_seconds > 0, "Invalid bucket_seconds given: " + str(bucket_seconds)
+        assert isinstance(every, int) and every > 0, "Invalid every given: " + str(every)
+        self.__log_path = log_path
+        self.__index_path = log_path + '.index' if index_path is None else index_path
+        self.__bucket_seconds = bucket_seconds
+        self.__every = every
+        self.__lines = 0
+        self.__end = 0
+        self.__meta = {}
+        self.__offsets = np.zeros(0, dtype='int64')
+        # Each key has a list of arrays, one per batch, until finish() sorts them
+        self.__keys_of = dict((key, []) for key in INDEX_KEYS + ['ts'])
+        self.__lines_of = dict((key, []) for key in INDEX_KEYS + ['ts'])
+
+    def add_rows(self, line_nos, rows):
+        """
+        Add a batch of valid rows.
+
+        :param line_nos: (list of int) - The line number of each row.
+        :param rows:     (list of dict) - The rows.
+        """
+        if len(rows) == 0: return
+        line_nos = np.asarray(line_nos, dtype='uint32')
+        for key in INDEX_KEYS:
+            self.__keys_of[key].append(hash_values([row[key] for row in rows]))
+            self.__lines_of[key].append(line_nos)
+        if 'epoch' in rows[0]:
+            epochs = np.array([row['epoch'] for row in rows], dtype='int64')
+        else:
+            epochs = parse_epochs([row['ts'] for row in rows])
+        self.__keys_of['ts'].append(epochs // self.__bucket_seconds)
+        self.__lines_of['ts'].append(line_nos)
+
+    def merge(self, other, line_offset=0):
+        """
+        Add the rows of another index, such as one of a worker that read a
+        part of the log.
+
+        :param other:       (LogIndex) - The index to merge in.
+        :param line_offset: (int) - Added to the line numbers of other, as the
+                            line numbers of a worker start at 1.
+        """
+        assert isinstance(other, LogIndex) and other.bucket_seconds == self.bucket_seconds, \
+            "Can only merge an index with the same buckets."
+        for key in INDEX_KEYS + ['ts']:
+            self.__keys_of[key] += other.__keys_of[key]
+            self.__lines_of[key] += [lines + np.uint32(line_offset) for lines in other.__lines_of[key]]
+
+    def finish(self, my_file, lines, end, valid_keys_digest, first_line=1, start=0):
+        """
+        Sort the rows added and find the byte offsets of the lines read,
+        once the read is done.
+
+        :param my_file:    (MyFileIO) - The log file.
+        :param lines:      (int) - Number of lines of the log indexed in all.
+        :param end:        (int) - Byte offset just past the last line indexed.
+        :param valid_keys_digest: (str) - Digest of the valid_keys the rows
+                           were validated with.
+        :param first_line: (int) - Line number of the first line read, more
+                           than 1 when the index is being extended.
+        :param start:      (int) - Byte offset of that line.
+        """
+        for key in INDEX_KEYS + ['ts']:
+            keys = np.concatenate(self.__keys_of[key]) if self.__keys_of[key] else np.zeros(0, dtype='uint64')
+            line_nos = np.concatenate(self.__lines_of[key]) if self.__lines_of[key] else np.zeros(0, dtype='uint32')
+            order = np.argsort(keys, kind='stable')
+            self.__keys_of[key] = [keys[order]]
+            self.__lines_of[key] = [line_nos[order]]
+
+        offsets = my_file.get_line_offsets(self.__every, start, end, first_line)
+        self.__offsets = np.concatenate([self.__offsets[:(first_line - 1 + self.__every - 1) // self.__every],
+                                         offsets])
+        self.__lines = lines
+        self.__end = end
+        self.__meta = {'version': _INDEX_VERSION,
+                       'file_id': list(my_file.file_id),
+                       'head_bytes': min(end, 4096),
+                       'head_digest': my_file.get_head_digest(min(end, 4096)),
+                       'valid_keys': valid_keys_digest,
+                       'bucket_seconds': self.__bucket_seconds,
+                       'every': self.__every,
+                       'lines': lines,
+                       'end': end}
+
+    def status(self, my_file, valid_keys_digest):
+        """
+        Whether the index is still right for the log as it is now.
+
+        :param my_file:           (MyFileIO) - The log file.
+        :param valid_keys_digest: (str) - Digest of the current valid_keys.
+        :return: (str) - "current", "grown" if lines were added to the log
+                 since, or "stale" if it must be built again.
+        """
+        meta = self.__meta
+        if meta.get('version') != _INDEX_VERSION or meta.get('valid_keys') != valid_keys_digest:
+            return 'stale'
+        if tuple(meta['file_id']) != tuple(my_file.file_id) or my_file.file_size < meta['end'] \
+           or my_file.get_head_digest(meta['head_bytes']) != meta['head_digest']:
+            return 'stale'
+        if my_file.get_last_line_end(meta['end']) > meta['end']:
+            return 'grown'
+        return 'current'
+
+    def lookup(self, key, value):
+        """
+        The lines that may have a value of a key.
+
+        :param key:   (str) - One of INDEX_KEYS.
+        :param value: The value to look up.
+        :return: (numpy.ndarray) - Sorted line numbers, some of which may be for
+                 other values with the same hash.
+        """
+        assert key in INDEX_KEYS, "Invalid index key given: " + str(key)
+        hashed = hash_values([value])[0]
+        return self._find(key, hashed, hashed)
+
+    def lookup_range(self, start, end):
+        """
+        The lines that may have a ts from start up to end.
+
+        :param start: (int) - Seconds since the epoch, None for no start.
+        :param end:   (int) - Seconds since the epoch, not included, None for no end.
+        :return: (numpy.ndarray) - Sorted line numbers, of rows in the buckets
+                 that overlap the range.
+        """
+        keys = self.__keys_of['ts'][0]
+        if len(keys) == 0:
+            return np.zeros(0, dtype='int64')
+        low = keys[0] if start is None else start // self.__bucket_seconds
+        high = keys[-1] if end is None else (end - 1) // self.__bucket_seconds
+        return self._find('ts', low, high)
+
+    def _find(self, key, low, high):
+        """
+        :return: (numpy.ndarray) - The sorted line numbers of the keys from
+                 low to high.
+        """
+        keys = self.__keys_of[key][0]
+        first = np.searchsorted(keys, low, side='left')
+        last = np.searchsorted(keys, high, side='right')
+        return np.sort(self.__lines_of[key][0][first:last]).astype('int64')
+
+    def locate(self, line_nos):
+        """
+        Where to read each line from.
+
+        :param line_nos: (list of int) - Sorted line numbers.
+        :return: (list of (int, int, list of int)) - For each block of lines
+                 that has one of them, the byte offset of its first line, its
+                 first line number and the line numbers wanted from it.
+        """
+        blocks = []
+        for line_no in line_nos:
+            block = (int(line_no) - 1) // self.__every
+            if len(blocks) == 0 or blocks[-1][0] != block:
+                blocks.append((block, int(self.__offsets[block]), block * self.__every + 1, []))
+            blocks[-1][3].append(int(line_no))
+        return [(offset, first_line, wanted) for block, offset, first_line, wanted in blocks]
+
+    def save(self):
+        """
+        Save the index next to the log, the old one is only replaced once
+        the new one is written.
+        """
+        arrays = {'offsets': self.__offsets}
+        for key in INDEX_KEYS + ['ts']:
+            arrays[key + '_keys'] = self.__keys_of[key][0]
+            arrays[key + '_lines'] = self.__lines_of[key][0]
+        tmp_path = self.__index_path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            np.savez(fp, meta=np.array(json.dumps(self.__meta)), **arrays)
+        os.replace(tmp_path, self.__index_path)
+
+    @classmethod
+    def load(cls, log_path, index_path=None):
+        """
+        Load the index of a log.
+
+        :param log_path:   (str) - The log file.
+        :param index_path: (str) - Where the index is kept, see index_path.
+        :return: (LogIndex) - The index, None if there is none or it can not
+                 be read.
+        """
+        index_path = log_path + '.index' if index_path is None else index_path
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with np.load(index_path) as data:
+                meta = json.loads(str(data['meta']))
+                index = cls(log_path, index_path, meta['bucket_seconds'], meta['every'])
+                index.__offsets = data['offsets']
+                for key in INDEX_KEYS + ['ts']:
+                    index.__keys_of[key] = [data[key + '_keys']]
+                    index.__lines_of[key] = [data[key + '_lines']]
+        except (IOError, ValueError, KeyError):
+            return None
+        index.__meta = meta
+        index.__lines = meta['lines']
+        index.__end = meta['end']
+        return index
@@ -17,10 +17,38 @@ has the following keys:
 """
 
 import os 
+import glob
+import copy
+import json
+import time
+import hashlib
+import multiprocessing
+from collections import OrderedDict
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from log_reader.FileIO import MyFileIO
+from log_reader.FileIO import MyFileIO, ChecksumError, is_stream, new_checksum
+from log_reader.Writer import PartitionedWriter
+from log_reader.Decoder import JsonDecoder
 from log_reader.utilities import StrPattern
+from log_reader.Validator import SchemaValidator
+from log_reader.Aggregates import CountAggregate, WindowAggregate, REPORTS, make_report, aggregate_from_dict
+from log_reader.Cache import FrameCache, _stat_of
+from log_reader.Compact import compact_frame, align_frames, memory_per_row
+from log_reader.Metrics import Metrics
+from log_reader.Errors import ErrorCollector
+from log_reader.Index import LogIndex, INDEX_KEYS
+from log_reader.Dedup import Deduplicator
+from log_reader.Sampling import LogSample, Reservoir, pick_blocks
+from log_reader.Validator import parse_epoch
+
+# Version of the layout of the checkpoint files written by read_incremental(),
+# 2 moved the rows seen by dedup to a file of their own
+_CHECKPOINT_VERSION = 2
+# Files in a log directory that are not logs, but kept next to them
+_SKIP_SUFFIXES = ('.checkpoint', '.tmp', '.index', '.dedup')
+# The counts always kept by streaming and incremental reads
+_BASE_AGGREGATES = ['ext', 'dp']
 
 
 class LogFileAnalyzer(object):
@@ -28,8 +56,79 @@ class LogFileAnalyzer(object):
     Analyzing the content of a given log file 
 
     Attributes:
-        - data_frame: The data frame that's created from the file.
-        - log_file:   Full path to the log file to be examined.
+        - data_frame: The data frame that's created from the file.  When ts
+                      is a datetime key of valid_keys the frame has an epoch
+                      column too, the ts as seconds since the epoch, so that
+                      it is not parsed again by the reports.
+        - log_file:   Full path to the log file to be examined, or a directory
+                      or glob pattern for several log files.  Every file under
+                      a directory is read, apart from hidden files and the
+                      checkpoints of read_incremental().  "-" or a named pipe
+                      is read as a stream, see read_stream().
+        - log_files:  The log files found for log_path, in sorted order.
+        - file_results: dict of log file to its number of lines, valid rows
+                      and failed lines in the last read.
+        - batch_size: Number of lines read, validated and added to the data
+                      frame at a time, default is 10000.  Peak memory used
+                      while reading follows this rather than the file size.
+        - validation_mode: "row" to validate one row at a time, or "batch"
+                      to validate a whole batch a column at a time with
+                      pandas.  Both find the same invalid rows.
+        - workers:    Number of processes used to read and validate the file,
+                      default is 1.  With more than one the file is split into
+                      byte ranges on line boundaries, one per worker.
+        - streaming:  When True only the counts of the valid rows by ext and
+                      by dp, and the aggregates of reports, are kept as the
+                      file is read, so memory use does not grow with the file.
+                      data_frame is then only built, by reading the file
+                      again, if it is asked for.
+        - reports:    Names of the reports of analyze(), see REPORTS in the
+                      Aggregates module, default is ["ext"].  Streaming and
+                      incremental reads fill them in as the rows are read.
+        - report_options: dict of the error bounds of the approximate
+                      reports, "distinct_error", "count_error" and
+                      "confidence", see REPORTS.  Default is {}, which uses
+                      the defaults of each report.  "window", "slide" and
+                      "lateness" set the seconds of the windows report.
+        - window_emit: Function given each window of the windows report as
+                      soon as it is complete, see WindowAggregate.  For a
+                      streaming read that is while the log is being read,
+                      otherwise when analyze() works the report out.
+        - compact:    When True the data frame is kept in narrow typed columns,
+                      see the Compact module, rather than python objects.
+                      It uses about a third of the memory.
+        - decoder:    The JsonDecoder used to turn lines into rows.
+        - cache:      A FrameCache to keep validated data frames in, so an
+                      unchanged log is not read again.  None, the default,
+                      turns caching off.
+        - metrics:    A Metrics object that records the time, rows, bytes and
+                      memory of each stage of a read, it is reset at the start
+                      of each read so holds the last one.  None, the default,
+                      records nothing.
+        - errors:     The ErrorCollector that the lines which could not be
+                      decoded or failed validation are given to, it prints
+                      the warnings and counts the failures by reason.  The
+                      default prints a warning for every line.
+        - index:      When True read_and_validate() also builds a sidecar index
+                      of the log, see the Index module, for query().  It is
+                      only built for a single log file that is not compressed.
+                      query() builds it anyway if there is not one.
+        - dedup:      A Deduplicator, see the Dedup module, that valid rows
+                      already seen in the read are skipped by, and counted
+                      in.  The rows must be seen in order, so workers is
+                      not used.  None, the default, keeps every row.
+        - checksum:   Name of a checksum, such as "sha256", worked out from
+                      the bytes of the log as they are read, see
+                      FileIO.new_checksum().  None, the default, works one
+                      out only when it is needed, for read_and_validate()
+                      with an expected digest or a cache with content_hash.
+                      The file is then read by one process, not by workers.
+        - digest:     The hex digest of the log of the last read of the whole
+                      of a single log file or stream, None if there is none.
+        - decode_errors: Number of lines in the last read that were not
+                      valid JSON objects.
+        - sample:     The LogSample of the last read_sample(), None if there
+                      was none since log_path was set.
         - valid_keys: dict of expected keys and their
           default is: { "ts":  {"type": datetime, "min": 0, "max": "today", fullname": "timestamp"},
                         "pt":  {"type": float, "min":0,  "fullname": "processing time"},
@@ -41,6 +140,8 @@ class LogFileAnalyzer(object):
                         "ph":  {"type": str, "min_len": 2, "fullname": "Path to file"},
                         "dp":  {"type": int, values:{1: "MALICIOUS", 2:"CLEAN", 3: "UNKNOWN"}, "fullname": "Dispocition"
                       }
+          The checks are compiled when valid_keys is set, so set it again
+          after changing the contents of the dictionary.
     """
 
     @property
@@ -51,33 +152,235 @@ class LogFileAnalyzer(object):
         if value is None: self.__log_path=None; return
 
         assert isinstance(value,str), "Invalid log_path  given: " + str(value)
-        assert os.path.exists(value), "Path provided was not found."
+        assert value == '-' or os.path.exists(value) or len(glob.glob(value)) > 0, "Path provided was not found."
         self.__data_frame = None   # If the log file has change data frame is set back to default
+        self.__frame_range = None
+        self.__totals = None
+        self.__sample = None
         self.__log_path = value
 
+    @property
+    def log_files(self):
+        return _find_log_files(self.__log_path)
+
+    @property
+    def file_results(self):
+        return self.__file_results
+
     @property
     def valid_keys(self):
         return self.__valid_keys
     @valid_keys.setter
     def valid_keys(self,value):
-        if value is None: self.__valid_keys=None; return
+        if value is None: self.__valid_keys=None; self.__validator=None; self.__normalize=None; return
 
         assert isinstance(value,dict), "Invalid valid_key dictionary given: " + str(value)
+        self.__validator = SchemaValidator(value)
         self.__valid_keys = value
+        spec = value.get('ts')
+        self.__normalize = None
+        if isinstance(spec, dict) and spec.get('type') is datetime:
+            # The validator has already parsed the ts of each row it checked
+            self.__normalize = self.__validator.normalizer.normalize
+
+    @property
+    def batch_size(self):
+        return self.__batch_size
+    @batch_size.setter
+    def batch_size(self, value):
+        assert isinstance(value, int) and value > 0, "Invalid batch_size given: " + str(value)
+        self.__batch_size = value
+
+    @property
+    def validation_mode(self):
+        return self.__validation_mode
+    @validation_mode.setter
+    def validation_mode(self, value):
+        assert value in ['row', 'batch'], "Invalid validation_mode given: " + str(value)
+        self.__validation_mode = value
+
+    @property
+    def workers(self):
+        return self.__workers
+    @workers.setter
+    def workers(self, value):
+        assert isinstance(value, int) and value > 0, "Invalid number of workers given: " + str(value)
+        self.__workers = value
+
+    @property
+    def reports(self):
+        return self.__reports
+    @reports.setter
+    def reports(self, value):
+        if value is None:
+            value = ['ext']
+        assert isinstance(value, list) and all(name in REPORTS for name in value), \
+            "Invalid reports given: " + str(value)
+        self.__reports = list(value)
+
+    @property
+    def report_options(self):
+        return self.__report_options
+    @report_options.setter
+    def report_options(self, value):
+        if value is None:
+            value = {}
+        assert isinstance(value, dict), "Invalid report_options given: " + str(value)
+        self.__report_options = dict(value)
+
+    @property
+    def window_emit(self):
+        return self.__window_emit
+    @window_emit.setter
+    def window_emit(self, value):
+        assert value is None or callable(value), "Invalid window_emit given: " + str(value)
+        self.__window_emit = value
+
+    @property
+    def index(self):
+        return self.__index
+    @index.setter
+    def index(self, value):
+        assert isinstance(value, bool), "Invalid index value given: " + str(value)
+        self.__index = value
+
+    @property
+    def dedup(self):
+        return self.__dedup
+    @dedup.setter
+    def dedup(self, value):
+        assert value is None or isinstance(value, Deduplicator), "Invalid dedup given: " + str(value)
+        self.__dedup = value
+
+    @property
+    def compact(self):
+        return self.__compact
+    @compact.setter
+    def compact(self, value):
+        assert isinstance(value, bool), "Invalid compact value given: " + str(value)
+        self.__compact = value
+
+    @property
+    def decoder(self):
+        return self.__decoder
+    @decoder.setter
+    def decoder(self, value):
+        if value is None: value = JsonDecoder()
+        assert hasattr(value, 'decode_batch'), "Invalid decoder given: " + str(value)
+        self.__decoder = value
+
+    @property
+    def cache(self):
+        return self.__cache
+    @cache.setter
+    def cache(self, value):
+        assert value is None or isinstance(value, FrameCache), "Invalid cache given: " + str(value)
+        self.__cache = value
+
+    @property
+    def metrics(self):
+        return self.__metrics
+    @metrics.setter
+    def metrics(self, value):
+        assert value is None or isinstance(value, Metrics), "Invalid metrics given: " + str(value)
+        self.__metrics = value
+
+    @property
+    def errors(self):
+        return self.__errors
+    @errors.setter
+    def errors(self, value):
+        if value is None: value = ErrorCollector()
+        assert isinstance(value, ErrorCollector), "Invalid errors given: " + str(value)
+        self.__errors = value
+
+    @property
+    def decode_errors(self):
+        return self.__decode_errors
+
+    @property
+    def sample(self):
+        return self.__sample
+
+    @property
+    def checksum(self):
+        return self.__checksum
+    @checksum.setter
+    def checksum(self, value):
+        if value is not None:
+            new_checksum(value)   # Fails for an unknown checksum
+        self.__checksum = value
+
+    @property
+    def digest(self):
+        return self.__digest
+
+    @property
+    def streaming(self):
+        return self.__streaming
+    @streaming.setter
+    def streaming(self, value):
+        assert isinstance(value, bool), "Invalid streaming value given: " + str(value)
+        self.__streaming = value
 
     @property
     def data_frame(self):
+        if self.__data_frame is None and self.__frame_range is not None:
+            # Only counts were kept by a streaming read, read the rows now
+            # that they are asked for.
+            start, end, first_line = self.__frame_range
+            self.__frame_range = None
+            decode_errors = self.__decode_errors
+            dedup = self.dedup
+            if dedup is not None:
+                # Skip the same rows again, as seen from where the read began
+                if self.__frame_dedup is None:
+                    dedup.reset()
+                else:
+                    dedup, self.__frame_dedup = self.__frame_dedup, None
+            if self._is_multi_file():
+                file_results = self.__file_results
+                frames = self._read_files(None, keep_frames=True, warn=False)
+                self.__file_results = file_results
+            else:
+                frames, count = self._read_range(start, end, first_line, lambda warnings: None, dedup=dedup)
+            self.__decode_errors = decode_errors
+            self.__data_frame = _concat_frames(frames)
         return self.__data_frame
 
 
-    def __init__(self, log_path=None, valid_keys=None):
+    def __init__(self, log_path=None, valid_keys=None, batch_size=10000, decoder=None, validation_mode='row',
+                 workers=1, streaming=False, cache=None, compact=False, metrics=None,
+                 errors=None, reports=None, report_options=None, window_emit=None, index=False, dedup=None,
+                 checksum=None):
         self.__data_frame = None
+        self.__frame_range = None
+        self.__frame_dedup = None
+        self.__decode_errors = 0
+        self.__totals = None
+        self.__file_results = None
+        self.__digest = None
         self.log_path = log_path
+        self.batch_size = batch_size
+        self.decoder = decoder
+        self.validation_mode = validation_mode
+        self.workers = workers
+        self.streaming = streaming
+        self.cache = cache
+        self.compact = compact
+        self.metrics = metrics
+        self.errors = errors
+        self.reports = reports
+        self.report_options = report_options
+        self.window_emit = window_emit
+        self.index = index
+        self.dedup = dedup
+        self.checksum = checksum
         if valid_keys == None:
             uid_pattern = '^([0-9a-fA-F]{8})-([0-9a-fA-F]{4})-([0-9a-fA-F]{4})-([0-9a-fA-F]{4})-([0-9a-fA-F]{12})'
             sha_pattern = '^([0-9a-fA-f]{64})'
             dir_pattern = '^(\.)*(/[\w.]+)+|'
-            self.__valid_keys = { "ts":  {"type": datetime, "min": 0, "fullname": "timestamp"},
+            valid_keys = { "ts":  {"type": datetime, "min": 0, "fullname": "timestamp"},
                         "pt":  {"type": float, "min": 0.0,  "fullname": "processing time"},
                         "si":  {"type": StrPattern, "pattern": uid_pattern, "fullname": "Session ID"},
                         "uu":  {"type": StrPattern, "pattern": uid_pattern, "fullname": "User UUID" },
@@ -87,108 +390,995 @@ class LogFileAnalyzer(object):
                         "ph":  {"type": StrPattern, "pattern": dir_pattern, "fullname": "Path to file"},
                         "dp":  {"type": int, "values": {1:"MALICIOUS", 2:"CLEAN", 3:"UNKNOWN"}, "fullname": "Dispocition"},
                       }
+        self.valid_keys = valid_keys
 
     def _validate_row(self, row):
         """
         Validate a row or line of data.
         """
-        if self.valid_keys is None:
+        if self.__validator is None:
             # Nothing to do nothing to validate
             return True, ''
 
-        # Check for all of the keys
-        if len( set(row.keys()) - set(self.valid_keys.keys())) > 0:
-            return False, "extra keys found."
-        if len(set(row.keys()) and set(self.valid_keys.keys())) != len(self.valid_keys.keys()):
-            return False, "not all keys found."
-
-        for vkey, vvalue in self.valid_keys.items():
-            if vvalue['type'] == StrPattern:
-                test = StrPattern(pattern=vvalue['pattern'], string=row[vkey])
-                if not test.is_match():
-                    return False, str(vkey) + ' value "' + str(row[vkey]) + '" does not match expected pattern.'
-            elif vvalue['type'] in [int, float]:
-                if  vvalue['type'] == int: rvalue = int(row[vkey])
-                if  vvalue['type'] == float: rvalue = float(row[vkey])
-
-                if "values" in vvalue.keys() and rvalue not in vvalue['values']:
-                    return False, str(vkey) + ' value is "' + str(rvalue) + '" exepcted to be one of ' + str(vvalue['values'])
-                if "min" in vvalue.keys() and rvalue<vvalue['min']:
-                    return False, str(vkey) + ' value "' + str(rvalue) + '" must be greater than ' + str(vvalue['min'])
-                if "max" in vvalue.keys() and rvalue>vvalue['max']:
-                    return False, str(vkey) + ' value "' + str(rvalue) + '" must be smaller than ' + str(vvalue['max'])
-            elif vvalue['type'] in [str]:
-                rvalue = row[vkey]
-                if "values" in vvalue.keys() and rvalue not in vvalue['values']:
-                    return False, str(vkey) + ' value is "' + str(rvalue) + '" exepcted to be one of ' + str(vvalue['values'])
-                if "min_len" in vvalue.keys() and len(rvalue)<vvalue['min_len']:
-                    return False, str(vkey) + ' value "' + str(rvalue) + '" must be longer than ' + str(vvalue['min_len']) + ' characters.'
-                if "max_len" in vvalue.keys() and len(rvalue)>vvalue['max_len']:
-                    return False, str(vkey) + ' value "' + str(rvalue) + '" must be shorter than ' + str(vvalue['max_len']) + ' characters.'
-            elif vvalue['type'] is datetime:
-                # TODO add the ability to handle things like "today" and "YYYYMMDD" time times
-                # TODO print out warning in more meaningful datetime arrangement
-                try:
-                    # Time is in seconds from epoch
-                    seconds = int(row[vkey])
-                    rvalue = datetime.fromtimestamp(seconds)
-                except:
-                     # Time is in YYYY-MM-DD HH:mm:ss format
-                     try:
-                         rvalue =  datetime.strptime(row[vkey], "%Y-%m-%d %H:%M:%S")
-                     except:
-                        return False, str(vkey) + ' value "' + str(rvalue) + '" is not in the expected format.'
-
-                if "min" in vvalue.keys() and rvalue < datetime.fromtimestamp(int(vvalue['min'])):
-                    return False, str(vkey) + ' value "' + str(rvalue) + '" must be after ' + str(vvalue['min'])
-                if "max" in vvalue.keys() and rvalue > datetime.fromtimestamp(int(vvalue['max'])):
-                    return False, str(vkey) + ' value "' + str(rvalue) + '" must be before ' + str(vvalue['max'])
+        # The checks were compiled from valid_keys when it was set
+        return self.__validator.validate(row)
 
-            else:
-                return False, "Unrecognized value type: " + str(vvalue['type'])
+    def _validate_batch(self, rows):
+        """
+        Validate a batch of rows a column at a time.
 
-        return True, ''
+        :param rows: (list of dict) - The rows to validate.
+        :return: (numpy.ndarray of bool, list of str) - Which rows are valid,
+                 and the reason each row is not valid, '' for valid rows.
+        """
+        if self.__validator is None:
+            # Nothing to do nothing to validate
+            return np.ones(len(rows), dtype=bool), [''] * len(rows)
 
-    def read_and_validate(self):
+        return self.__validator.validate_batch(rows)
+
+    def read_and_validate(self, expected_digest=None):
         """
         Read the contents of the log file and  validate each of the lines of code.
 
+        When workers is more than one the file is split into byte ranges
+        that are read and validated by separate processes.  When log_path
+        is a directory or glob pattern each log file is read by a worker,
+        the largest first, and the results of all of them are put together.
+
+        If there is a cache the data frame is loaded from it when the file
+        and valid_keys have not changed since it was stored, the warnings
+        are not printed again in this case but the counts of errors kept
+        by errors are.
+
+        The digest of the log, see checksum, is worked out in the same pass
+        as the lines are read, so checking it costs no extra read.  When
+        the cache has content_hash the frame is looked up by the expected
+        digest, or by the digest of the last read if the log has not
+        changed since, and the log is only read if it is not found.
+
+        :param expected_digest: (str) - The hex digest the log must have, of
+                                checksum, or sha256 if that is None.  If the
+                                log does not have it no results are kept.
         :return: (int) -- The number of valid rows found in the file.
+        :raises ChecksumError: When the log does not have expected_digest.
         """
+        assert expected_digest is None or not self._is_multi_file(), \
+            "Only a single log file or stream can be checked against a digest."
+        self.__decode_errors = 0
+        self.__frame_dedup = None
+        self.__digest = None
+        if self.dedup is not None:
+            self.dedup.reset()
+        self.errors.start()
+        try:
+            return self._read_and_validate(expected_digest)
+        finally:
+            self.errors.close()
 
-        my_file = MyFileIO(self.log_path)
-        data = my_file.get_file_contents()
-        del my_file
+    def _read_and_validate(self, expected_digest=None):
+        """
+        See read_and_validate(), this does the reading once errors is started.
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.reset()
+            run_started = metrics.start()
+        self.__file_results = None
+        multi_file = self._is_multi_file()
+        stream = is_stream(self.log_path)
+        use_cache = self.cache is not None and self.cache.enabled and not self.streaming and not multi_file \
+                    and not stream
+        checksum = self.checksum
+        if checksum is None and (expected_digest is not None or (use_cache and self.cache.content_hash)):
+            checksum = 'sha256'
+        if multi_file:
+            checksum = None
+        if use_cache:
+            if metrics is not None: started = metrics.start()
+            file_stat = _stat_of(self.log_path)
+            digest = expected_digest
+            if digest is None and self.cache.content_hash:
+                digest = self.cache.known_digest(self.log_path, checksum)
+            # A log with no digest yet is read, and its digest worked out
+            # then, rather than reading it once more just for the key
+            cache_key = None
+            frame = None
+            if digest is not None or not self.cache.content_hash:
+                cache_key = self._cache_key(digest, checksum)
+                frame, info = self.cache.load(cache_key)
+            if metrics is not None:
+                metrics.record('cache load', started, rows_out=0 if frame is None else len(frame))
+            if frame is not None:
+                if digest is None and info.get('checksum') == checksum:
+                    digest = info.get('digest')
+                self.__digest = digest
+                self.__decode_errors = info.get('decode_errors', 0)
+                self.errors.restore(info.get('errors', {}))
+                if self.dedup is not None:
+                    self.dedup.restore(info.get('dedup', {}))
+                num_valid = self._keep_results([frame], None, (0, None, 1))
+                if metrics is not None: metrics.record('total', run_started, rows_out=num_valid)
+                return num_valid
+
+        aggregates = self._new_aggregates() if self.streaming else None
+        log_index = None
+        if self.index and not multi_file and not stream and MyFileIO(self.log_path).compression is None:
+            log_index = LogIndex(self.log_path)
+        if multi_file:
+            frames = self._read_files(aggregates, not self.streaming)
+        elif self.workers > 1 and not stream and self.dedup is None and checksum is None:
+            frames, count = self._read_parallel(aggregates, log_index)
+        else:
+            frames, count = self._read_range(0, None, 1, self.errors.add, aggregates, not self.streaming, log_index,
+                                             dedup=self.dedup, checksum=checksum)
+        if expected_digest is not None and self.__digest != expected_digest:
+            self.__data_frame = None
+            self.__frame_range = None
+            self.__totals = None
+            raise ChecksumError("The digest of " + self.log_path + " is " + str(self.__digest) +
+                                " rather than " + expected_digest + ".")
+        if log_index is not None:
+            self._save_index(log_index, count)
+
+        num_valid = self._keep_results(frames, aggregates, (0, None, 1))
+        if use_cache:
+            if metrics is not None: started = metrics.start()
+            if self.cache.content_hash:
+                self.cache.remember_digest(self.log_path, file_stat, self.__digest, checksum)
+                cache_key = self._cache_key(self.__digest, checksum)
+            info = {'decode_errors': self.__decode_errors, 'errors': self.errors.to_dict(),
+                    'checksum': checksum, 'digest': self.__digest}
+            if self.dedup is not None:
+                info['dedup'] = self.dedup.to_dict()
+            self.cache.store(cache_key, self.__data_frame, info)
+            if metrics is not None: metrics.record('cache store', started, rows_in=num_valid)
+        if metrics is not None: metrics.record('total', run_started, rows_out=num_valid)
+        return num_valid
+
+    def _cache_key(self, digest, checksum):
+        """
+        :param digest:   (str) - The digest of the log, None to key the frame
+                         by the path, size and modification time of the log.
+        :param checksum: (str) - The checksum of the digest.
+        :return: (str) - The key of the frame of the log in the cache, for the
+                 layout and dedup settings of the frame.
+        """
+        layout = 'compact' if self.compact else 'object'
+        cache_key = self.cache.get_key(self.log_path, self._valid_keys_digest(), layout, digest, checksum)
+        if self.dedup is not None:
+            cache_key = hashlib.sha256((cache_key + json.dumps(self.dedup.settings(), sort_keys=True))
+                                       .encode('utf-8')).hexdigest()
+        return cache_key
+
+    def _aggregate_names(self):
+        """
+        :return: (list of str) - The names of the aggregates kept by streaming
+                 and incremental reads, the counts by ext and dp first.
+        """
+        return _BASE_AGGREGATES + [name for name in self.reports if name not in _BASE_AGGREGATES]
+
+    def _new_aggregates(self):
+        """
+        The aggregates kept by streaming and incremental reads, all of them
+        are filled in the same pass over the valid rows.
+
+        :return: (list) - The aggregates in the order of _aggregate_names().
+        """
+        aggregates = [CountAggregate(name) for name in _BASE_AGGREGATES]
+        for name in self._aggregate_names()[len(_BASE_AGGREGATES):]:
+            aggregates.append(self._make_report(name))
+        return aggregates
+
+    def _make_report(self, name):
+        """
+        :return: The aggregate of one of the reports, with window_emit given
+                 to the windows report.
+        """
+        aggregate = make_report(name, self.valid_keys, self.report_options)
+        if isinstance(aggregate, WindowAggregate):
+            aggregate.emit = self.window_emit
+        return aggregate
+
+    def _keep_results(self, frames, aggregates, frame_range):
+        """
+        Keep the results of a read.
+
+        :param frames:      (list of DataFrame) - The valid rows, empty for
+                            a streaming read.
+        :param aggregates:  (list) - The aggregates of the valid rows, from
+                            _new_aggregates(), None if they were not kept.
+        :param frame_range: (int, int, int) - The start and end offset and
+                            first line number of the part of the file read,
+                            used to build data_frame later for a streaming read.
+        :return: (int) -- The number of valid rows.
+        """
+        self.__totals = None
+        if aggregates is not None:
+            self.__totals = dict(zip(self._aggregate_names(), aggregates))
+            for aggregate in aggregates:
+                if isinstance(aggregate, WindowAggregate):
+                    # The whole log is read, so every window is complete
+                    aggregate.finish()
+
+        if self.streaming:
+            self.__data_frame = None
+            # A stream can not be read again for the rows
+            self.__frame_range = None if is_stream(self.log_path) else frame_range
+            return int(self.__totals['ext'].result().sum())
+
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        self.__data_frame = _concat_frames(frames)
+        self.__frame_range = None
+        if metrics is not None:
+            metrics.record('concat', started, rows_in=len(self.__data_frame), rows_out=len(self.__data_frame))
+        return len(self.__data_frame)
+
+    def read_stream(self, emit, every_lines=None, every_seconds=None):
+        """
+        Read and validate a log as it comes in, such as the standard input
+        when log_path is "-" or a named pipe, and give the results so far
+        every so many lines or seconds while it is read.
+
+        Only the aggregates of the reports are kept, never the rows, so the
+        memory used stays the same however long the stream runs, as long as
+        the reports are ones with a fixed size, such as the approximate
+        reports, and the windows are given to window_emit.  The exact
+        reports grow with the number of different values seen, most of all
+        pt_percentiles, which counts every different pt.  Results are
+        given at the end of a batch, so for results every few lines lower
+        batch_size too.  When the stream ends the results are given once
+        more, with every window finished.
+
+        :param emit:          (function) - Called with the number of lines
+                              read so far and the results, as analyze() gives them.
+        :param every_lines:   (int) - Give the results once this many lines
+                              have been read since the last time, None for never.
+        :param every_seconds: (float) - Give the results once this many seconds
+                              have passed since the last time, even if no lines
+                              came in, None for never.
+        :return: (int) -- The number of valid rows found in the stream.
+        """
+        assert callable(emit), "Invalid emit given: " + str(emit)
+        assert every_lines is None or (isinstance(every_lines, int) and every_lines > 0), \
+            "Invalid every_lines given: " + str(every_lines)
+        assert every_seconds is None or (isinstance(every_seconds, (int, float)) and every_seconds > 0), \
+            "Invalid every_seconds given: " + str(every_seconds)
+        assert not self._is_multi_file(), "Only a single log file or stream can be read as a stream."
+        metrics = self.metrics
+        if metrics is not None: metrics.reset()
+        self.__decode_errors = 0
+        self.__digest = None
+        self.__file_results = None
+        self.__data_frame = None
+        self.__frame_range = None
+        if self.dedup is not None:
+            self.dedup.reset()
+        aggregates = self._new_aggregates()
+        self.__totals = dict(zip(self._aggregate_names(), aggregates))
+        # The stream waits for lines on the same clock, so the results are
+        # given on time even when no lines come in
+        due = {'lines': every_lines, 'time': None if every_seconds is None else time.time() + every_seconds}
+
+        def on_batch(count):
+            now = time.time()
+            if (due['lines'] is not None and count >= due['lines']) or \
+               (due['time'] is not None and now >= due['time']):
+                if due['lines'] is not None:
+                    due['lines'] = count + every_lines
+                if due['time'] is not None:
+                    due['time'] = max(due['time'] + every_seconds, now)
+                emit(count, self.analyze())
+
+        self.errors.start()
+        try:
+            frames, count = self._read_range(0, None, 1, self.errors.add, aggregates, False,
+                                             on_batch=on_batch, max_wait=every_seconds, dedup=self.dedup,
+                                             checksum=self.checksum)
+        finally:
+            self.errors.close()
+        for aggregate in aggregates:
+            if isinstance(aggregate, WindowAggregate):
+                aggregate.finish()
+        emit(count, self.analyze())
+        return int(self.__totals['ext'].result().sum())
+
+    def export(self, writer):
+        """
+        Read and validate the log and write the valid rows out as they are
+        read, a batch at a time, so that the rows are never all in memory.
+        With dedup the rows already seen are not written.  Nothing is kept
+        but the warnings, data_frame and the results are left as they were.
+
+        :param writer: (PartitionedWriter) - Where the rows go, it is flushed
+                       once the log is read but not closed.
+        :return: (int) -- The number of rows written.
+        """
+        assert isinstance(writer, PartitionedWriter), "Invalid writer given: " + str(writer)
+        metrics = self.metrics
+        if metrics is not None: metrics.reset()
+        self.__decode_errors = 0
+        self.__digest = None
+        if self.dedup is not None:
+            self.dedup.reset()
+        rows_before = writer.rows_written
+        log_files = self.log_files if self._is_multi_file() else [self.log_path]
+        assert len(log_files) > 0, "No log files found for: " + str(self.log_path)
+
+        self.errors.start()
+        try:
+            for path in log_files:
+                if path == self.log_path:
+                    reader = self
+                    warn = self.errors.add
+                else:
+                    settings = dict(self._settings(), log_path=path, dedup=None)
+                    valid_keys = settings.pop('valid_keys')
+                    reader = LogFileAnalyzer(**settings)
+                    reader.valid_keys = valid_keys
+                    warn = lambda warnings, path=path: self.errors.add(warnings, source=path)
+                reader._read_range(0, None, 1, warn, keep_frames=False, dedup=self.dedup, writer=writer,
+                                   checksum=self.checksum if reader is self else None)
+                if reader is not self:
+                    self.__decode_errors += reader.decode_errors
+                    if metrics is not None:
+                        metrics.merge(reader.metrics)
+            writer.flush()
+        finally:
+            self.errors.close()
+        return writer.rows_written - rows_before
+
+    def read_sample(self, fraction=0.01, num_lines=10000, seed=0, method=None, block_size=64*1024):
+        """
+        Read and validate a part of the log picked at random, for quick
+        estimates of what is in a log too big to read, see the Sampling
+        module.  The estimates, such as sample.estimate("ext") for the
+        counts of show_file_type_counts(), are scaled up to the whole log
+        and have confidence intervals.
+
+        A plain log file is sampled by offsets, only a fraction of its
+        blocks of block_size bytes are read.  A stream or a compressed file
+        can only be read from the start, so a reservoir of num_lines of its
+        lines is kept while it is read and only those are validated.  The
+        warnings of a block are given with its byte offset and the line
+        numbers in the block.
+
+        data_frame and the results of a read are left as they were.
+
+        :param fraction:   (float) - Share of the blocks read by offsets.
+        :param num_lines:  (int) - Number of lines in the reservoir.
+        :param seed:       (int) - Seed of the random picks, the same seed
+                           picks the same lines of the same log.
+        :param method:     (str) - "offsets" or "reservoir", default is
+                           offsets for a plain log file.
+        :param block_size: (int) - Bytes in a block of the offsets method.
+        :return: (int) -- The number of valid rows in the sample.
+        """
+        assert not self._is_multi_file(), "Only a single log file or stream can be sampled."
+        my_file = MyFileIO(self.log_path, metrics=self.metrics)
+        if method is None:
+            method = 'reservoir' if my_file.is_stream or my_file.compression is not None else 'offsets'
+        assert method in ['offsets', 'reservoir'], "Invalid method given: " + str(method)
+        metrics = self.metrics
+        if metrics is not None: metrics.reset()
+        self.__decode_errors = 0
+        self.__digest = None
+        self.errors.start()
+        try:
+            if method == 'offsets':
+                assert not my_file.is_stream and my_file.compression is None, \
+                    "Only a plain log file can be sampled by offsets."
+                num_blocks, blocks = pick_blocks(my_file.file_size, fraction, block_size, seed)
+                frames = []
+                clusters = []
+                lines_read = 0
+                for block in blocks:
+                    start = my_file.get_line_start(int(block) * block_size)
+                    end = (int(block) + 1) * block_size
+                    if start >= end:
+                        continue   # No line starts in it, a long line goes right through it
+                    source = self.log_path + ' from byte ' + str(start)
+                    block_frames, count = self._read_range(start, end, 1,
+                                                           lambda warnings: self.errors.add(warnings, source=source))
+                    lines_read += count
+                    frames += block_frames
+                    clusters += [np.full(len(frame), block, dtype='int64') for frame in block_frames]
+                clusters = np.concatenate(clusters) if len(clusters) > 0 else np.zeros(0, dtype='int64')
+                sample = LogSample(method, seed, _concat_frames(frames), clusters, num_blocks, len(blocks), lines_read)
+            else:
+                reservoir = Reservoir(num_lines, seed)
+                if metrics is not None: started = metrics.start()
+                for batch in my_file.iter_batches(self.batch_size):
+                    reservoir.add(batch)
+                if metrics is not None:
+                    metrics.record('sample', started, rows_in=reservoir.count, rows_out=len(reservoir.lines))
+                lines = reservoir.lines
+                line_nos = reservoir.line_nos
+                warn = lambda warnings: self.errors.add([(line_nos[line_no - 1], stage, err, raw)
+                                                         for line_no, stage, err, raw in warnings])
+                batches = [lines[first:first + self.batch_size] for first in range(0, len(lines), self.batch_size)]
+                frames, count = self._read_range(0, None, 1, warn, batches=batches)
+                # Each line is a cluster of its own, of one valid row or none
+                frame = _concat_frames(frames)
+                sample = LogSample(method, seed, frame, np.arange(len(frame)), reservoir.count, len(lines), count)
+        finally:
+            self.errors.close()
+        self.__sample = sample
+        return len(sample.frame)
+
+    def _read_range(self, start, end, first_line, warn, aggregates=None, keep_frames=True, log_index=None,
+                    on_batch=None, max_wait=None, dedup=None, writer=None, batches=None, checksum=None):
+        """
+        Read and validate the lines in a byte range of the log file.
+
+        :param start:      (int) - Byte offset of the first line to read.
+        :param end:        (int) - Byte offset to stop at, None for the end of the file.
+        :param first_line: (int) - Line number of the line at start.
+        :param warn:       (function) - Called with a list of (line number, stage,
+                           error message, raw line) for the lines in each batch
+                           that are not valid, see ErrorCollector.add().
+        :param aggregates: (list) - Aggregates to add the valid rows to.
+        :param keep_frames: (bool) - Whether to keep the valid rows.
+        :param log_index:  (LogIndex) - Index to add the valid rows to.
+        :param on_batch:   (function) - Called with the number of lines read
+                           so far at the end of each batch.
+        :param max_wait:   (float) - For a stream, the most seconds to wait for
+                           a batch, see MyFileIO.iter_batches().
+        :param dedup:      (Deduplicator) - Skips the valid rows it has seen, after
+                           they are indexed, so the index has every row.
+        :param writer:     (PartitionedWriter) - Writes out the valid rows of each batch.
+        :param batches:    (list of list of str) - Batches of lines to read rather
+                           than those of the file, such as a sample of it.
+        :param checksum:   (str) - Name of a checksum of the bytes read, kept
+                           as digest when the whole file is read.
+        :return: (list of DataFrame, int) - The valid rows, a data frame per
+                 batch, and the number of lines read.
+        """
+        metrics = self.metrics
+        my_file = MyFileIO(self.log_path, metrics=metrics, checksum=checksum)
 
         count = 0
-        valid_entries=[]
-        for line in data:
-            count += 1
-            if len(line)==0: continue  # Skip blank lines
-            line = eval(line)
+        frames = []
+        if metrics is not None: metrics.enable_profiler()
+        if batches is None:
+            batches = my_file.iter_batches(self.batch_size, start, end, max_wait)
+        for batch in batches:
+            if metrics is not None: started = metrics.start()
+            batch_first = first_line + count
+            rows, failures = self.decoder.decode_batch(batch, first_line=batch_first)
+            count += len(batch)
+            if metrics is not None: metrics.record('parse', started, rows_in=len(batch), rows_out=len(rows))
 
-            # If the name and path are the same set the path to "."
-            # as it's assumed to be in the current directory
-            if line['nm'] == line['ph']:
-                line['ph'] = '.'
+            warnings = [(line_no, 'decode', err, batch[line_no - batch_first]) for line_no, err in failures]
+            self.__decode_errors += len(failures)
+
+            if metrics is not None: started = metrics.start()
+            for line_no, line in rows:
+                # If the name and path are the same set the path to "."
+                # as it's assumed to be in the current directory
+                if 'nm' in line and line['nm'] == line.get('ph'):
+                    line['ph'] = '.'
 
             # Validate the contents
-            ok, err = self._validate_row(line)
-            if not ok:
-                print('WARNING: line ' + str(count) + ' has failed with ' + err)
-                continue
+            if self.validation_mode == 'batch':
+                valid, reasons = self._validate_batch([line for line_no, line in rows])
+            else:
+                checked = [self._validate_row(line) for line_no, line in rows]
+                valid = [ok for ok, err in checked]
+                reasons = [err for ok, err in checked]
+            if metrics is not None:
+                metrics.record('validate', started, rows_in=len(rows), rows_out=int(sum(valid)))
+                started = metrics.start()
 
-            # Find the file extension
-            filename = line['nm']
-            root, ext = os.path.splitext(line['nm'])
-            line['ext']=ext[1:]
+            normalize = self.__normalize
+            valid_entries = []
+            for (line_no, line), ok, err in zip(rows, valid, reasons):
+                if not ok:
+                    warnings.append((line_no, 'validate', err, batch[line_no - batch_first]))
+                    continue
 
-            # If we've reached her line is valid
-            valid_entries.append(line)
+                # Find the file extension
+                root, ext = os.path.splitext(line['nm'])
+                line['ext']=ext[1:]
+                if normalize is not None:
+                    epoch = normalize(line['ts'])
+                    line['epoch'] = -1 if epoch is None else epoch
 
-        
-        self.__data_frame = pd.DataFrame(valid_entries)
-        return len(self.__data_frame)
+                # If we've reached her line is valid
+                valid_entries.append(line)
+            if metrics is not None: metrics.record('extension', started, rows_in=len(rows), rows_out=len(valid_entries))
+
+            warn(sorted(warnings, key=lambda warning: warning[0]))
+
+            if log_index is not None or dedup is not None:
+                line_nos = [line_no for (line_no, line), ok in zip(rows, valid) if ok]
+            if log_index is not None:
+                if metrics is not None: started = metrics.start()
+                log_index.add_rows(line_nos, valid_entries)
+                if metrics is not None:
+                    metrics.record('index', started, rows_in=len(valid_entries), rows_out=len(valid_entries))
+
+            if dedup is not None and len(valid_entries) > 0:
+                if metrics is not None: started = metrics.start()
+                duplicate = dedup.check(valid_entries, [batch[line_no - batch_first] for line_no in line_nos], line_nos)
+                valid_entries = [line for line, is_duplicate in zip(valid_entries, duplicate) if not is_duplicate]
+                if metrics is not None:
+                    metrics.record('dedup', started, rows_in=len(duplicate), rows_out=len(valid_entries))
+
+            if metrics is not None and aggregates: started = metrics.start()
+            for aggregate in aggregates or []:
+                aggregate.add_rows(valid_entries)
+            if metrics is not None and aggregates:
+                metrics.record('aggregate', started, rows_in=len(valid_entries), rows_out=len(valid_entries))
+
+            if writer is not None:
+                if metrics is not None: started = metrics.start()
+                writer.write_rows(valid_entries)
+                if metrics is not None:
+                    metrics.record('export', started, rows_in=len(valid_entries), rows_out=len(valid_entries))
+
+            # Only the current batch is held as dicts, the rest is
+            # already packed into data frames.
+            if keep_frames and len(valid_entries) > 0:
+                if metrics is not None: started = metrics.start()
+                frame = pd.DataFrame(valid_entries)
+                if self.compact:
+                    frame = compact_frame(frame)
+                frames.append(frame)
+                if metrics is not None:
+                    metrics.record('data frame', started, rows_in=len(valid_entries), rows_out=len(frame))
+
+            if on_batch is not None:
+                on_batch(count)
+        if metrics is not None: metrics.disable_profiler()
+        if checksum is not None:
+            self.__digest = my_file.digest
+        del my_file
+
+        return frames, count
+
+    def _settings(self):
+        """
+        The settings needed to make a copy of this analyzer in another
+        process, the data frame and results are not included.
+
+        :return: (dict) - Keyword arguments for LogFileAnalyzer().
+        """
+        return {'log_path': self.log_path,
+                'valid_keys': self.valid_keys,
+                'batch_size': self.batch_size,
+                'validation_mode': self.validation_mode,
+                'streaming': self.streaming,
+                'compact': self.compact,
+                'reports': self.reports,
+                'report_options': self.report_options,
+                'dedup': self.dedup,
+                'metrics': None if self.metrics is None else Metrics(),
+                'decoder': JsonDecoder(getattr(self.decoder, 'backend', None))}
+
+    def _read_parallel(self, aggregates=None, log_index=None):
+        """
+        Read and validate the log file with a pool of worker processes,
+        each one taking a byte range of the file.
+
+        The warnings are printed once all of the ranges are done, with the
+        line numbers of the whole file.  The metrics of the workers are
+        added together, so their seconds are the time spent by all of the
+        workers, and the "workers" stage has the wall time.
+
+        :param aggregates: (list) - Aggregates to merge the aggregates of
+                           each range into.
+        :param log_index:  (LogIndex) - Index to merge the index of each range into.
+        :return: (list of DataFrame, int) - The valid rows in file order, and
+                 the number of lines read.
+        """
+        my_file = MyFileIO(self.log_path)
+        ranges = my_file.get_line_ranges(self.workers)
+        del my_file
+
+        settings = self._settings()
+        tasks = [(settings, start, end, aggregates is not None, log_index is not None) for start, end in ranges]
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        pool = multiprocessing.Pool(min(self.workers, len(tasks)))
+        try:
+            results = pool.map(_read_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+        if metrics is not None: metrics.record('workers', started, rows_in=len(tasks), rows_out=len(tasks))
+
+        # Line numbers from the workers start at 1 for each range
+        frames = []
+        offset = 0
+        for shard_frames, warnings, count, decode_errors, shard_aggregates, shard_metrics, shard_index in results:
+            self.errors.add([(line_no + offset, stage, err, raw) for line_no, stage, err, raw in warnings])
+            self.__decode_errors += decode_errors
+            frames += shard_frames
+            if log_index is not None:
+                log_index.merge(shard_index, offset)
+            offset += count
+            for aggregate, shard_aggregate in zip(aggregates or [], shard_aggregates):
+                aggregate.merge(shard_aggregate)
+            if metrics is not None:
+                metrics.merge(shard_metrics)
+        return frames, offset
+
+    def _is_multi_file(self):
+        """
+        :return: (bool) - Whether log_path is a directory or glob pattern
+                 rather than a single log file.
+        """
+        return self.log_path is not None and not os.path.isfile(self.log_path) and not is_stream(self.log_path)
+
+    def _read_files(self, aggregates=None, keep_frames=True, warn=True):
+        """
+        Read and validate each of the log_files, with a pool of worker
+        processes when workers is more than one.
+
+        The files are handed out largest first, so that a big file is not
+        left to last to keep one worker busy after the others are done.
+        With dedup they are read one after the other in this process, in
+        file order, so a row is a duplicate of rows of the files before it.
+        The warnings are given to errors once all of the files are read,
+        in file order, with the path of the file.
+
+        :param aggregates:  (list) - Aggregates to merge the aggregates of
+                            each file into.
+        :param keep_frames: (bool) - Whether to keep the valid rows.
+        :param warn:        (bool) - Whether to give the warnings to errors.
+        :return: (list of DataFrame) - The valid rows in file order.
+        """
+        log_files = self.log_files
+        assert len(log_files) > 0, "No log files found for: " + str(self.log_path)
+        sizes = [os.path.getsize(path) for path in log_files]
+        order = sorted(range(len(log_files)), key=lambda index: -sizes[index])
+        if self.dedup is not None:
+            order = list(range(len(log_files)))
+
+        settings = self._settings()
+        settings['streaming'] = not keep_frames
+        tasks = [(dict(settings, log_path=log_files[index]), 0, None, aggregates is not None, False) for index in order]
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        if self.workers > 1 and len(tasks) > 1 and self.dedup is None:
+            pool = multiprocessing.Pool(min(self.workers, len(tasks)))
+            try:
+                # One file at a time so the next free worker takes the next largest
+                results = pool.map(_read_shard, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_read_shard(task) for task in tasks]
+        if metrics is not None: metrics.record('workers', started, rows_in=len(tasks), rows_out=len(tasks))
+
+        by_file = [None] * len(log_files)
+        for index, result in zip(order, results):
+            by_file[index] = result
+
+        frames = []
+        self.__file_results = {}
+        for path, result in zip(log_files, by_file):
+            file_frames, warnings, count, decode_errors, file_aggregates, file_metrics, file_index = result
+            if warn:
+                self.errors.add(warnings, source=path)
+            self.__decode_errors += decode_errors
+            frames += file_frames
+            if keep_frames:
+                num_valid = sum(len(frame) for frame in file_frames)
+            else:
+                num_valid = int(file_aggregates[0].result().sum())
+            self.__file_results[path] = {'lines': count, 'valid': num_valid, 'failed': len(warnings)}
+            for aggregate, file_aggregate in zip(aggregates or [], file_aggregates):
+                aggregate.merge(file_aggregate)
+            if metrics is not None:
+                metrics.merge(file_metrics)
+        return frames
+
+    def read_incremental(self, checkpoint_path=None):
+        """
+        Read and validate only the lines added to the log file since the
+        last call, for logs that are only ever appended to.
+
+        A checkpoint file keeps how far the log was read, what file it was
+        and the counts of the rows read so far.  If the log has been rotated,
+        truncated or replaced, or valid_keys has changed, it is read again
+        from the start.  A last line without a newline is left for the next
+        call as it may still be being written.
+
+        Afterwards data_frame has only the new rows, show_file_type_counts()
+        and analyze() have the results for the whole log.  When reports or
+        report_options are changed the log is read again from the start, so
+        that they do too.  The rows seen by dedup are kept in a file next to
+        the checkpoint, so a new row is a duplicate of rows of any earlier
+        call.
+
+        :param checkpoint_path: (str) - Where to keep the checkpoint, default
+                                is the log path with .checkpoint added.
+        :return: (int) -- The number of new valid rows found in the file.
+        """
+        assert not self._is_multi_file(), "Only a single log file can be read incrementally."
+        assert not is_stream(self.log_path), "A stream can not be read incrementally."
+        if checkpoint_path is None:
+            checkpoint_path = self.log_path + '.checkpoint'
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.reset()
+            run_started = metrics.start()
+        my_file = MyFileIO(self.log_path)
+        assert my_file.compression is None, "Compressed logs can not be read incrementally."
+
+        self.__decode_errors = 0
+        self.__digest = None
+        frames, count = [], 0
+        self.errors.start()
+        try:
+            state = self._load_checkpoint(checkpoint_path, my_file)
+            if state is None:
+                state = {'offset': 0, 'lines': 0, 'valid_rows': 0, 'decode_errors': 0,
+                         'aggregates': [aggregate.to_dict() for aggregate in self._new_aggregates()]}
+            self.__frame_dedup = None
+            saved_seen = None
+            if self.dedup is not None:
+                if state.get('dedup') is None:
+                    self.dedup.reset()
+                else:
+                    saved_seen = state['dedup']['seen']
+                    self.dedup.load_state(state['dedup'])
+                    self.dedup.load_seen(self._dedup_path(checkpoint_path, saved_seen), saved_seen['size'])
+                if self.streaming:
+                    # data_frame reads the new lines again from here
+                    self.__frame_dedup = copy.deepcopy(self.dedup)
+            # The new rows go straight into the aggregates of the earlier
+            # reads, so a window that spans two reads is only emitted once
+            # it is complete, and then only once
+            totals = [aggregate_from_dict(data) for data in state['aggregates']]
+            for aggregate in totals:
+                if isinstance(aggregate, WindowAggregate):
+                    aggregate.emit = self.window_emit
+            valid_before = int(totals[0].result().sum())
+
+            end = my_file.get_last_line_end(state['offset'])
+            if end > state['offset']:
+                frames, count = self._read_range(state['offset'], end, state['lines'] + 1, self.errors.add,
+                                                 totals, not self.streaming, dedup=self.dedup)
+        finally:
+            self.errors.close()
+        num_new = int(totals[0].result().sum()) - valid_before
+        self.__totals = dict(zip(self._aggregate_names(), totals))
+
+        if self.streaming:
+            self.__data_frame = None
+            self.__frame_range = (state['offset'], end, state['lines'] + 1)
+        else:
+            self.__data_frame = _concat_frames(frames)
+            self.__frame_range = None
+
+        head_bytes = min(end, 4096)
+        state = {'version': _CHECKPOINT_VERSION,
+                 'file_id': list(my_file.file_id),
+                 'offset': end,
+                 'lines': state['lines'] + count,
+                 'head_bytes': head_bytes,
+                 'head_digest': my_file.get_head_digest(head_bytes),
+                 'valid_keys': self._valid_keys_digest(),
+                 'reports': self._aggregate_names(),
+                 'report_options': self.report_options,
+                 'valid_rows': state['valid_rows'] + num_new,
+                 'decode_errors': state['decode_errors'] + self.__decode_errors,
+                 'aggregates': [aggregate.to_dict() for aggregate in totals],
+                 'dedup': None if self.dedup is None else self._save_dedup(checkpoint_path, saved_seen)}
+        tmp_path = checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(state, fp)
+        os.replace(tmp_path, checkpoint_path)
+
+        # The rows seen that the checkpoint no longer refers to
+        keep = None if state['dedup'] is None else self._dedup_path(checkpoint_path, state['dedup']['seen'])
+        for path in glob.glob(glob.escape(checkpoint_path) + '.*.dedup'):
+            if path != keep:
+                os.remove(path)
+
+        if metrics is not None: metrics.record('total', run_started, rows_out=num_new)
+        return num_new
+
+    def _load_checkpoint(self, checkpoint_path, my_file):
+        """
+        Load the checkpoint of an earlier read_incremental() if it is for
+        the log file as it is now.
+
+        :return: (dict) - The checkpoint, None if the log should be read
+                 from the start.
+        """
+        if not os.path.exists(checkpoint_path):
+            return None
+        with open(checkpoint_path, 'r') as fp:
+            state = json.load(fp)
+
+        if state.get('version') != _CHECKPOINT_VERSION or state['valid_keys'] != self._valid_keys_digest():
+            return None
+        if state.get('reports', _BASE_AGGREGATES) != self._aggregate_names() or \
+           state.get('report_options', {}) != self.report_options:
+            return None
+        if (state.get('dedup') or {}).get('settings') != (None if self.dedup is None else self.dedup.settings()):
+            return None
+        if state.get('dedup') is not None and not os.path.exists(self._dedup_path(checkpoint_path, state['dedup']['seen'])):
+            return None
+        if tuple(state['file_id']) != tuple(my_file.file_id) or my_file.file_size < state['offset'] \
+           or my_file.get_head_digest(state['head_bytes']) != state['head_digest']:
+            self.errors.notice(str(self.log_path) + ' was rotated or truncated, reading it from the start.')
+            return None
+        return state
+
+    def _save_dedup(self, checkpoint_path, saved_seen):
+        """
+        Write the rows seen by dedup to a file next to the checkpoint, only
+        if there are new ones.  They are added to the file loaded when dedup
+        can do that, otherwise written to a new file, so the file of the
+        checkpoint as it was stays whole until the new one replaces it.
+
+        :param checkpoint_path: (str) - Where the checkpoint is kept.
+        :param saved_seen:      (dict) - The file of the rows seen that were
+                                loaded, None if they were not.
+        :return: (dict) - The state of dedup for the checkpoint, with the
+                 file, its number and size, of the rows seen.
+        """
+        dedup = self.dedup
+        state = dedup.save_state()
+        if saved_seen is not None and not dedup.changed:
+            state['seen'] = saved_seen
+        elif saved_seen is not None and dedup.appends:
+            size = dedup.save_seen(self._dedup_path(checkpoint_path, saved_seen), saved_seen['size'])
+            state['seen'] = dict(saved_seen, size=size)
+        else:
+            numbers = [path[len(checkpoint_path) + 1:-len('.dedup')]
+                       for path in glob.glob(glob.escape(checkpoint_path) + '.*.dedup')]
+            numbers = [int(number) for number in numbers if number.isdigit()]
+            seen = {'number': max(numbers) + 1 if len(numbers) > 0 else 0}
+            seen['size'] = dedup.save_seen(self._dedup_path(checkpoint_path, seen))
+            state['seen'] = seen
+        return state
+
+    @staticmethod
+    def _dedup_path(checkpoint_path, seen):
+        """
+        :return: (str) - The path to the file of rows seen of a checkpoint.
+        """
+        return checkpoint_path + '.' + str(seen['number']) + '.dedup'
+
+    def _save_index(self, log_index, count):
+        """
+        Finish and save the index built by a read of the whole log.
+
+        :param log_index: (LogIndex) - The index.
+        :param count:     (int) - Number of lines read.
+        """
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        my_file = MyFileIO(self.log_path)
+        end = my_file.get_last_line_end(0)
+        if end < my_file.file_size:
+            # The last line has no newline yet, it is read again when the
+            # index is extended so is left out of the count.
+            count -= 1
+        log_index.finish(my_file, count, end, self._valid_keys_digest())
+        log_index.save()
+        if metrics is not None: metrics.record('index', started, rows_out=log_index.rows)
+
+    def _load_index(self, my_file):
+        """
+        Load the index of the log, building it if there is none or it is for
+        another version of the log, and extending it if lines were added.
+
+        :param my_file: (MyFileIO) - The log file.
+        :return: (LogIndex)
+        """
+        digest = self._valid_keys_digest()
+        log_index = LogIndex.load(self.log_path)
+        status = 'stale' if log_index is None else log_index.status(my_file, digest)
+        if status == 'current':
+            return log_index
+        if status == 'stale':
+            log_index = LogIndex(self.log_path)
+        start, first_line = log_index.end, log_index.lines + 1
+
+        end = my_file.get_last_line_end(start)
+        decode_errors = self.__decode_errors
+        frames, count = self._read_range(start, end, first_line, lambda warnings: None, None, False, log_index)
+        self.__decode_errors = decode_errors
+        log_index.finish(my_file, log_index.lines + count, end, digest, first_line, start)
+        log_index.save()
+        return log_index
+
+    def query(self, sha=None, uu=None, si=None, start=None, end=None):
+        """
+        Find the valid rows with the given sha, user and session, and ts
+        from start up to end, only reading the lines that may have them.
+
+        The sidecar index of the log is used, it is built first if there is
+        none, extended if lines were added to the log and built again if
+        the log was rotated or replaced.
+
+        :param sha:   (str) - The sha256 of the file.
+        :param uu:    (str) - The user UUID.
+        :param si:    (str) - The session ID.
+        :param start: The earliest ts, in either ts format or a datetime.
+        :param end:   The ts to stop before, in either ts format or a datetime.
+        :return: (DataFrame) - The rows that match all of the values given,
+                 indexed by their line number.
+        """
+        assert not self._is_multi_file(), "Only a single log file can be queried."
+        assert not is_stream(self.log_path), "A stream can not be queried."
+        values = {'sha': sha, 'uu': uu, 'si': si}
+        assert any(value is not None for value in values.values()) or start is not None or end is not None, \
+            "Please give a value or a time to query for."
+        my_file = MyFileIO(self.log_path)
+        assert my_file.compression is None, "Compressed logs can not be queried."
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
+        log_index = self._load_index(my_file)
+
+        start = None if start is None else parse_epoch(start)
+        end = None if end is None else parse_epoch(end)
+        candidates = None
+        for key in INDEX_KEYS:
+            if values[key] is not None:
+                lines = np.unique(log_index.lookup(key, values[key]))
+                candidates = lines if candidates is None else np.intersect1d(candidates, lines)
+        if start is not None or end is not None:
+            lines = np.unique(log_index.lookup_range(start, end))
+            candidates = lines if candidates is None else np.intersect1d(candidates, lines)
+
+        found = []
+        line_nos = []
+        for offset, first_line, wanted in log_index.locate(candidates):
+            lines = my_file.read_lines(offset, wanted[-1] - first_line + 1)
+            rows, failures = self.decoder.decode_batch([lines[line_no - first_line] for line_no in wanted], 0)
+            for position, row in rows:
+                if 'nm' in row and row['nm'] == row.get('ph'):
+                    row['ph'] = '.'
+                if not self._validate_row(row)[0]:
+                    continue
+                # The index only has hashes and buckets, so check the values
+                if any(value is not None and row[key] != value for key, value in values.items()):
+                    continue
+                epoch = parse_epoch(row['ts'])
+                if (start is not None and epoch < start) or (end is not None and epoch >= end):
+                    continue
+                row['ext'] = os.path.splitext(row['nm'])[1][1:]
+                if self.__normalize is not None:
+                    row['epoch'] = epoch
+                found.append(row)
+                line_nos.append(wanted[position])
+
+        frame = pd.DataFrame(found, index=pd.Index(line_nos, name='line', dtype='int64'))
+        if self.compact and len(frame) > 0:
+            frame = compact_frame(frame)
+        if metrics is not None: metrics.record('query', started, rows_in=len(candidates), rows_out=len(frame))
+        return frame
+
+    def _valid_keys_digest(self):
+        """
+        A digest of valid_keys, so results kept from an earlier run can be
+        thrown away when the keys have changed.
+
+        :return: (str) - The hex digest.
+        """
+        return hashlib.sha256(repr(self.valid_keys).encode('utf-8')).hexdigest()
+
+    def memory_per_row(self):
+        """
+        The memory used by the data frame for each valid row.
+
+        Note that read_and_validate() must be called before this method
+        can be called.
+
+        :return: (float) - Bytes per row.
+        """
+        assert self.data_frame is not None, "Please call method read_and_validate() first."
+        return memory_per_row(self.data_frame)
 
     def show_file_type_counts(self):
         """
@@ -197,11 +1387,124 @@ class LogFileAnalyzer(object):
         Note that read_and_validate() must be called before this method
         can be called.
         """
+        if self.__totals is not None:
+            return self.__totals['ext'].result()
         assert self.__data_frame is not None, "Please call method read_and_validate() first."
 
         # Use the pandas dataframe to do the counts
+        metrics = self.metrics
+        if metrics is not None: started = metrics.start()
         tmp = self.__data_frame.groupby(['ext']).size()
+        if metrics is not None:
+            metrics.record('type counts', started, rows_in=len(self.__data_frame), rows_out=len(tmp))
         return tmp
 
+    def show_disposition_counts(self):
+        """
+        The number of files found with each disposition in the log file.
+
+        Note that read_and_validate() must be called before this method
+        can be called.
+        """
+        if self.__totals is not None:
+            return self.__totals['dp'].result()
+        assert self.__data_frame is not None, "Please call method read_and_validate() first."
+
+        return self.__data_frame.groupby(['dp']).size()
+
+    def analyze(self, reports=None):
+        """
+        Work out several reports on the valid rows together.
+
+        The aggregates kept by a streaming or incremental read are used as
+        they are, the rest are filled in one vectorized pass over each
+        column of the data frame that they need.
+
+        Note that read_and_validate() must be called before this method
+        can be called.
+
+        :param reports: (list of str) - Names of the reports, see REPORTS in
+                        the Aggregates module, default is the reports attribute.
+        :return: (OrderedDict) - Report name to its result, a pandas Series, or a
+                 DataFrame for the windows report.
+        """
+        if reports is None:
+            reports = self.reports
+        assert all(name in REPORTS for name in reports), "Invalid reports given: " + str(reports)
+        totals = dict(self.__totals or {})
+
+        missing = [name for name in reports if name not in totals]
+        if len(missing) > 0:
+            frame = self.data_frame
+            assert frame is not None, "Please call method read_and_validate() first."
+            metrics = self.metrics
+            if metrics is not None: started = metrics.start()
+            for name in missing:
+                totals[name] = self._make_report(name)
+                totals[name].add_frame(frame)
+                if isinstance(totals[name], WindowAggregate):
+                    totals[name].finish()
+            if metrics is not None: metrics.record('analyze', started, rows_in=len(frame), rows_out=len(missing))
+
+        return OrderedDict((name, totals[name].result()) for name in reports)
+
 
 
+
+
+def _find_log_files(log_path):
+    """
+    Find the log files for a log path.
+
+    :param log_path: (str) - A log file, a directory of log files or a glob
+                     pattern.  Directories are searched all of the way down.
+    :return: (list of str) - The log files in sorted order.
+    """
+    if log_path is None:
+        return []
+    if os.path.isfile(log_path) or is_stream(log_path):
+        return [log_path]
+    if os.path.isdir(log_path):
+        found = []
+        for root, dirs, names in os.walk(log_path):
+            dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+            for name in sorted(names):
+                if name.startswith('.') or name.endswith(_SKIP_SUFFIXES): continue
+                found.append(os.path.join(root, name))
+        return found
+    return sorted(path for path in glob.glob(log_path, recursive=True) if os.path.isfile(path))
+
+def _concat_frames(frames):
+    """
+    Put the data frames of each batch together into one.
+
+    :param frames: (list of DataFrame)
+    :return: (DataFrame)
+    """
+    if len(frames) == 0:
+        return pd.DataFrame([])
+    return pd.concat(align_frames(frames), ignore_index=True)
+
+def _read_shard(task):
+    """
+    Read and validate a byte range of a log file in a worker process.
+
+    :param task: (dict, int, int, bool, bool) - The analyzer settings, the start
+                 and end offsets of the range, whether to keep aggregates and
+                 whether to index the rows.
+    :return: (list of DataFrame, list of (int, str), int, int, list, Metrics, LogIndex) -
+             The valid rows, the warnings, the number of lines, the number of
+             lines that could not be decoded, the aggregates, the metrics and
+             the index, None if the rows were not indexed.
+    """
+    settings, start, end, with_aggregates, with_index = task
+    settings = dict(settings)
+    valid_keys = settings.pop('valid_keys')
+    analyzer = LogFileAnalyzer(**settings)
+    analyzer.valid_keys = valid_keys   # None means no validation here, not the default keys
+    warnings = []
+    aggregates = analyzer._new_aggregates() if with_aggregates else []
+    log_index = LogIndex(analyzer.log_path) if with_index else None
+    frames, count = analyzer._read_range(start, end, 1, warnings.extend, aggregates, not analyzer.streaming,
+                                         log_index, dedup=analyzer.dedup)
+    return frames, warnings, count, analyzer.decode_errors, aggregates, analyzer.metrics, log_index
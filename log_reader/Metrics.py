@@ -0,0 +1,184 @@
+"""
+Module: Metrics
+
+Description:
+
+This module keeps measurements of each stage of reading a log file: the
+wall time, the number of rows that went in and came out, the bytes read
+and the peak memory of the process.  The file reader and the analyzer
+record into a Metrics object when they are given one, and do nothing
+extra when they are not.  The hot loop can also be run under cProfile.
+"""
+
+import io
+import sys
+import time
+import cProfile
+import pstats
+from collections import OrderedDict
+try:
+    import resource
+except ImportError:
+    resource = None   # Not on Windows, peak memory is not kept there
+
+
+def peak_rss():
+    """
+    The peak resident memory of this process.
+
+    :return: (int) - Bytes, 0 if it is not known on this system.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Metrics(object):
+    """
+    Per-stage measurements of a run.
+
+    Each stage has:
+      - seconds:  Wall time spent in the stage.
+      - calls:    Number of times the stage was recorded, usually once a batch.
+      - rows_in:  Number of rows, or lines, given to the stage.
+      - rows_out: Number of rows that came out of the stage.
+      - bytes:    Number of bytes read.
+      - peak_rss: Peak memory of the process, in bytes, by the end of the stage.
+
+    Attributes:
+      - profile:  Whether the hot loop is run under cProfile, see profile_stats().
+      - stages:   OrderedDict of stage name to a dict of the values above,
+                  in the order they were first recorded.
+    """
+
+    @property
+    def profile(self):
+        return self.__profile
+    @profile.setter
+    def profile(self, value):
+        assert isinstance(value, bool), "Invalid profile value given: " + str(value)
+        self.__profile = value
+
+    @property
+    def stages(self):
+        return self.__stages
+
+    @property
+    def profiler(self):
+        return self.__profiler
+
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        self.__stages = OrderedDict()
+        self.__profiler = cProfile.Profile() if self.profile else None
+
+    def start(self):
+        """
+        :return: (float) - The time to give to record() when the stage ends.
+        """
+        return time.perf_counter()
+
+    def record(self, stage, started, rows_in=0, rows_out=0, num_bytes=0):
+        """
+        Record a stage that has just ended.
+
+        :param stage:     (str) - Name of the stage.
+        :param started:   (float) - What start() gave when the stage began.
+        :param rows_in:   (int) - Number of rows given to the stage.
+        :param rows_out:  (int) - Number of rows that came out of it.
+        :param num_bytes: (int) - Number of bytes read.
+        """
+        seconds = time.perf_counter() - started
+        values = self.__stages.get(stage)
+        if values is None:
+            values = {'seconds': 0.0, 'calls': 0, 'rows_in': 0, 'rows_out': 0, 'bytes': 0, 'peak_rss': 0}
+            self.__stages[stage] = values
+        values['seconds'] += seconds
+        values['calls'] += 1
+        values['rows_in'] += rows_in
+        values['rows_out'] += rows_out
+        values['bytes'] += num_bytes
+        values['peak_rss'] = max(values['peak_rss'], peak_rss())
+
+    def merge(self, other):
+        """
+        Add the measurements of another run, such as a worker process
+        reading part of the file.  The seconds of each are added so they
+        are the total time spent, not the wall time of the whole.
+
+        :param other: (Metrics) - The measurements to add.
+        """
+        assert isinstance(other, Metrics), "Can only merge Metrics."
+        for stage, other_values in other.stages.items():
+            values = self.__stages.setdefault(stage, dict((key, 0) for key in other_values))
+            for key, value in other_values.items():
+                if key == 'peak_rss':
+                    values[key] = max(values[key], value)
+                else:
+                    values[key] += value
+
+    def enable_profiler(self):
+        """
+        Start the cProfile capture, if profile is set.
+        """
+        if self.__profiler is not None:
+            self.__profiler.enable()
+
+    def disable_profiler(self):
+        """
+        Stop the cProfile capture, if profile is set.
+        """
+        if self.__profiler is not None:
+            self.__profiler.disable()
+
+    def profile_stats(self, limit=25, sort='cumulative'):
+        """
+        The cProfile report of the hot loop.
+
+        :param limit: (int) - Number of functions to list.
+        :param sort:  (str) - pstats sort key.
+        :return: (str) - The report, '' if profile was not set.
+        """
+        if self.__profiler is None:
+            return ''
+        out = io.StringIO()
+        stats = pstats.Stats(self.__profiler, stream=out)
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def to_dict(self):
+        """
+        The measurements as a dict that can be saved as JSON.
+
+        :return: (dict) - Stage name to its values, with rows_per_second added.
+        """
+        result = OrderedDict()
+        for stage, values in self.__stages.items():
+            result[stage] = dict(values)
+            seconds = values['seconds']
+            rows = values['rows_in'] or values['rows_out']
+            result[stage]['rows_per_second'] = rows / seconds if seconds > 0 else 0.0
+        return result
+
+    def report(self):
+        """
+        The measurements as a table.
+
+        :return: (str)
+        """
+        lines = ['%-14s %9s %7s %10s %10s %9s %12s %9s' %
+                 ('stage', 'seconds', 'calls', 'rows in', 'rows out', 'MB read', 'rows/s', 'peak MB')]
+        for stage, values in self.to_dict().items():
+            lines.append('%-14s %9.3f %7d %10d %10d %9.1f %12.0f %9.1f' %
+                         (stage, values['seconds'], values['calls'], values['rows_in'], values['rows_out'],
+                          values['bytes'] / 1e6, values['rows_per_second'], values['peak_rss'] / 1e6))
+        return '\n'.join(lines)
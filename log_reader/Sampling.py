@@ -0,0 +1,226 @@
+"""
+Module: Sampling
+
+Description:
+
+This module picks a part of a log at random, for a quick look at a log
+too big to read, and scales the counts of the valid rows found up to
+estimates for the whole log, with confidence intervals.  There are two
+ways of picking the part:
+
+   offsets:    the file is cut into blocks of block_size bytes and a
+               fraction of them are read, each one from the first line
+               that starts in it to the last one, so a line is in exactly
+               one block.  Only the blocks picked are read.
+   reservoir:  every line is read but only num_lines of them, picked
+               uniformly, are kept and then decoded and validated.  This
+               is for streams and compressed files, which can not be read
+               from an offset.
+
+Both are samples of clusters, the blocks or the lines, picked without
+replacement from all of those of the log, so the estimates are worked out
+the same way.  The clusters are picked with a random number generator
+from a seed, so the same seed picks the same lines of the same log.
+"""
+
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+
+def pick_blocks(file_size, fraction, block_size, seed):
+    """
+    Pick blocks of a file at random.
+
+    :param file_size:  (int) - Size of the file in bytes.
+    :param fraction:   (float) - Share of the blocks to pick, at least two
+                       are picked if there are that many.
+    :param block_size: (int) - Size of a block in bytes.
+    :param seed:       (int) - Seed of the random number generator.
+    :return: (int, numpy.ndarray) - The number of blocks of the file, and
+             the numbers of the blocks picked, in file order.
+    """
+    assert isinstance(fraction, float) and 0.0 < fraction <= 1.0, "Invalid fraction given: " + str(fraction)
+    assert isinstance(block_size, int) and block_size > 0, "Invalid block size given: " + str(block_size)
+    num_blocks = (file_size + block_size - 1) // block_size
+    num_picked = min(num_blocks, max(2, int(round(fraction * num_blocks))))
+    picked = np.random.default_rng(seed).choice(num_blocks, num_picked, replace=False)
+    return num_blocks, np.sort(picked)
+
+
+class Reservoir(object):
+    """
+    Keep a uniform sample of the lines of a log as they are read, each
+    line read so far is in it with the same probability.
+
+    Attributes:
+      - num_lines: The most lines kept.
+      - count:     Number of lines added.
+      - lines:     The lines kept.
+      - line_nos:  The line number of each line kept.
+    """
+
+    @property
+    def num_lines(self):
+        return self.__num_lines
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def lines(self):
+        return self.__lines
+
+    @property
+    def line_nos(self):
+        return self.__line_nos
+
+
+    def __init__(self, num_lines, seed=0):
+        assert isinstance(num_lines, int) and num_lines > 0, "Invalid number of lines given: " + str(num_lines)
+        self.__num_lines = num_lines
+        self.__rng = np.random.default_rng(seed)
+        self.__count = 0
+        self.__lines = []
+        self.__line_nos = []
+
+    def add(self, batch):
+        """
+        Add a batch of lines, each line after the first num_lines takes the
+        place of a line kept with probability num_lines over the lines so far.
+
+        :param batch: (list of str) - The next lines of the log.
+        """
+        first = self.__count
+        self.__count += len(batch)
+        fill = min(max(self.__num_lines - first, 0), len(batch))
+        self.__lines += batch[:fill]
+        self.__line_nos += range(first + 1, first + fill + 1)
+        if fill == len(batch):
+            return
+        # The place each line would take, from 0 to its position, only
+        # those that land in the reservoir are kept
+        positions = np.arange(first + fill, self.__count)
+        places = self.__rng.integers(0, positions + 1)
+        for index in np.flatnonzero(places < self.__num_lines):
+            place = places[index]
+            self.__lines[place] = batch[fill + index]
+            self.__line_nos[place] = int(positions[index]) + 1
+
+
+class LogSample(object):
+    """
+    The valid rows of a sample of a log, and what is needed to scale them
+    up to the whole log.
+
+    Attributes:
+      - method:       "offsets" or "reservoir", how the sample was picked.
+      - seed:         The seed it was picked with.
+      - frame:        The valid rows of the sample.
+      - clusters:     The cluster, block or line, of each row of frame.
+      - num_clusters: Number of clusters of the whole log.
+      - sampled:      Number of clusters picked, with those without valid rows.
+      - lines_read:   Number of lines of the sample, valid or not.
+    """
+
+    @property
+    def method(self):
+        return self.__method
+
+    @property
+    def seed(self):
+        return self.__seed
+
+    @property
+    def frame(self):
+        return self.__frame
+
+    @property
+    def clusters(self):
+        return self.__clusters
+
+    @property
+    def num_clusters(self):
+        return self.__num_clusters
+
+    @property
+    def sampled(self):
+        return self.__sampled
+
+    @property
+    def lines_read(self):
+        return self.__lines_read
+
+
+    def __init__(self, method, seed, frame, clusters, num_clusters, sampled, lines_read):
+        assert method in ['offsets', 'reservoir'], "Invalid method given: " + str(method)
+        assert len(clusters) == len(frame), "There must be a cluster for each row."
+        assert 0 < sampled <= num_clusters or sampled == num_clusters == 0, \
+            "Invalid number of clusters sampled given: " + str(sampled)
+        self.__method = method
+        self.__seed = seed
+        self.__frame = frame
+        self.__clusters = np.asarray(clusters, dtype='int64')
+        self.__num_clusters = num_clusters
+        self.__sampled = sampled
+        self.__lines_read = lines_read
+
+    def estimate(self, key=None, confidence=0.95):
+        """
+        The number of valid rows of the whole log with each value of a key,
+        such as the counts of show_file_type_counts() for "ext", from the
+        counts of the sample.
+
+        The count of a value is the number of clusters times its mean count
+        in a cluster, and the interval is from the normal approximation of
+        that mean, taking into account that the clusters were picked
+        without replacement.  An interval is never below the count found in
+        the sample, and has no width when every cluster was read.
+
+        :param key:        (str) - The key counted, None for all of the valid rows.
+        :param confidence: (float) - The probability that an interval holds the
+                           true count, default is 0.95.
+        :return: (DataFrame) - For each value, in sorted order, the rows of the
+                 sample, the estimated count and the low and high ends of its
+                 interval.
+        """
+        assert isinstance(confidence, float) and 0.0 < confidence < 1.0, "Invalid confidence given: " + str(confidence)
+        columns = ['sampled', 'estimate', 'low', 'high']
+        if len(self.__frame) == 0:
+            return pd.DataFrame(columns=columns, dtype='int64')
+        values = np.array(['valid'] * len(self.__frame), dtype=object) if key is None else self.__frame[key].values
+        sizes = pd.DataFrame({'value': values, 'cluster': self.__clusters}).groupby(['value', 'cluster'],
+                                                                                   observed=True).size()
+        sums = sizes.groupby(level=0).sum()
+        squares = (sizes.astype('float64') ** 2).groupby(level=0).sum()
+
+        # The clusters without the value count as zeros in the mean and variance
+        n = float(self.__sampled)
+        total = float(self.__num_clusters)
+        mean = sums / n
+        if n > 1:
+            variance = (squares - n * mean ** 2).clip(lower=0.0) / (n - 1.0)
+        else:
+            variance = mean * 0.0
+        error = total * np.sqrt(variance / n * (1.0 - n / total))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+
+        estimate = total * mean
+        result = pd.DataFrame({'sampled': sums,
+                               'estimate': estimate.round().astype('int64'),
+                               'low': np.maximum((estimate - z * error).round(), sums).astype('int64'),
+                               'high': (estimate + z * error).round().astype('int64')}, columns=columns)
+        result.index.name = key
+        return result.sort_index()
+
+    def summary(self):
+        """
+        :return: (str) - How the sample was picked, as text.
+        """
+        if self.__method == 'offsets':
+            what = '%d of %d blocks' % (self.__sampled, self.__num_clusters)
+        else:
+            what = '%d of %d lines' % (self.__sampled, self.__num_clusters)
+        return 'Sampled %s (seed %s), %d lines read, %d valid rows.' % \
+            (what, self.__seed, self.__lines_read, len(self.__frame))
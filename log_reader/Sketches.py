@@ -0,0 +1,265 @@
+"""
+Module: Sketches
+
+Description:
+
+This module has fixed size summaries of values that are too many to keep:
+
+   HyperLogLog:     the approximate number of different values.
+   CountMinSketch:  the approximate number of times each value was seen,
+                    never less than the true number.
+
+Both are given the values as 64 bit hashes, from hash_values(), which are
+the same in every process and every run, so sketches of different files,
+workers or days can be merged.  They are saved as JSON with their counters
+compressed and base64 encoded.
+"""
+
+import math
+import zlib
+import base64
+import numpy as np
+import pandas as pd
+
+# The most bits of a hash that are used to find the rank of a value,
+# they are turned into a float so must be exact in one.
+_RANK_BITS = 50
+
+
+def hash_values(values):
+    """
+    The 64 bit hash of each value, by its text, so 1 and "1" are the same.
+
+    :param values: (iterable) - The values to hash.
+    :return: (numpy.ndarray of uint64)
+    """
+    text = np.asarray([str(value) for value in values], dtype=object)
+    if len(text) == 0:
+        return np.zeros(0, dtype='uint64')
+    return pd.util.hash_array(text)
+
+def _encode(array):
+    """
+    :return: (str) - The bytes of an array, compressed and base64 encoded.
+    """
+    return base64.b64encode(zlib.compress(np.ascontiguousarray(array).tobytes())).decode('ascii')
+
+def _decode(text, dtype, shape):
+    """
+    :return: (numpy.ndarray) - The array from the output of _encode().
+    """
+    array = np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=dtype)
+    return array.reshape(shape).copy()
+
+
+class HyperLogLog(object):
+    """
+    The approximate number of different values added.
+
+    Attributes:
+      - error:     The relative standard error of count(), the number of
+                   registers is picked so that it is at most this.  Default
+                   is 0.01, which uses 16 KB.
+      - precision: Number of bits of the hash that pick a register, there
+                   are 2 ** precision registers of one byte.
+    """
+
+    @property
+    def error(self):
+        return 1.04 / math.sqrt(2 ** self.__precision)
+
+    @property
+    def precision(self):
+        return self.__precision
+
+
+    def __init__(self, error=0.01, precision=None):
+        if precision is None:
+            assert isinstance(error, float) and 0.0 < error < 1.0, "Invalid error given: " + str(error)
+            precision = int(math.ceil(math.log(((1.04 / error) ** 2), 2)))
+            precision = min(max(precision, 4), 18)
+        assert isinstance(precision, int) and 4 <= precision <= 18, "Invalid precision given: " + str(precision)
+        self.__precision = precision
+        self.__registers = np.zeros(2 ** precision, dtype='uint8')
+
+    def add(self, hashes):
+        """
+        Add values by their hashes.
+
+        :param hashes: (numpy.ndarray of uint64) - From hash_values().
+        """
+        if len(hashes) == 0: return
+        hashes = np.asarray(hashes, dtype='uint64')
+        index = (hashes >> np.uint64(64 - self.__precision)).astype('int64')
+        bits = min(64 - self.__precision, _RANK_BITS)
+        rest = (hashes & np.uint64((1 << bits) - 1)).astype('float64')
+        # Position of the first 1 bit, from the top of the bits used
+        exponent = np.frexp(rest)[1]
+        rank = (bits - exponent + 1).astype('uint8')
+        np.maximum.at(self.__registers, index, rank)
+
+    def merge(self, other):
+        """
+        Add the values of another sketch to this one.
+
+        :param other: (HyperLogLog) - A sketch with the same precision.
+        """
+        assert isinstance(other, HyperLogLog) and other.precision == self.precision, \
+            "Can only merge a HyperLogLog of the same precision."
+        np.maximum(self.__registers, other.__registers, out=self.__registers)
+
+    def count(self):
+        """
+        :return: (int) - The approximate number of different values.
+        """
+        m = len(self.__registers)
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.__registers.astype('int64')))
+        zeros = int(np.count_nonzero(self.__registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            # Few values, counting the empty registers is closer
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        """
+        The sketch as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        return {'precision': self.__precision, 'registers': _encode(self.__registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make a sketch from the output of to_dict().
+
+        :param data: (dict)
+        :return: (HyperLogLog)
+        """
+        sketch = cls(precision=data['precision'])
+        sketch.__registers = _decode(data['registers'], 'uint8', (2 ** data['precision'],))
+        return sketch
+
+
+class CountMinSketch(object):
+    """
+    The approximate number of times each value was added.  An estimate is
+    never less than the true count, and is more by at most error times the
+    total count, with probability confidence.
+
+    Attributes:
+      - error:      The error, as a share of the total count, default 0.001.
+      - confidence: The probability that an estimate is within the error,
+                    default 0.99.
+      - width:      Number of counters in each row, e / error.
+      - depth:      Number of rows, each with its own hash, ln(1 / (1 - confidence)).
+      - total:      The total count added.
+    """
+
+    @property
+    def error(self):
+        return math.e / self.__width
+
+    @property
+    def confidence(self):
+        return 1.0 - math.exp(-self.__depth)
+
+    @property
+    def width(self):
+        return self.__width
+
+    @property
+    def depth(self):
+        return self.__depth
+
+    @property
+    def total(self):
+        return self.__total
+
+
+    def __init__(self, error=0.001, confidence=0.99, width=None, depth=None):
+        if width is None:
+            assert isinstance(error, float) and 0.0 < error < 1.0, "Invalid error given: " + str(error)
+            width = int(math.ceil(math.e / error))
+        if depth is None:
+            assert isinstance(confidence, float) and 0.0 < confidence < 1.0, \
+                "Invalid confidence given: " + str(confidence)
+            depth = int(math.ceil(math.log(1.0 / (1.0 - confidence))))
+        assert isinstance(width, int) and width > 0, "Invalid width given: " + str(width)
+        assert isinstance(depth, int) and depth > 0, "Invalid depth given: " + str(depth)
+        self.__width = width
+        self.__depth = depth
+        self.__table = np.zeros((depth, width), dtype='int64')
+        self.__total = 0
+
+    def _columns(self, hashes):
+        """
+        :return: (numpy.ndarray) - The counter of each hash in each row, from
+                 two halves of the hash combined differently for each row.
+        """
+        hashes = np.asarray(hashes, dtype='uint64')
+        low = (hashes & np.uint64(0xffffffff)).astype('int64')
+        high = (hashes >> np.uint64(32)).astype('int64')
+        rows = np.arange(self.__depth, dtype='int64').reshape(-1, 1)
+        return (low + rows * high) % self.__width
+
+    def add(self, hashes, counts=None):
+        """
+        Add values by their hashes.
+
+        :param hashes: (numpy.ndarray of uint64) - From hash_values().
+        :param counts: (numpy.ndarray of int) - How many times each was seen,
+                       default is once.
+        """
+        if len(hashes) == 0: return
+        if counts is None:
+            counts = np.ones(len(hashes), dtype='int64')
+        counts = np.asarray(counts, dtype='int64')
+        columns = self._columns(hashes)
+        for row in range(self.__depth):
+            np.add.at(self.__table[row], columns[row], counts)
+        self.__total += int(counts.sum())
+
+    def estimate(self, hashes):
+        """
+        :param hashes: (numpy.ndarray of uint64) - From hash_values().
+        :return: (numpy.ndarray of int64) - The estimated count of each value.
+        """
+        if len(hashes) == 0:
+            return np.zeros(0, dtype='int64')
+        columns = self._columns(hashes)
+        return self.__table[np.arange(self.__depth).reshape(-1, 1), columns].min(axis=0)
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch to this one.
+
+        :param other: (CountMinSketch) - A sketch of the same width and depth.
+        """
+        assert isinstance(other, CountMinSketch) and (other.width, other.depth) == (self.width, self.depth), \
+            "Can only merge a CountMinSketch of the same width and depth."
+        self.__table += other.__table
+        self.__total += other.__total
+
+    def to_dict(self):
+        """
+        The sketch as a dict that can be saved as JSON.
+
+        :return: (dict)
+        """
+        return {'width': self.__width, 'depth': self.__depth, 'total': self.__total,
+                'table': _encode(self.__table)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Make a sketch from the output of to_dict().
+
+        :param data: (dict)
+        :return: (CountMinSketch)
+        """
+        sketch = cls(width=data['width'], depth=data['depth'])
+        sketch.__table = _decode(data['table'], 'int64', (data['depth'], data['width']))
+        sketch.__total = data['total']
+        return sketch
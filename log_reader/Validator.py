@@ -0,0 +1,591 @@
+"""
+Module: Validator
+
+Description:
+
+This module turns a valid_keys dictionary, as used by LogFileAnalyzer,
+into a validator that checks rows against it.  All of the work that only
+depends on valid_keys, such as compiling regular expressions and working
+out the min and max datetimes, is done once when the validator is created
+rather than for every row.
+
+Timestamps are turned into seconds since the epoch by a TimestampNormalizer,
+which remembers the values it has seen, as a log writes the same ts second
+many times over.  Epoch ints are compared with the bounds as they are.
+"""
+
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from log_reader.utilities import StrPattern
+
+# IDs and hashes repeat a lot in a log, so the result of matching a
+# string against a pattern is remembered, up to this many strings per key.
+_PATTERN_CACHE_SIZE = 65536
+_MISSING = object()
+
+# Epoch timestamps further than this from a min or max bound are on the
+# right side of it whatever the local time zone is.
+_TZ_MARGIN = 2 * 24 * 3600
+# fromtimestamp() can not handle times after the year 9999.
+_MAX_EPOCH = 253402214400
+_TS_STR_PATTERN = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\Z'
+_TS_STR_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Most date strings a TimestampNormalizer remembers, more than the ts of a
+# batch so that the rows validated are still there when they are added.
+_TS_CACHE_SIZE = 65536
+
+
+class SchemaValidator(object):
+    """
+    Validate rows of data against a valid_keys dictionary.
+
+    The checks are done in the order of the keys in valid_keys, and the
+    first one that fails is the one reported.  The check for each key is
+    built once, so validating a row only calls these in turn and does not
+    interpret valid_keys at all.
+
+    Attributes:
+      - valid_keys: The dictionary the validator was built from.
+      - normalizer: The TimestampNormalizer used by the datetime checks, so
+                    the epochs of the rows validated can be had without
+                    parsing them again.
+    """
+
+    @property
+    def valid_keys(self):
+        return self.__valid_keys
+
+    @property
+    def normalizer(self):
+        return self.__normalizer
+
+
+    def __init__(self, valid_keys):
+        assert isinstance(valid_keys, dict), "Invalid valid_key dictionary given: " + str(valid_keys)
+        self.__valid_keys = valid_keys
+        self.__normalizer = TimestampNormalizer()
+        self.__checks = [(key, _compile_check(key, spec, self.__normalizer)) for key, spec in valid_keys.items()]
+        self.__column_checks = [_compile_column_check(spec) for key, spec in valid_keys.items()]
+        self.__key_set = frozenset(valid_keys.keys())
+
+    @property
+    def checks(self):
+        """
+        (list of (key, function)) - The check for each key, in the order
+        they are done.  Each function takes a value and returns None if it
+        is valid, otherwise the reason it is not.
+        """
+        return list(self.__checks)
+
+    def validate(self, row):
+        """
+        Validate a row or line of data.
+
+        :param row: (dict) - The row to validate.
+        :return: (bool, str) - True and an empty string if the row is valid,
+                 otherwise False and the reason the row is not valid.
+        """
+        if row.keys() != self.__key_set:
+            if not self.__key_set.issuperset(row):
+                return False, "extra keys found."
+            return False, "not all keys found."
+        for key, check in self.__checks:
+            err = check(row[key])
+            if err is not None:
+                return False, err
+        return True, ''
+
+    def validate_batch(self, rows):
+        """
+        Validate a batch of rows a column at a time.
+
+        Each column is checked with pandas operations, and only the values
+        these flag as possibly bad are passed to the per value check, so
+        the result is the same as calling validate() on each row.
+
+        :param rows: (list of dict) - The rows to validate.
+        :return: (numpy.ndarray of bool, list of str) - Which rows are valid,
+                 and the reason each row is not valid, '' for valid rows.
+        """
+        key_set = self.__key_set
+        num_keys = len(key_set)
+        reasons = [''] * len(rows)
+        whole = []
+        for i, row in enumerate(rows):
+            if len(row) == num_keys and key_set.issuperset(row):
+                whole.append(i)
+            elif not key_set.issuperset(row):
+                reasons[i] = "extra keys found."
+            else:
+                reasons[i] = "not all keys found."
+
+        pending = np.ones(len(whole), dtype=bool)
+        for (key, check), column_check in zip(self.__checks, self.__column_checks):
+            if not pending.any(): break
+            values = [rows[i][key] for i in whole]
+            suspect = np.flatnonzero(pending & column_check(values))
+            for j in suspect:
+                err = check(values[j])
+                if err is not None:
+                    reasons[whole[j]] = err
+                    pending[j] = False
+
+        valid = np.array([len(reason) == 0 for reason in reasons], dtype=bool)
+        return valid, reasons
+
+
+def _compile_check(key, spec, normalizer=None):
+    """
+    Build the function that checks the value of one key.
+
+    :param key:  (str) - The name of the key.
+    :param spec: (dict) - The valid_keys entry for the key.
+    :param normalizer: (TimestampNormalizer) - Used for datetime values, a
+                 new one if not given.
+    :return: (function) - Takes the value and returns None if it is valid,
+             otherwise the reason it is not valid.
+    """
+    if not isinstance(spec, dict):
+        err = "Unrecognized value type: " + str(spec)
+        return lambda value: err
+
+    vtype = spec.get('type')
+    if vtype == StrPattern:
+        return _compile_pattern(key, spec)
+    elif vtype in [int, float]:
+        return _compile_number(key, spec, vtype)
+    elif vtype in [str]:
+        return _compile_str(key, spec)
+    elif vtype is datetime:
+        return _compile_datetime(key, spec, normalizer or TimestampNormalizer())
+
+    err = "Unrecognized value type: " + str(vtype)
+    return lambda value: err
+
+def _compile_pattern(key, spec):
+    match = re.compile(spec['pattern']).match
+    cache = {}
+    def check(value):
+        # Only strings are ever remembered, so those are looked up first
+        try:
+            err = cache.get(value, _MISSING)
+        except TypeError:
+            err = _MISSING
+        if err is _MISSING:
+            if not isinstance(value, str):
+                return str(key) + ' value "' + str(value) + '" does not match expected pattern.'
+            err = None
+            if match(value) is None:
+                err = str(key) + ' value "' + value + '" does not match expected pattern.'
+            if len(cache) >= _PATTERN_CACHE_SIZE:
+                cache.clear()
+            cache[value] = err
+        return err
+    return check
+
+def _compile_number(key, spec, vtype):
+    values = spec.get('values')
+    vmin = spec.get('min')
+    vmax = spec.get('max')
+    def check(value):
+        try:
+            rvalue = vtype(value)
+        except (ValueError, TypeError):
+            return str(key) + ' value "' + str(value) + '" is not in the expected format.'
+        if values is not None and rvalue not in values:
+            return str(key) + ' value is "' + str(rvalue) + '" exepcted to be one of ' + str(values)
+        if vmin is not None and rvalue < vmin:
+            return str(key) + ' value "' + str(rvalue) + '" must be greater than ' + str(vmin)
+        if vmax is not None and rvalue > vmax:
+            return str(key) + ' value "' + str(rvalue) + '" must be smaller than ' + str(vmax)
+    return check
+
+def _compile_str(key, spec):
+    values = spec.get('values')
+    min_len = spec.get('min_len')
+    max_len = spec.get('max_len')
+    def check(value):
+        if values is not None and value not in values:
+            return str(key) + ' value is "' + str(value) + '" exepcted to be one of ' + str(values)
+        if not hasattr(value, '__len__'):
+            return str(key) + ' value "' + str(value) + '" is not in the expected format.'
+        if min_len is not None and len(value) < min_len:
+            return str(key) + ' value "' + str(value) + '" must be longer than ' + str(min_len) + ' characters.'
+        if max_len is not None and len(value) > max_len:
+            return str(key) + ' value "' + str(value) + '" must be shorter than ' + str(max_len) + ' characters.'
+    return check
+
+def _compile_datetime(key, spec, normalizer):
+    # TODO add the ability to handle things like "today" and "YYYYMMDD" time times
+    # TODO print out warning in more meaningful datetime arrangement
+    vmin = spec.get('min')
+    vmax = spec.get('max')
+    try:
+        dt_min = None if vmin is None else datetime.fromtimestamp(int(vmin))
+        dt_max = None if vmax is None else datetime.fromtimestamp(int(vmax))
+    except (ValueError, TypeError, OverflowError, OSError):
+        raise AssertionError("Invalid min or max given for " + str(key) + ": " + str(vmin) + ", " + str(vmax))
+
+    def check_value(value):
+        rvalue = parse_timestamp(value)
+        if rvalue is None:
+            return str(key) + ' value "' + str(value) + '" is not in the expected format.'
+        if dt_min is not None and rvalue < dt_min:
+            return str(key) + ' value "' + str(rvalue) + '" must be after ' + str(vmin)
+        if dt_max is not None and rvalue > dt_max:
+            return str(key) + ' value "' + str(rvalue) + '" must be before ' + str(vmax)
+
+    # Epochs this far inside the bounds are valid whatever the local time
+    # zone, anything nearer, or not an int or str, gets the full check.
+    epoch_min = _TZ_MARGIN if vmin is None else int(vmin) + _TZ_MARGIN
+    epoch_max = _MAX_EPOCH - _TZ_MARGIN if vmax is None else min(int(vmax), _MAX_EPOCH) - _TZ_MARGIN
+    normalize = normalizer.normalize
+
+    # Logs tend to write the same timestamp many times in a row
+    last = [_MISSING, None]
+    def check(value):
+        vtype = type(value)
+        if vtype is int:
+            if epoch_min < value < epoch_max:
+                return None
+        elif vtype is str:
+            epoch = normalize(value)
+            if epoch is not None and epoch_min < epoch < epoch_max:
+                return None
+        if value != last[0] or vtype is not type(last[0]):
+            last[1] = check_value(value)
+            last[0] = value
+        return last[1]
+    return check
+
+def _compile_column_check(spec):
+    """
+    Build the function that checks a whole column of values for one key.
+
+    The function is allowed to flag values that turn out to be valid, but
+    never to pass one that is not.
+
+    :param spec: (dict) - The valid_keys entry for the key.
+    :return: (function) - Takes a list of values and returns a numpy array
+             of bool that is True for the values that may not be valid.
+    """
+    vtype = spec.get('type') if isinstance(spec, dict) else None
+    if vtype == StrPattern:
+        return _compile_pattern_column(spec)
+    elif vtype in [int, float]:
+        return _compile_number_column(spec, vtype)
+    elif vtype in [str]:
+        return _compile_str_column(spec)
+    elif vtype is datetime:
+        return _compile_datetime_column(spec)
+    return lambda values: np.ones(len(values), dtype=bool)
+
+def _compile_pattern_column(spec):
+    pattern = spec['pattern']
+    def check(values):
+        return ~_str_match(pd.Series(values, dtype=object), pattern).values
+    return check
+
+def _compile_number_column(spec, vtype):
+    values = spec.get('values')
+    vmin = spec.get('min')
+    vmax = spec.get('max')
+    kinds = 'iu' if vtype == int else 'iuf'
+    def check(column):
+        column = pd.Series(column)
+        if column.dtype.kind not in kinds:
+            return np.ones(len(column), dtype=bool)
+        bad = column.isna()
+        if values is not None:
+            bad |= ~column.isin(list(values))
+        if vmin is not None:
+            bad |= column < vmin
+        if vmax is not None:
+            bad |= column > vmax
+        return bad.values
+    return check
+
+def _compile_str_column(spec):
+    values = spec.get('values')
+    min_len = spec.get('min_len')
+    max_len = spec.get('max_len')
+    def check(column):
+        column = pd.Series(column, dtype=object)
+        lengths = _str_len(column)
+        bad = lengths.isna()
+        if values is not None:
+            bad |= ~column.isin(list(values))
+        if min_len is not None:
+            bad |= lengths < min_len
+        if max_len is not None:
+            bad |= lengths > max_len
+        return bad.values
+    return check
+
+def _compile_datetime_column(spec):
+    vmin = spec.get('min')
+    vmax = spec.get('max')
+    dt_min = None if vmin is None else datetime.fromtimestamp(int(vmin))
+    dt_max = None if vmax is None else datetime.fromtimestamp(int(vmax))
+    epoch_min = _TZ_MARGIN if vmin is None else int(vmin) + _TZ_MARGIN
+    epoch_max = _MAX_EPOCH - _TZ_MARGIN if vmax is None else min(int(vmax), _MAX_EPOCH) - _TZ_MARGIN
+    def check(column):
+        column = pd.Series(column)
+        if column.dtype.kind in 'iu':
+            # Time is in seconds from epoch
+            return ((column < epoch_min) | (column > epoch_max)).values
+
+        # Both formats can be in one batch, anything other than an int or a
+        # str, or an epoch given as a str, is left to the per value check.
+        column = column.astype(object)
+        types = column.map(type)
+
+        # Time is in seconds from epoch
+        seconds = pd.to_numeric(column.where(types.eq(int)), errors='coerce')
+        good = (seconds > epoch_min) & (seconds < epoch_max)
+
+        # Time is in YYYY-MM-DD HH:mm:ss format
+        is_str = _str_match(column.where(types.eq(str)), _TS_STR_PATTERN)
+        if is_str.any():
+            parsed = pd.to_datetime(column.where(is_str), format=_TS_STR_FORMAT, errors='coerce')
+            in_range = parsed.notna()
+            if dt_min is not None:
+                in_range &= parsed >= dt_min
+            if dt_max is not None:
+                in_range &= parsed <= dt_max
+            good |= in_range
+        return ~good.values
+    return check
+
+def _str_match(column, pattern):
+    """
+    Which values in an object column are strings that match a pattern.
+
+    :return: (pandas.Series of bool)
+    """
+    try:
+        # IDs and hashes repeat a lot so only match each distinct value once
+        codes, uniques = pd.factorize(column)
+    except TypeError:
+        # Some of the values can not be hashed
+        codes, uniques = np.arange(len(column)), column.values
+    try:
+        matched = pd.Series(uniques, dtype=object).str.match(pattern).eq(True).values
+    except AttributeError:
+        # None of the values are strings
+        matched = np.zeros(len(uniques), dtype=bool)
+    # Missing values have a code of -1 which picks the extra False
+    matched = np.append(matched, False)
+    return pd.Series(matched[codes], index=column.index)
+
+def _str_len(column):
+    """
+    The length of each value in an object column, NaN for values
+    that do not have a length.
+
+    :return: (pandas.Series of float)
+    """
+    try:
+        return column.str.len()
+    except AttributeError:
+        # None of the values are strings
+        return pd.Series(np.nan, index=column.index)
+
+def parse_timestamp(value):
+    """
+    Turn a timestamp in one of the supported formats into a datetime.
+
+    The formats are seconds since the epoch, as an int or a str, and
+    YYYY-MM-DD HH:mm:ss.
+
+    :param value: The timestamp to parse.
+    :return: (datetime) - The local time, or None if value is not a timestamp.
+    """
+    try:
+        # Time is in seconds from epoch
+        return datetime.fromtimestamp(int(value))
+    except (ValueError, TypeError, OverflowError, OSError):
+        pass
+    parsed = _parse_date_str(value)
+    if parsed is not None:
+        return parsed
+    try:
+        # Time is in YYYY-MM-DD HH:mm:ss format
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except (ValueError, TypeError):
+        return None
+
+def _parse_date_str(value):
+    """
+    The fast path of parse_timestamp() for YYYY-MM-DD HH:mm:ss strings with
+    every field padded, as logs write them, without strptime().
+
+    :return: (datetime) - The local time, or None if value is not such a
+             string, and strptime() must decide.
+    """
+    if type(value) is not str or len(value) != 19 or value[4] != '-' or value[7] != '-' \
+       or value[10] != ' ' or value[13] != ':' or value[16] != ':':
+        return None
+    digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19]
+    if not (digits.isdigit() and digits.isascii()):
+        return None
+    try:
+        return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:19]))
+    except ValueError:
+        return None
+
+def parse_epoch(value):
+    """
+    Turn a timestamp in one of the supported formats into seconds since
+    the epoch, so that both formats can be compared and put into windows.
+
+    Date strings are local time, as they are for parse_timestamp(), and so
+    are datetimes such as the ts column of the compact layout.
+
+    :param value: The timestamp to parse.
+    :return: (int) - Seconds since the epoch, or None if value is not a timestamp.
+    """
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    if not isinstance(value, datetime):
+        try:
+            return int(value)
+        except (ValueError, TypeError, OverflowError):
+            pass
+        value = parse_timestamp(value)
+        if value is None:
+            return None
+    try:
+        return int(value.timestamp())
+    except (ValueError, OverflowError, OSError):
+        # Too close to the first or last datetime for the time zone
+        return None
+
+def parse_epochs(values):
+    """
+    parse_epoch() of a whole column at once.  Date strings are parsed by
+    pandas and turned from local time into the epoch with the UTC offset
+    of their hour, values in neither format are left to parse_epoch().
+
+    :param values: (list or Series) - The timestamps, ints, strings or datetimes.
+    :return: (numpy.ndarray of int64) - Seconds since the epoch, -1 for values
+             that are not timestamps.
+    """
+    column = pd.Series(values)
+    if column.dtype.kind == 'M':
+        naive = column.values.astype('datetime64[s]').astype('int64')
+        return naive - _utc_offsets(naive)
+    if column.dtype.kind in 'iu':
+        return column.values.astype('int64')
+
+    column = column.astype(object)
+    numbers = pd.to_numeric(column, errors='coerce')
+    is_number = numbers.notna().values
+    parsed = pd.to_datetime(column.where(~is_number), format=_TS_STR_FORMAT, errors='coerce')
+    is_date = parsed.notna().values
+    epochs = np.full(len(column), -1, dtype='int64')
+    epochs[is_number] = numbers.values[is_number].astype('int64')
+    naive = parsed.values[is_date].astype('datetime64[s]').astype('int64')
+    epochs[is_date] = naive - _utc_offsets(naive)
+    for index in np.flatnonzero(~is_number & ~is_date):
+        epoch = parse_epoch(column.iat[index])
+        epochs[index] = -1 if epoch is None else epoch
+    return epochs
+
+class TimestampNormalizer(object):
+    """
+    Turn timestamps into seconds since the epoch, as parse_epoch() does,
+    for the many rows of a log that have the same ts.
+
+    Epoch ints are given back as they are.  Other values are remembered,
+    up to cache_size of them with the least recently used forgotten first,
+    and the last value is checked before the cache as the next row is
+    most often the same second.
+
+    Attributes:
+      - cache_size: The most values remembered, default is 65536.
+      - hits:       Number of values found without parsing them.
+      - misses:     Number of values that were parsed.
+    """
+
+    @property
+    def cache_size(self):
+        return self.__cache_size
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+
+    def __init__(self, cache_size=_TS_CACHE_SIZE):
+        assert isinstance(cache_size, int) and cache_size > 0, "Invalid cache_size given: " + str(cache_size)
+        self.__cache_size = cache_size
+        self.__cache = OrderedDict()
+        self.__last = (_MISSING, None)
+        self.__hits = 0
+        self.__misses = 0
+
+    def normalize(self, value):
+        """
+        :param value: The timestamp, in one of the formats of parse_epoch().
+        :return: (int) - Seconds since the epoch, or None if value is not a timestamp.
+        """
+        if type(value) is int:
+            return value
+        last_value, last_epoch = self.__last
+        if value == last_value and type(value) is type(last_value):
+            self.__hits += 1
+            return last_epoch
+        if type(value) is not str:
+            # Only strings are remembered, other values may not be hashable
+            return parse_epoch(value)
+
+        cache = self.__cache
+        epoch = cache.get(value, _MISSING)
+        if epoch is _MISSING:
+            self.__misses += 1
+            parsed = _parse_date_str(value)
+            epoch = parse_epoch(value if parsed is None else parsed)
+            cache[value] = epoch
+            if len(cache) > self.__cache_size:
+                cache.popitem(last=False)
+        else:
+            self.__hits += 1
+            cache.move_to_end(value)
+        self.__last = (value, epoch)
+        return epoch
+
+    def normalize_all(self, values):
+        """
+        normalize() each of a list of timestamps.
+
+        :param values: (list) - The timestamps.
+        :return: (numpy.ndarray of int64) - Seconds since the epoch, -1 for
+                 values that are not timestamps, as parse_epochs() gives.
+        """
+        normalize = self.normalize
+        epochs = [normalize(value) for value in values]
+        return np.array([-1 if epoch is None else epoch for epoch in epochs], dtype='int64')
+
+
+def _utc_offsets(naive):
+    """
+    :param naive: (numpy.ndarray of int64) - Local times, as seconds since
+                  the epoch as if they were UTC.
+    :return: (numpy.ndarray of int64) - The UTC offset of each, the same as
+             datetime.timestamp() uses, worked out once for each hour.
+    """
+    if len(naive) == 0:
+        return np.zeros(0, dtype='int64')
+    hours, codes = np.unique(naive // 3600, return_inverse=True)
+    offsets = [int(hour) * 3600 - int((datetime(1970, 1, 1) + timedelta(hours=int(hour))).timestamp())
+               for hour in hours]
+    return np.array(offsets, dtype='int64')[codes.reshape(-1)]
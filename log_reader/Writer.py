@@ -0,0 +1,291 @@
+"""
+Module: Writer
+
+Description:
+
+This module writes rows out, such as the valid rows of a log, as JSON
+lines or CSV into one file per value of a key, a buffer of each file at a
+time.  The files are written with MyFileIO, so they can be compressed.
+"""
+
+import io
+import os
+import re
+import csv
+import json
+import numpy as np
+from datetime import datetime
+from log_reader.FileIO import MyFileIO, _EXTENSIONS
+from log_reader.Validator import parse_epoch
+from log_reader.Compact import unpack_hex
+
+# Characters left as they are when a value is put into a file name
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.=-]')
+
+
+class PartitionedWriter(object):
+    """
+    Write rows, such as the valid rows of a log, out as JSON lines or CSV,
+    into a file for each value of a key.  The rows of each file are held
+    in a buffer and written with one MyFileIO.write() once the buffer is
+    full, so a file is opened once for every buffer_size bytes, not for
+    every row, and only the buffers are kept in memory.
+
+    The files are replaced the first time they are written to and added
+    to after that, close() writes what is left.  It can be used in a with
+    statement so that it is always closed.
+
+    Attributes:
+      - out_path:     The file to write, with "{part}" where the value of
+                      partition_by goes when the rows are partitioned,
+                      e.g. "out/{part}.jsonl.gz".
+      - fmt:          "jsonl" or "csv", default is from the out_path
+                      extension, jsonl if it is neither.
+      - partition_by: The key the rows are split by, such as "dp" or "ext",
+                      "date" for the local date of ts, as YYYY-MM-DD.  None,
+                      the default, writes all of the rows to out_path.
+      - columns:      The keys written and their order, default is the keys
+                      of the first row.  A CSV file has these as its header
+                      and a row without one of them has an empty value.
+      - compression:  "gzip", "bz2" or "xz", default is from the out_path
+                      extension, None if it is not a compressed one.
+      - buffer_size:  Bytes held for a file before they are written, default
+                      is 1 MiB.
+      - max_buffered: Bytes held for all of the files before all of them are
+                      written, default is 64 MiB.
+      - rows_written: Number of rows written so far, with those still held.
+      - files:        The path of each file written, by partition value.
+      - metrics:      A Metrics object to record the "write" stage, see MyFileIO.
+    """
+
+    @property
+    def out_path(self):
+        return self.__out_path
+
+    @property
+    def fmt(self):
+        return self.__fmt
+
+    @property
+    def partition_by(self):
+        return self.__partition_by
+
+    @property
+    def columns(self):
+        return self.__columns
+
+    @property
+    def compression(self):
+        return self.__compression
+
+    @property
+    def buffer_size(self):
+        return self.__buffer_size
+
+    @property
+    def max_buffered(self):
+        return self.__max_buffered
+
+    @property
+    def rows_written(self):
+        return self.__rows_written
+
+    @property
+    def files(self):
+        return dict(self.__paths)
+
+    @property
+    def metrics(self):
+        return self.__metrics
+
+
+    def __init__(self, out_path, fmt=None, partition_by=None, columns=None, compression=None,
+                 buffer_size=1024*1024, max_buffered=64*1024*1024, metrics=None):
+        assert isinstance(out_path, str), "Invalid out path given: " + str(out_path)
+        assert partition_by is None or isinstance(partition_by, str), "Invalid partition_by given: " + str(partition_by)
+        assert (partition_by is None) == ('{part}' not in out_path), \
+            "The out path must have {part} in it when, and only when, the rows are partitioned."
+        # The extension before the compression one, e.g. .csv of rows.csv.gz
+        root, ext = os.path.splitext(out_path)
+        if compression is None:
+            compression = _EXTENSIONS.get(ext)
+        if ext in _EXTENSIONS:
+            ext = os.path.splitext(root)[1]
+        if fmt is None:
+            fmt = 'csv' if ext == '.csv' else 'jsonl'
+        assert fmt in ['jsonl', 'csv'], "Invalid format given: " + str(fmt)
+        assert compression in [None, 'gzip', 'bz2', 'xz'], "Invalid compression given: " + str(compression)
+        assert columns is None or (isinstance(columns, list) and len(columns) > 0), "Invalid columns given: " + str(columns)
+        assert isinstance(buffer_size, int) and buffer_size > 0, "Invalid buffer size given: " + str(buffer_size)
+        assert isinstance(max_buffered, int) and max_buffered >= buffer_size, "Invalid max_buffered given: " + str(max_buffered)
+        assert metrics is None or hasattr(metrics, 'record'), "Invalid metrics given: " + str(metrics)
+        self.__out_path = out_path
+        self.__fmt = fmt
+        self.__partition_by = partition_by
+        self.__columns = None if columns is None else list(columns)
+        self.__compression = compression
+        self.__buffer_size = buffer_size
+        self.__max_buffered = max_buffered
+        self.__metrics = metrics
+        self.__rows_written = 0
+        # Partition value to its file path, buffer and CSV writer, and the
+        # bytes held in the buffers of the partitions
+        self.__paths = {}
+        self.__buffers = {}
+        self.__csv_writers = {}
+        self.__written = set()
+        self.__buffered = 0
+        # Local dates by quarter hour, every time zone changes on one
+        self.__dates = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _partition_of(self, row):
+        """
+        :return: (str) - The value of partition_by for a row, as it is put
+                 in the file name.
+        """
+        if self.__partition_by == 'date':
+            epoch = row.get('epoch')
+            if epoch is None or epoch < 0:
+                epoch = parse_epoch(row.get('ts'))
+            if epoch is None:
+                return 'unknown'
+            quarter = epoch // 900
+            date = self.__dates.get(quarter)
+            if date is None:
+                date = self.__dates[quarter] = datetime.fromtimestamp(quarter * 900).strftime('%Y-%m-%d')
+            return date
+        value = _UNSAFE.sub('_', str(row.get(self.__partition_by, '')))
+        return '_' if value in ['', '.', '..'] else value
+
+    def _buffer_of(self, part):
+        """
+        :return: (io.StringIO) - The buffer of a partition, made with its
+                 file path the first time it is seen.
+        """
+        buffer = self.__buffers.get(part)
+        if buffer is None:
+            buffer = self.__buffers[part] = io.StringIO()
+            self.__paths[part] = self.__out_path if part is None else self.__out_path.replace('{part}', part)
+            if self.__fmt == 'csv':
+                writer = csv.DictWriter(buffer, self.__columns, restval='', extrasaction='ignore', lineterminator='\n')
+                writer.writeheader()
+                self.__csv_writers[part] = writer
+        return buffer
+
+    def write_rows(self, rows):
+        """
+        Add rows to the buffers of their files, the buffers that are full
+        are written out.
+
+        :param rows: (list of dict) - The rows, such as the valid rows of a
+                     batch of the log.
+        """
+        if len(rows) == 0: return
+        if self.__columns is None:
+            self.__columns = list(rows[0].keys())
+        partition_by = self.__partition_by
+        # Rows of the same partition are usually next to each other
+        groups = {}
+        for row in rows:
+            part = None if partition_by is None else self._partition_of(row)
+            group = groups.get(part)
+            if group is None:
+                group = groups[part] = []
+            group.append(row)
+
+        columns = self.__columns
+        for part, group in groups.items():
+            buffer = self._buffer_of(part)
+            before = buffer.tell()
+            if self.__fmt == 'csv':
+                self.__csv_writers[part].writerows(group)
+            else:
+                buffer.write(''.join(json.dumps(dict((key, row[key]) for key in columns if key in row),
+                                                separators=(',', ':'), default=_to_json) + '\n'
+                                     for row in group))
+            self.__buffered += buffer.tell() - before
+            if buffer.tell() >= self.__buffer_size:
+                self._flush_part(part)
+        self.__rows_written += len(rows)
+        if self.__buffered >= self.__max_buffered:
+            self.flush()
+
+    def write_frame(self, frame, chunk_rows=10000):
+        """
+        Write the rows of a data frame, such as LogFileAnalyzer.data_frame,
+        a chunk of rows at a time.  The columns of the compact layout are
+        unpacked, ts is written as a local date string, and the values a row
+        did not have are left out.
+
+        :param frame:      (DataFrame) - The rows.
+        :param chunk_rows: (int) - Number of rows turned into dicts at once.
+        """
+        assert isinstance(chunk_rows, int) and chunk_rows > 0, "Invalid chunk_rows given: " + str(chunk_rows)
+        for first in range(0, len(frame), chunk_rows):
+            chunk = frame.iloc[first:first + chunk_rows]
+            columns = {}
+            for column in chunk.columns:
+                values = chunk[column]
+                if values.dtype.kind == 'S':
+                    values = unpack_hex(values, column)
+                elif values.dtype.kind == 'M':
+                    values = list(values.dt.strftime('%Y-%m-%d %H:%M:%S'))
+                else:
+                    values = list(values.astype(object))
+                columns[column] = values
+            names = list(columns)
+            rows = [dict((name, value) for name, value in zip(names, values)
+                         if not (value is None or (isinstance(value, float) and value != value)))
+                    for values in zip(*[columns[name] for name in names])]
+            self.write_rows(rows)
+
+    def _flush_part(self, part):
+        """
+        Write out the buffer of a partition, replacing the file the first time.
+        """
+        buffer = self.__buffers[part]
+        data = buffer.getvalue()
+        if len(data) == 0 and part in self.__written:
+            return
+        path = self.__paths[part]
+        directory = os.path.dirname(path)
+        if directory != '' and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        MyFileIO(path, metrics=self.__metrics).write(data, append=part in self.__written,
+                                                     compression=self.__compression)
+        self.__written.add(part)
+        self.__buffered -= len(data)
+        buffer.seek(0)
+        buffer.truncate()
+
+    def flush(self):
+        """
+        Write out the buffers of all of the partitions.
+        """
+        for part in list(self.__buffers):
+            self._flush_part(part)
+        self.__buffered = 0
+
+    def close(self):
+        """
+        Write out what is left, the files are complete once this is done.
+        """
+        self.flush()
+
+
+def _to_json(value):
+    """
+    :return: A value json can not write as one it can, such as a numpy
+             number or a datetime.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    raise TypeError("Can not write as JSON: " + repr(value))
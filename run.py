@@ -3,41 +3,257 @@ This is a script to run the code with the sample
 data.
 """
 
+import sys
+import json
 from argparse import ArgumentParser
 from log_reader.LogFileAnalyzer import LogFileAnalyzer
+from log_reader.Cache import FrameCache
+from log_reader.Metrics import Metrics
+from log_reader.Errors import ErrorCollector
+from log_reader.Aggregates import REPORTS
+from log_reader.FileIO import ChecksumError, is_stream
+from log_reader.Writer import PartitionedWriter
+from log_reader.Dedup import ExactDeduplicator, BloomDeduplicator, DEFAULT_KEYS
 
-def main(log_path):
+def main(log_path, workers=1, incremental=False, streaming=False, cache_dir=None, cache_size=1024,
+         compact=False, profile=None, cprofile=False, max_warnings=None, reject_path=None, reports=None,
+         report_options=None, windows_path=None, index=False, query=None, every_lines=None,
+         every_seconds=None, dedup=None, dedup_options=None, export_path=None, export_options=None,
+         sample=None, checksum=None, expected_digest=None, content_hash=False):
     """
     Create an instance of the log file analyzer and find out
     what's in it.
     
-    Output is to the console
+    Output is to the console, profile is None, "text" or "json" for how
+    the time spent in each stage is printed, cprofile prints what cProfile
+    found for the hot loop.  At most max_warnings warnings are printed,
+    None for all of them, and then a count of the failures by reason.  The
+    rejected lines are written to reject_path if it is given.  Each of
+    reports, see REPORTS in the Aggregates module, is printed, all of them
+    worked out together, report_options has the error bounds of the
+    approximate ones and the seconds of the windows.  The windows are
+    written to windows_path, as JSON lines, as soon as they are complete.
+    With index a sidecar index of the log is built as it is read.  When
+    query, a dict of the arguments of LogFileAnalyzer.query(), is given
+    only the rows that match it are found, with the index, and printed.
+    A log_path of "-", the standard input, or a named pipe is read as a
+    stream, with the reports printed every every_lines lines or
+    every_seconds seconds as well as at the end.  dedup, "exact" or
+    "bloom", skips the rows already seen, with dedup_options the keys,
+    error and max_bytes of the Deduplicator, and prints how many there were.
+    With export_path the valid rows are written there as they are read,
+    rather than printing the reports, with export_options the fmt,
+    partition_by and compression of the PartitionedWriter.  sample, a dict
+    of the arguments of LogFileAnalyzer.read_sample(), reads only a sample
+    of the log and prints the estimated counts by ext and by dp instead.
+    checksum names a checksum of the log worked out as it is read, which
+    is printed, expected_digest is the sha256, or checksum, the log must
+    have.  With content_hash the cache is keyed by the digest of the log.
     """
 
-    # TODO capture the warnings and display them optionally.
-    lr = LogFileAnalyzer()
+    cache = None
+    if cache_dir is not None:
+        cache = FrameCache(cache_dir, max_bytes=cache_size * 1024**2, content_hash=content_hash)
+    metrics = None
+    if profile is not None or cprofile:
+        metrics = Metrics(profile=cprofile)
+    errors = ErrorCollector(max_warnings=max_warnings, reject_path=reject_path)
+    dedup_options = dict(dedup_options or {})
+    if dedup == 'exact':
+        dedup_options.pop('error', None)
+        dedup_options.pop('max_bytes', None)
+        dedup = ExactDeduplicator(**dedup_options)
+    elif dedup == 'bloom':
+        dedup = BloomDeduplicator(**dedup_options)
+    windows_file = None
+    window_emit = None
+    if windows_path is not None:
+        windows_file = open(windows_path, 'w')
+        def window_emit(window):
+            windows_file.write(json.dumps(window) + '\n')
+            windows_file.flush()
+    batch_size = 10000 if every_lines is None else min(10000, every_lines)
+    lr = LogFileAnalyzer(batch_size=batch_size, workers=workers, streaming=streaming, cache=cache, compact=compact, metrics=metrics,
+                         errors=errors, reports=reports,
+                         report_options=report_options, window_emit=window_emit, index=index, dedup=dedup,
+                         checksum=checksum)
     lr.log_path=log_path
-    lr.read_and_validate()
-    lr.show_file_type_counts()
+    if query is not None:
+        print(lr.query(**query).to_string())
+        return
+    if sample is not None:
+        lr.read_sample(**sample)
+        print(lr.sample.summary())
+        for key in [None, 'ext', 'dp']:
+            print(lr.sample.estimate(key).to_string())
+    elif export_path is not None:
+        with PartitionedWriter(export_path, metrics=metrics, **(export_options or {})) as writer:
+            lr.export(writer)
+        print('%d rows written to %d files' % (writer.rows_written, len(writer.files)))
+    elif is_stream(log_path) or every_lines is not None or every_seconds is not None:
+        def emit(lines, results):
+            print('After ' + str(lines) + ' lines:')
+            print_results(results)
+            sys.stdout.flush()
+        lr.read_stream(emit, every_lines, every_seconds)
+    else:
+        if incremental:
+            lr.read_incremental()
+        else:
+            try:
+                lr.read_and_validate(expected_digest)
+            except ChecksumError as err:
+                print(err)
+                sys.exit(1)
+        print_results(lr.analyze())
+    if windows_file is not None:
+        windows_file.close()
+    if lr.file_results is not None:
+        for path, result in sorted(lr.file_results.items()):
+            print('%s: %d lines, %d valid, %d failed' % (path, result['lines'], result['valid'], result['failed']))
+    if errors.total > 0:
+        print(errors.summary())
+    if dedup is not None:
+        print(dedup.summary())
+    if checksum is not None and lr.digest is not None:
+        print(checksum + ': ' + lr.digest)
+
+    if profile == 'json':
+        print(json.dumps(metrics.to_dict(), indent=2))
+    elif profile == 'text':
+        print(metrics.report())
+    if cprofile:
+        print(metrics.profile_stats())
     
+def print_results(results):
+    """
+    Print each of the results of LogFileAnalyzer.analyze().
+    """
+    for name, result in results.items():
+        print(name + ':')
+        print(result.to_string())
+
 def parse_args():
     """
     Parse the command-line arguments.
     """
 
-    # TODO allow for showing different type of analytics.
     ap = ArgumentParser('Do analytics on the contents of a logfile.')
     ap.add_argument('-l', '--logfile', action='store', type=str,
-                    help='The path to logfile.', required=True)
+                    help='The path to logfile, or a directory or quoted glob pattern of logfiles, '
+                         'or - to read a stream from the standard input.',
+                    required=True)
+    ap.add_argument('-w', '--workers', action='store', type=int, default=1,
+                    help='Number of processes used to read the logfile, or the logfiles.')
+    ap.add_argument('-i', '--incremental', action='store_true',
+                    help='Only read the lines added since the last incremental run.')
+    ap.add_argument('-s', '--streaming', action='store_true',
+                    help='Only keep counts while reading, not the rows, to use less memory.')
+    ap.add_argument('-c', '--cache-dir', action='store', type=str, default=None,
+                    help='Directory to cache the validated rows in, no cache is used if not given.')
+    ap.add_argument('--cache-size', action='store', type=int, default=1024,
+                    help='Largest size of the cache in MB.')
+    ap.add_argument('--compact', action='store_true',
+                    help='Keep the rows in narrow typed columns to use less memory.')
+    ap.add_argument('-p', '--profile', action='store', nargs='?', const='text', default=None,
+                    choices=['text', 'json'], help='Print the time spent in each stage, as text or JSON.')
+    ap.add_argument('--cprofile', action='store_true',
+                    help='Run the read under cProfile and print the functions that took the most time.')
+    ap.add_argument('-m', '--max-warnings', action='store', type=int, default=20,
+                    help='Most warnings printed for lines that are not valid, -1 for all of them.')
+    ap.add_argument('-q', '--quiet', action='store_true',
+                    help='Print no warnings, only the count of lines that failed for each reason.')
+    ap.add_argument('-r', '--rejects', action='store', type=str, default=None,
+                    help='File to write the lines that are not valid to, as JSON lines.')
+    ap.add_argument('--reports', action='store', nargs='+', default=['ext'], choices=list(REPORTS),
+                    help='The reports to print, all worked out in one pass over the rows.')
+    ap.add_argument('--distinct-error', action='store', type=float, default=0.01,
+                    help='Relative standard error of the approx_*_per_business reports.')
+    ap.add_argument('--count-error', action='store', type=float, default=0.001,
+                    help='Error of the heavy_* reports, as a share of the number of rows.')
+    ap.add_argument('--window', action='store', type=int, default=None,
+                    help='Seconds of each time window, adds the windows report.')
+    ap.add_argument('--slide', action='store', type=int, default=None,
+                    help='Seconds between the starts of sliding windows, default is the window.')
+    ap.add_argument('--lateness', action='store', type=int, default=0,
+                    help='Seconds a row may be behind the latest one and still be put in its window.')
+    ap.add_argument('--windows-out', action='store', type=str, default=None,
+                    help='File to write each window to, as JSON lines, as soon as it is complete.')
+    ap.add_argument('--index', action='store_true',
+                    help='Build a sidecar index of the logfile while reading it, for --find.')
+    ap.add_argument('--find', action='store', nargs='+', default=None, metavar='KEY=VALUE',
+                    help='Only print the rows with these values, of sha, uu, si, start or end, '
+                         'found with the index rather than reading the whole logfile.')
+    ap.add_argument('--every', action='store', type=int, default=None, dest='every_lines',
+                    help='Print the reports every this many lines while reading, as for a stream.')
+    ap.add_argument('--every-seconds', action='store', type=float, default=None,
+                    help='Print the reports every this many seconds while reading, as for a stream.')
+    ap.add_argument('--dedup', action='store', choices=['exact', 'bloom'], default=None,
+                    help='Skip rows already seen, exactly, or with a Bloom filter of a fixed size for huge logs.')
+    ap.add_argument('--dedup-keys', action='store', nargs='+', default=DEFAULT_KEYS,
+                    help='The keys that make a row a duplicate, or "line" for the whole line.')
+    ap.add_argument('--dedup-error', action='store', type=float, default=0.001,
+                    help='Share of new rows a Bloom filter may take for duplicates.')
+    ap.add_argument('--dedup-memory', action='store', type=int, default=64,
+                    help='Most MB used by the Bloom filters.')
+    ap.add_argument('--export', action='store', type=str, default=None, dest='export_path',
+                    help='Write the valid rows to this file, with {part} in it for the value of --export-by, '
+                         'e.g. out/{part}.csv.gz, rather than printing the reports.')
+    ap.add_argument('--export-by', action='store', type=str, default=None,
+                    help='The key the exported rows are split by, such as dp or ext, or date for the date of ts.')
+    ap.add_argument('--export-format', action='store', choices=['jsonl', 'csv'], default=None,
+                    help='Format of the exported rows, default is from the file extension.')
+    ap.add_argument('--export-compression', action='store', choices=['gzip', 'bz2', 'xz'], default=None,
+                    help='Compression of the exported rows, default is from the file extension.')
+    ap.add_argument('--sample', action='store', type=float, default=None, metavar='FRACTION',
+                    help='Read only this share of the log, picked at random, and print estimated counts.')
+    ap.add_argument('--sample-lines', action='store', type=int, default=None,
+                    help='Sample this many lines of a stream or compressed log, which are read to the end.')
+    ap.add_argument('--seed', action='store', type=int, default=0,
+                    help='Seed of the random sample, the same seed picks the same lines.')
+    ap.add_argument('--checksum', action='store', type=str, default=None,
+                    help='Print this checksum of the logfile, e.g. sha256, md5 or crc32, worked out as it is read.')
+    ap.add_argument('--verify', action='store', type=str, default=None, metavar='DIGEST',
+                    help='Fail unless the logfile has this sha256 digest, or that of --checksum.')
+    ap.add_argument('--content-hash', action='store_true',
+                    help='Key the cache by the digest of the logfile rather than its path and modification time.')
     args = ap.parse_args()
+    if args.find is not None:
+        query = dict(item.split('=', 1) for item in args.find)
+        if not set(query) <= set(['sha', 'uu', 'si', 'start', 'end']):
+            ap.error('--find only takes sha, uu, si, start and end.')
+        args.find = query
+    if args.export_path is not None and (args.export_by is None) == ('{part}' in args.export_path):
+        ap.error('--export needs {part} in it when, and only when, --export-by is given.')
+    if args.sample is not None or args.sample_lines is not None:
+        args.sample = {'fraction': args.sample or 0.01, 'num_lines': args.sample_lines or 10000, 'seed': args.seed}
+        if args.sample_lines is not None and args.sample is None:
+            args.sample['method'] = 'reservoir'
+    if args.verify is not None and (args.incremental or args.every_lines is not None or args.every_seconds is not None
+                                    or args.sample is not None or args.export_path is not None):
+        ap.error('--verify only works with a full read of the logfile.')
+    if args.window is not None and 'windows' not in args.reports:
+        args.reports.append('windows')
+    if args.quiet:
+        args.max_warnings = 0
+    elif args.max_warnings < 0:
+        args.max_warnings = None
     return args
 
 if __name__  == '__main__':
     args = parse_args()
-    print(args.logfile)
-    main(args.logfile)
-
-
-
-
-
+    main(args.logfile, workers=args.workers, incremental=args.incremental, streaming=args.streaming,
+         cache_dir=args.cache_dir, cache_size=args.cache_size, compact=args.compact, profile=args.profile,
+         cprofile=args.cprofile, max_warnings=args.max_warnings, reject_path=args.rejects,
+         reports=args.reports,
+         report_options={'distinct_error': args.distinct_error, 'count_error': args.count_error,
+                         'window': args.window or 60, 'slide': args.slide, 'lateness': args.lateness},
+         windows_path=args.windows_out, index=args.index, query=args.find, every_lines=args.every_lines,
+         every_seconds=args.every_seconds, dedup=args.dedup,
+         dedup_options={'keys': None if args.dedup_keys == ['line'] else args.dedup_keys,
+                        'error': args.dedup_error, 'max_bytes': args.dedup_memory * 1024**2},
+         export_path=args.export_path,
+         export_options={'fmt': args.export_format, 'partition_by': args.export_by,
+                         'compression': args.export_compression},
+         sample=args.sample, checksum=args.checksum, expected_digest=args.verify,
+         content_hash=args.content_hash)
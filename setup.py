@@ -29,15 +29,17 @@ setup(
         'Development Status :: 3 - Alpha',
         'Topic :: Software Development :: Code Sample',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
     ],
 
     packages=find_packages(exclude=['docs', 'tests']), 
-    python_requires='>=2.7, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*, <4',
+    python_requires='>=3.8, <4',
 
-    install_requires=['pandas'], 
+    install_requires=['numpy>=1.17', 'pandas>=0.25'], 
     extras_require={  
-        'test': ['nosetests', 'pathlib'],
+        'test': ['pytest'],
+        'fast': ['orjson'],
     },
 
     entry_points={  # Optional
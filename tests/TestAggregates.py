@@ -0,0 +1,207 @@
+"""
+Module:  TestAggregates
+
+Description:
+
+This module contains a set of unit tests for the aggregates.
+"""
+
+import json
+import unittest
+from datetime import datetime
+import pandas as pd
+from log_reader.Aggregates import CountAggregate, TopAggregate, DistinctAggregate, PercentileAggregate, \
+    ApproxDistinctAggregate, HeavyHitterAggregate, WindowAggregate, aggregate_from_dict
+
+
+class TestCountAggregate(unittest.TestCase):
+
+    def setUp(self):
+        self._rows = [{"ext": "pdf", "dp": 1}, {"ext": "ext", "dp": 2}, {"ext": "pdf", "dp": 2}, {"ext": "", "dp": 3}]
+
+    def test_counts(self):
+        """
+        The counts must match a groupby of the same rows.
+        """
+        frame = pd.DataFrame(self._rows)
+        for key in ["ext", "dp"]:
+            by_rows = CountAggregate(key)
+            by_rows.add_rows(self._rows[:2])
+            by_rows.add_rows(self._rows[2:])
+            by_frame = CountAggregate(key)
+            by_frame.add_frame(frame)
+            expected = frame.groupby([key]).size()
+            self.assertTrue(by_rows.result().equals(expected), msg="Counts of rows differ from groupby for " + key)
+            self.assertTrue(by_frame.result().equals(expected), msg="Counts of a frame differ from groupby for " + key)
+
+    def test_merge_and_save(self):
+        first = CountAggregate("dp")
+        first.add_rows(self._rows[:2])
+        second = CountAggregate("dp")
+        second.add_rows(self._rows[2:])
+
+        # Through JSON and back, the int values must stay ints
+        second = CountAggregate.from_dict(json.loads(json.dumps(second.to_dict())))
+        first.merge(second)
+        self.assertEqual(first.counts, {1: 1, 2: 2, 3: 1}, msg="Merged counts are not as expected.")
+
+        with self.assertRaises(AssertionError):
+            first.merge(CountAggregate("ext"))
+
+
+class TestReportAggregates(unittest.TestCase):
+
+    def setUp(self):
+        self._rows = [{"sha": "b" * 64, "uu": "u1", "bg": "g1", "pt": 10, "dp": 1},
+                      {"sha": "a" * 64, "uu": "u2", "bg": "g1", "pt": 3, "dp": 2},
+                      {"sha": "b" * 64, "uu": "u1", "bg": "g2", "pt": 7, "dp": 2},
+                      {"sha": "c" * 64, "uu": "u1", "bg": "g1", "pt": 3, "dp": 3},
+                      {"sha": "a" * 64, "uu": "u3", "bg": "g2", "pt": 42, "dp": 2}]
+        self._frame = pd.DataFrame(self._rows)
+
+    def _check(self, make, expected):
+        """
+        Rows, a frame and a merge through JSON must all give the expected result.
+        """
+        by_rows = make()
+        by_rows.add_rows(self._rows)
+        by_frame = make()
+        by_frame.add_frame(self._frame)
+        first = make()
+        first.add_rows(self._rows[:2])
+        second = make()
+        second.add_rows(self._rows[2:])
+        first.merge(aggregate_from_dict(json.loads(json.dumps(second.to_dict()))))
+        for name, aggregate in [("rows", by_rows), ("frame", by_frame), ("merge", first)]:
+            self.assertTrue(aggregate.result().equals(expected),
+                            msg="Result of " + name + " differs:\n" + str(aggregate.result()))
+        by_rows.reset()
+        self.assertEqual(len(by_rows.result().dropna()), 0, msg="Reset did not forget the rows.")
+
+    def test_top(self):
+        expected = pd.Series([2, 2], index=pd.Index(["a" * 64, "b" * 64], name="sha"), dtype="int64")
+        self._check(lambda: TopAggregate("sha", 2), expected)
+
+    def test_distinct(self):
+        self._check(lambda: DistinctAggregate("uu", "bg"), self._frame.groupby("bg")["uu"].nunique())
+
+    def test_percentiles(self):
+        expected = self._frame["pt"].quantile([0.0, 0.5, 0.9, 1.0])
+        expected.index = pd.Index([0.0, 50.0, 90.0, 100.0], name="percentile")
+        self._check(lambda: PercentileAggregate("pt", [0, 50, 90, 100]), expected.astype("float64"))
+
+    def test_labels(self):
+        aggregate = CountAggregate("dp", labels={1: "MALICIOUS", 2: "CLEAN", 3: "UNKNOWN"})
+        aggregate.add_rows(self._rows)
+        aggregate = aggregate_from_dict(json.loads(json.dumps(aggregate.to_dict())))
+        self.assertEqual(dict(aggregate.result()), {"MALICIOUS": 1, "CLEAN": 3, "UNKNOWN": 1},
+                         msg="Counts are not shown by their labels.")
+
+
+class TestApproximateAggregates(unittest.TestCase):
+
+    def setUp(self):
+        self._rows = []
+        for index in range(4000):
+            sha = "%064x" % (index % 7 if index % 2 == 0 else index)
+            self._rows.append({"sha": sha, "uu": "u" + str(index % 900), "bg": "g" + str(index % 3), "dp": index % 3 + 1})
+        self._frame = pd.DataFrame(self._rows)
+
+    def _merged(self, make):
+        """
+        :return: The aggregate of the rows added in two halves, one merged through JSON.
+        """
+        first = make()
+        first.add_rows(self._rows[:1500])
+        second = make()
+        second.add_frame(self._frame[1500:])
+        first.merge(aggregate_from_dict(json.loads(json.dumps(second.to_dict()))))
+        return first
+
+    def test_approx_distinct(self):
+        expected = self._frame.groupby("bg")["uu"].nunique()
+        result = self._merged(lambda: ApproxDistinctAggregate("uu", "bg", 0.01)).result()
+        self.assertEqual(list(result.index), list(expected.index), msg="Groups differ.")
+        self.assertTrue(((result - expected).abs() <= 0.05 * expected).all(), msg="Counts are too far off:\n" + str(result))
+
+    def test_heavy_hitters(self):
+        """
+        The seven common values must be found, with counts no less than the
+        true ones, and only the malicious rows counted when asked.
+        """
+        expected = TopAggregate("sha", 7)
+        expected.add_rows(self._rows)
+        expected = expected.result()
+        result = self._merged(lambda: HeavyHitterAggregate("sha", 7, 0.001)).result()
+        self.assertEqual(sorted(result.index), sorted(expected.index), msg="Most common values differ.")
+        self.assertTrue((result >= expected[result.index]).all(), msg="Counts are less than the true ones.")
+
+        malicious = self._merged(lambda: HeavyHitterAggregate("sha", 3, 0.001, where={"dp": 1})).result()
+        expected = self._frame[self._frame["dp"] == 1]["sha"].value_counts()
+        self.assertEqual(list(malicious), list(expected[malicious.index]),
+                         msg="Rows other than malicious were counted:\n" + str(malicious))
+
+
+class TestWindowAggregate(unittest.TestCase):
+
+    def setUp(self):
+        # A row every 10 seconds for 5 minutes, every other ts as a date string
+        self._rows = []
+        for index in range(30):
+            ts = 1551140400 + 10 * index
+            if index % 2 == 1:
+                ts = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+            self._rows.append({"ts": ts, "ext": ["pdf", "exe"][index % 2], "dp": index % 3 + 1, "pt": index})
+
+    def test_tumbling(self):
+        emitted = []
+        aggregate = WindowAggregate(60, emit=emitted.append)
+        for first in range(0, 30, 4):
+            aggregate.add_rows(self._rows[first:first + 4])
+            # Only windows that have ended by the latest ts are emitted
+            self.assertTrue(all(window["end"] <= 1551140400 + 10 * min(first + 3, 29) for window in emitted))
+        self.assertEqual(len(emitted), 4, msg="The last window is not complete yet.")
+        aggregate.finish()
+        self.assertEqual([window["rows"] for window in emitted], [6, 6, 6, 6, 6], msg="Wrong rows in each window.")
+        self.assertEqual(emitted[1]["ext"], {"pdf": 3, "exe": 3}, msg="Wrong ext counts.")
+        self.assertEqual((emitted[1]["pt_min"], emitted[1]["pt_mean"], emitted[1]["pt_max"]), (6, 8.5, 11))
+        # Emitted windows are not kept
+        self.assertEqual(aggregate.windows, [], msg="Emitted windows were kept.")
+        self.assertEqual(len(aggregate.result()), 0, msg="Emitted windows are in the result.")
+        self.assertEqual(aggregate.to_dict()["panes"], [], msg="Panes of emitted windows were kept.")
+
+        kept = WindowAggregate(60)
+        kept.add_rows(self._rows)
+        kept.finish()
+        self.assertEqual(kept.windows, emitted, msg="Kept windows differ from the windows emitted.")
+        result = kept.result()
+        self.assertEqual(list(result["rows"]), [6, 6, 6, 6, 6], msg="Result differs from the windows emitted.")
+        self.assertEqual(list(result["dp=1"]), [2, 2, 2, 2, 2], msg="Wrong dp counts.")
+        self.assertEqual(result.index[0], datetime.fromtimestamp(1551140400), msg="Windows do not start on the minute.")
+
+        aggregate.add_rows(self._rows[:1])
+        self.assertEqual(aggregate.late_rows, 1, msg="A row after its window was emitted is not late.")
+
+    def test_sliding(self):
+        """
+        Sliding windows from rows, from a frame and merged through JSON
+        are the same, and each window has the rows of its panes.
+        """
+        frame = pd.DataFrame(self._rows)
+        by_rows = WindowAggregate(120, 60)
+        by_rows.add_rows(self._rows)
+        by_frame = WindowAggregate(120, 60)
+        by_frame.add_frame(frame)
+        merged = WindowAggregate(120, 60)
+        merged.add_rows(self._rows[15:])
+        other = WindowAggregate(120, 60)
+        other.add_rows(self._rows[:15])
+        merged.merge(aggregate_from_dict(json.loads(json.dumps(other.to_dict()))))
+
+        expected = by_rows.result()
+        self.assertEqual(list(expected["rows"]), [6, 12, 12, 12, 12, 6], msg="Wrong rows in each sliding window.")
+        self.assertTrue(by_frame.result().equals(expected), msg="Windows of a frame differ.")
+        self.assertTrue(merged.result().equals(expected), msg="Merged windows differ.")
+
+        with self.assertRaises(AssertionError):
+            WindowAggregate(120, 50)
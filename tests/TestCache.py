@@ -0,0 +1,128 @@
+"""
+Module:  TestCache
+
+Description:
+
+This module contains a set of unit tests for the FrameCache class.
+"""
+
+import os, shutil, time
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from log_reader.Cache import FrameCache, _stat_of
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def setUp(self):
+        self._cache_dir = tempfile.mkdtemp()
+        self._log = os.path.join(self._cache_dir, 'log.json')
+        with open(self._log, 'w') as fp:
+            fp.write('{"a": 1}\n')
+        self._frame = pd.DataFrame([{"ext": "pdf", "dp": 1}, {"ext": "ext", "dp": 2}])
+
+    def tearDown(self):
+        shutil.rmtree(self._cache_dir)
+
+    def test_store_and_load(self):
+        test = FrameCache(os.path.join(self._cache_dir, 'cache'))
+        key = test.get_key(self._log, 'digest')
+        self.assertEqual(test.load(key), (None, None), msg="Empty cache returned a frame.")
+
+        test.store(key, self._frame, {"decode_errors": 3})
+        frame, info = test.load(key)
+        self.assertTrue(self._frame.equals(frame), msg="Cached frame differs from the stored one.")
+        self.assertEqual(info, {"decode_errors": 3}, msg="Cached information differs from the stored one.")
+        self.assertEqual([name for name in os.listdir(test.cache_dir) if name.endswith('.tmp')], [],
+                         msg="Temporary files were left in the cache.")
+
+        test.enabled = False
+        self.assertEqual(test.load(key), (None, None), msg="Disabled cache returned a frame.")
+
+    def test_frame_types(self):
+        """
+        Frames of the compact layout, and columns of mixed values, come back
+        as they were stored, and a pickle in the cache is never loaded.
+        """
+        test = FrameCache(self._cache_dir)
+        frame = pd.DataFrame(index=pd.RangeIndex(3))
+        frame['ts'] = pd.to_datetime(['2019-02-26 00:19:12', '2019-02-26 00:19:13', '2019-02-27 10:00:00'])
+        frame['pt'] = np.array([55, 1, 80], dtype='uint8')
+        frame['si'] = np.array([b'\x00' * 16, b'\x01' * 16, b'\xff' * 16], dtype='S16')
+        frame['ext'] = pd.Categorical(['pdf', '', 'pdf'])
+        frame['dp'] = pd.Categorical([1, 2, 3])
+        frame['nm'] = pd.Series(['a.pdf', None, 'caf\u00e9'], dtype=object)
+        frame['mixed'] = pd.Series([1551140352, '2019-02-26 00:19:12', None], dtype=object)
+        key = test.get_key(self._log, 'compact', 'compact')
+        test.store(key, frame)
+        loaded, info = test.load(key)
+        self.assertTrue(frame.equals(loaded), msg="Cached frame differs from the stored one.")
+        self.assertEqual(list(loaded.dtypes), list(frame.dtypes), msg="Cached frame has different dtypes.")
+
+        frame.to_pickle(os.path.join(self._cache_dir, key + '.frame'))
+        self.assertEqual(test.load(key), (None, None), msg="A pickle in the cache was loaded.")
+
+    def test_key(self):
+        """
+        The key changes with the valid keys and the log file.
+        """
+        test = FrameCache(self._cache_dir)
+        key = test.get_key(self._log, 'digest')
+        self.assertEqual(key, test.get_key(self._log, 'digest'), msg="Key is not the same for the same file.")
+        self.assertNotEqual(key, test.get_key(self._log, 'other digest'), msg="Key did not change with valid_keys.")
+
+        with open(self._log, 'a') as fp:
+            fp.write('{"a": 2}\n')
+        self.assertNotEqual(key, test.get_key(self._log, 'digest'), msg="Key did not change with the file.")
+
+        # Same size and time, different content
+        test.content_hash = True
+        key = test.get_key(self._log, 'digest')
+        stat = os.stat(self._log)
+        with open(self._log, 'w') as fp:
+            fp.write('{"a": 3}\n{"a": 4}\n')
+        os.utime(self._log, (stat.st_atime, stat.st_mtime))
+        self.assertNotEqual(key, test.get_key(self._log, 'digest'), msg="Key did not change with the content.")
+
+    def test_known_digest(self):
+        """
+        A digest remembered from a read is used for the key until the log
+        changes, and a copy of the log has the same key.
+        """
+        test = FrameCache(os.path.join(self._cache_dir, 'cache'), content_hash=True)
+        self.assertIsNone(test.known_digest(self._log), msg="A digest was known before a read.")
+        test.remember_digest(self._log, _stat_of(self._log), 'remembered')
+        self.assertEqual(test.known_digest(self._log), 'remembered', msg="The digest was not remembered.")
+        self.assertIsNone(test.known_digest(self._log, 'md5'), msg="A digest of another checksum was used.")
+        self.assertEqual(test.get_key(self._log, 'digest'), test.get_key(self._log, 'digest', digest='remembered'),
+                         msg="The remembered digest was not used for the key.")
+
+        with open(self._log, 'a') as fp:
+            fp.write('{"a": 2}\n')
+        self.assertIsNone(test.known_digest(self._log), msg="The digest of a changed log was used.")
+
+        # The key is of the content, wherever it is
+        copy = os.path.join(self._cache_dir, 'copy.json')
+        shutil.copyfile(self._log, copy)
+        self.assertEqual(test.get_key(copy, 'digest'), test.get_key(self._log, 'digest'), msg="A copy has another key.")
+
+    def test_evict(self):
+        """
+        The least recently used frames are removed first.
+        """
+        test = FrameCache(self._cache_dir)
+        for key in ['a', 'b', 'c']:
+            test.store(key, self._frame)
+        # Make the frames used in the order b, c, a
+        for age, key in [(30, 'b'), (20, 'c'), (10, 'a')]:
+            when = time.time() - age
+            os.utime(os.path.join(self._cache_dir, key + '.frame'), (when, when))
+
+        one_frame = os.path.getsize(os.path.join(self._cache_dir, 'a.frame')) + \
+                    os.path.getsize(os.path.join(self._cache_dir, 'a.json'))
+        test.max_bytes = 2 * one_frame
+        self.assertEqual(test.evict(), 1, msg="One frame should have been removed.")
+        self.assertEqual(test.load('b'), (None, None), msg="The least recently used frame was not removed.")
+        self.assertIsNotNone(test.load('a')[0], msg="A recently used frame was removed.")
@@ -0,0 +1,68 @@
+"""
+Module:  TestCompact
+
+Description:
+
+This module contains a set of unit tests for the compact data frame layout.
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+from log_reader.Compact import compact_frame, unpack_hex, align_frames, memory_per_row
+
+
+class TestCompact(unittest.TestCase):
+
+    def setUp(self):
+        self._frame = pd.DataFrame([
+            {"ts": 1551140352, "pt": 55, "si": "3380fb19-0bdb-46ab-8781-e4c5cd448074",
+             "uu": "0dd24034-36d6-4b1e-a6c1-a52cc984f105", "bg": "77e28e28-745a-474b-a496-3c0e086eaec0",
+             "sha": "abb3ec1b8174043d5cd21d21fbe3c3fb3e9a11c7ceff3314a3222404feedda00",
+             "nm": "phkkrw.pdf", "ph": "/efvrfutgp/expgh", "dp": 2, "ext": "pdf"},
+            {"ts": "2019-02-26 00:19:12", "pt": 1, "si": "8214ebed-a31b-477f-ac5d-cd35fb04b810",
+             "uu": "0dd24034-36d6-4b1e-a6c1-a52cc984f105", "bg": "49c8d2ef-7205-4765-b1db-0acc29b728b2",
+             "sha": "5f6f3f31e0433b3d46cb2299cf12e06d4ffc2590ba149cc726b1f610606cb986",
+             "nm": "ywcgdssxa.qxd", "ph": "/dabs/yuqqwzxq", "dp": 1, "ext": "qxd"}])
+
+    def test_compact_frame(self):
+        test = compact_frame(self._frame)
+        self.assertEqual(list(test.columns), list(self._frame.columns), msg="Columns were changed.")
+        self.assertEqual(test['ts'].dtype.kind, 'M', msg="ts is not datetime64.")
+        self.assertEqual(test['pt'].dtype, np.uint8, msg="pt is not uint8.")
+        self.assertEqual(test['si'].dtype, np.dtype('S16'), msg="si is not 16 bytes.")
+        self.assertEqual(test['sha'].dtype, np.dtype('S32'), msg="sha is not 32 bytes.")
+        for column in ['uu', 'bg', 'dp', 'ext']:
+            self.assertIsInstance(test[column].dtype, pd.CategoricalDtype, msg=column + " is not categorical.")
+
+        # The packed values can be unpacked, trailing zero bytes included
+        self.assertEqual(unpack_hex(test['si'], 'si'), list(self._frame['si']), msg="si did not unpack.")
+        self.assertEqual(unpack_hex(test['sha'], 'sha'), list(self._frame['sha']), msg="sha did not unpack.")
+        self.assertEqual(list(test['dp']), [2, 1], msg="dp values were changed.")
+
+        self.assertLess(memory_per_row(test), memory_per_row(self._frame), msg="Compact frame is not smaller.")
+        self.assertEqual(memory_per_row(pd.DataFrame([])), 0.0, msg="Empty frame uses memory.")
+
+    def test_unpackable_values(self):
+        """
+        Columns that can not be packed without changing them are left as they are.
+        """
+        self._frame.loc[0, 'sha'] = self._frame.loc[0, 'sha'].upper()
+        self._frame.loc[1, 'si'] = self._frame.loc[1, 'si'].replace('-', '_')
+        test = compact_frame(self._frame)
+        self.assertEqual(list(test['sha']), list(self._frame['sha']), msg="Upper case sha was changed.")
+        self.assertEqual(list(test['si']), list(self._frame['si']), msg="si without dashes was changed.")
+
+    def test_align_frames(self):
+        first = compact_frame(self._frame.iloc[:1])
+        other = self._frame.iloc[1:].copy()
+        other.loc[1, 'sha'] = other.loc[1, 'sha'].upper()
+        second = compact_frame(other)
+
+        test = pd.concat(align_frames([first, second]), ignore_index=True)
+        for column in ['uu', 'bg', 'dp', 'ext']:
+            self.assertIsInstance(test[column].dtype, pd.CategoricalDtype, msg=column + " is not categorical.")
+        self.assertEqual(list(test['ext']), ['pdf', 'qxd'], msg="ext values were changed.")
+        self.assertEqual(test['si'].dtype, np.dtype('S16'), msg="si is not 16 bytes.")
+        self.assertEqual(list(test['sha']), [self._frame.loc[0, 'sha'], other.loc[1, 'sha']],
+                         msg="sha was not unpacked in every frame.")
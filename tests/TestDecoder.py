@@ -0,0 +1,45 @@
+"""
+Module:  TestDecoder
+
+Description:
+
+This module contains a set of unit tests for the JsonDecoder class.
+"""
+
+import unittest
+from log_reader.Decoder import JsonDecoder, available_backends
+
+
+class TestJsonDecoder(unittest.TestCase):
+
+    def test_create_instance(self):
+        """
+        Test creating a decoder with each of the available backends.
+        """
+        self.assertIn('json', available_backends(), msg="The standard json backend is always available.")
+        for backend in available_backends():
+            test_obj = JsonDecoder(backend)
+            self.assertEqual(test_obj.backend, backend, msg="Backend is not as expected: " + str(test_obj.backend))
+
+        with self.assertRaises(AssertionError):
+            JsonDecoder('not_a_json_library')
+
+    def test_decode_batch(self):
+        """
+        Test decoding a batch with good, blank and malformed lines.
+        """
+        lines = ['{"nm": "a.pdf", "dp": 1}\n',
+                 '\n',
+                 '{"nm": "b.pdf", "dp": \n',
+                 '[1, 2, 3]\n',
+                 '{"nm": "c.ext", "dp": 3}\n']
+
+        for backend in available_backends():
+            test_obj = JsonDecoder(backend)
+            rows, failures = test_obj.decode_batch(lines, first_line=11)
+            self.assertEqual(rows, [(11, {"nm": "a.pdf", "dp": 1}), (15, {"nm": "c.ext", "dp": 3})],
+                             msg="Decoded rows are not as expected with " + backend)
+            self.assertEqual([line_no for line_no, err in failures], [13, 14],
+                             msg="Failed lines are not as expected with " + backend)
+            self.assertEqual((test_obj.decoded, test_obj.failed, test_obj.blank), (2, 2, 1),
+                             msg="Decoder counts are not as expected with " + backend)
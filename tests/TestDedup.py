@@ -0,0 +1,103 @@
+"""
+Module:  TestDedup
+
+Description:
+
+This module contains a set of unit tests for the deduplicators.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from log_reader.Dedup import ExactDeduplicator, BloomDeduplicator
+
+
+class TestDeduplicators(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Rows of 2000 events, each one seen twice, the second time in the
+        next batch of 1000 rows.
+        """
+        self._rows = [{'si': str(i % 2000), 'sha': 'abc', 'ts': 1551140352, 'pt': i} for i in range(4000)]
+        self._lines = [json.dumps(row) for row in self._rows]
+
+    def check_all(self, test, batch_size=1000):
+        """
+        :return: (list of bool) - Whether each row is a duplicate, checked a batch at a time.
+        """
+        duplicate = []
+        for start in range(0, len(self._rows), batch_size):
+            end = start + batch_size
+            duplicate += list(test.check(self._rows[start:end], self._lines[start:end], list(range(start + 1, end + 1))))
+        return duplicate
+
+    def test_exact(self):
+        """
+        Every event seen before is found, in earlier batches and in the same one.
+        """
+        test = ExactDeduplicator(max_samples=3)
+        self.assertEqual(self.check_all(test), [False] * 2000 + [True] * 2000, msg="Wrong duplicates found.")
+        self.assertEqual((test.duplicates, test.samples), (2000, [2001, 2002, 2003]), msg="Wrong duplicates counted.")
+
+        test.reset()
+        self.assertEqual(sum(self.check_all(test, 3000)), 2000, msg="Duplicates in a batch were not found.")
+
+        # Whole lines differ by pt so none are duplicates
+        test = ExactDeduplicator(keys=None)
+        self.assertEqual(sum(self.check_all(test)), 0, msg="Lines that differ were taken for duplicates.")
+
+    def test_bloom(self):
+        """
+        A Bloom filter big enough finds the same duplicates, a small one
+        forgets the oldest rows but never misses a row seen just before.
+        """
+        test = BloomDeduplicator(max_bytes=64 * 1024)
+        self.assertGreater(test.capacity, 4000, msg="The filter is too small for the test.")
+        self.assertEqual(self.check_all(test), [False] * 2000 + [True] * 2000, msg="Wrong duplicates found.")
+
+        test = BloomDeduplicator(max_bytes=1024)
+        self.assertLess(test.capacity, 2000, msg="The filter is too big for the test.")
+        repeated = [row for row in self._rows[:1000] for i in range(2)]
+        duplicate = test.check(repeated, [None] * len(repeated), list(range(len(repeated))))
+        self.assertEqual(list(duplicate[1::2]), [True] * 1000, msg="A row seen just before was missed.")
+
+    def test_state(self):
+        """
+        A deduplicator carries on from a saved state as if it had not stopped.
+        """
+        seen_path = os.path.join(tempfile.mkdtemp(), 'seen')
+        try:
+            for make in [ExactDeduplicator, lambda: BloomDeduplicator(max_bytes=64 * 1024)]:
+                test = make()
+                self.assertFalse(test.changed, msg="A new deduplicator has changed.")
+                test.check(self._rows[:1000], self._lines[:1000], list(range(1000)))
+                size = test.save_seen(seen_path)
+                self.assertFalse(test.changed, msg="Rows seen were not saved.")
+                test.check(self._rows[1000:2000], self._lines[1000:2000], list(range(1000, 2000)))
+                self.assertTrue(test.changed, msg="New rows seen were not noted.")
+                size = test.save_seen(seen_path, size if test.appends else None)
+
+                other = make()
+                other.load_state(json.loads(json.dumps(test.save_state())))
+                other.load_seen(seen_path, size)
+                duplicate = other.check(self._rows[2000:], self._lines[2000:], list(range(2000, 4000)))
+                self.assertTrue(duplicate.all(), msg="The rows seen were not loaded.")
+
+            # Only the first size bytes are loaded, rows added later are not
+            test = ExactDeduplicator()
+            test.check(self._rows[:1000], self._lines[:1000], list(range(1000)))
+            size = test.save_seen(seen_path)
+            test.check(self._rows[1000:2000], self._lines[1000:2000], list(range(1000, 2000)))
+            self.assertGreater(test.save_seen(seen_path, size), size, msg="New rows seen were not added.")
+            other = ExactDeduplicator()
+            other.load_seen(seen_path, size)
+            duplicate = other.check(self._rows[:2000], self._lines[:2000], list(range(2000)))
+            self.assertEqual(list(duplicate), [True] * 1000 + [False] * 1000, msg="Rows past the size were loaded.")
+        finally:
+            shutil.rmtree(os.path.dirname(seen_path))
+
+        with self.assertRaises(AssertionError):
+            ExactDeduplicator(keys=['si']).load_state(ExactDeduplicator().save_state())
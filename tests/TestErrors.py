@@ -0,0 +1,108 @@
+"""
+Module:  TestErrors
+
+Description:
+
+This module contains a set of unit tests for the ErrorCollector class.
+"""
+
+import os, sys
+import json
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from log_reader.Errors import ErrorCollector, classify
+
+
+class TestErrorCollector(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._warnings = [(3, 'validate', 'si value "x-1" does not match expected pattern.', '{"si": "x-1"}\n'),
+                          (5, 'decode', 'invalid JSON: Expecting value: line 1 column 1 (char 0)', b'{"si'),
+                          (8, 'validate', 'si value "x-2" does not match expected pattern.', '{"si": "x-2"}\n'),
+                          (9, 'validate', 'dp value is "4" exepcted to be one of {1: \'MALICIOUS\'}', '{"dp": 4}\n'),
+                          (12, 'validate', 'not all keys found.', '{}\n')]
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _add(self, test, warnings):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            if isinstance(warnings, str):
+                test.notice(warnings)
+            else:
+                test.add(warnings)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_classify(self):
+        self.assertEqual(classify('validate', 'si value "a b" does not match expected pattern.'),
+                         ('si', 'does not match expected pattern'), msg="Value message not classified.")
+        self.assertEqual(classify('validate', 'pt value "-1" must be greater than 0'),
+                         ('pt', 'must be greater than 0'), msg="Bound message not classified.")
+        self.assertEqual(classify('validate', 'extra keys found.'), (None, 'extra keys found'),
+                         msg="Key message not classified.")
+        self.assertEqual(classify('decode', 'invalid JSON: unexpected character'), (None, 'invalid JSON'),
+                         msg="Decode message not classified.")
+
+    def test_counts_and_samples(self):
+        test = ErrorCollector(max_samples=1)
+        output = self._add(test, self._warnings)
+        self.assertEqual(output.count('WARNING: line '), 5, msg="All warnings should be printed by default.")
+        self.assertIn('WARNING: line 5 could not be decoded, invalid JSON', output, msg="Decode warning changed.")
+        self.assertIn('WARNING: line 3 has failed with si value', output, msg="Validation warning changed.")
+
+        self.assertEqual(test.total, 5, msg="Wrong number of failures.")
+        self.assertEqual(test.counts[('si', 'does not match expected pattern')], 2, msg="Wrong count for si.")
+        self.assertEqual(test.samples[('si', 'does not match expected pattern')], [3], msg="Too many samples kept.")
+        reasons = test.to_dict()['reasons']
+        self.assertEqual(reasons[0]['field'], 'si', msg="Most common reason is not first.")
+        self.assertEqual(len(test.summary().splitlines()), 5, msg="Summary should have a line per reason.")
+
+        restored = ErrorCollector()
+        restored.restore(json.loads(json.dumps(test.to_dict())))
+        self.assertEqual(restored.counts, test.counts, msg="Restored counts differ.")
+        self.assertEqual(restored.shown, 0, msg="Restored failures were shown.")
+
+    def test_max_warnings(self):
+        test = ErrorCollector(max_warnings=2)
+        output = self._add(test, self._warnings) + self._add(test, self._warnings)
+        self.assertEqual(output.count('WARNING: line '), 2, msg="Too many warnings printed.")
+        self.assertEqual(output.count('only the first 2 warnings'), 1, msg="Limit should be noted once.")
+        self.assertEqual((test.total, test.shown), (10, 2), msg="Wrong counts of failures.")
+
+        test = ErrorCollector(max_warnings=0)
+        self.assertEqual(self._add(test, self._warnings), '', msg="Warnings printed when none were asked for.")
+        self.assertEqual(self._add(test, 'log was rotated'), '', msg="Notice printed when no warnings were asked for.")
+        self.assertEqual(test.notices, ['log was rotated'], msg="Notice was not kept.")
+
+        # Notices count towards max_warnings too
+        test = ErrorCollector(max_warnings=2)
+        output = self._add(test, 'log was rotated') + self._add(test, self._warnings)
+        self.assertEqual(output.count('WARNING: '), 3, msg="Notice and warnings are not limited together.")
+        self.assertEqual(output.count('only the first 2 warnings'), 1, msg="Limit should be noted once.")
+        test.start()
+        self.assertEqual(test.notices, [], msg="Notices were not reset.")
+
+    def test_reject_file(self):
+        reject_path = os.path.join(self._tmp_dir, 'rejects.jsonl')
+        test = ErrorCollector(max_warnings=0, reject_path=reject_path, spill_size=2)
+        test.start()
+        self._add(test, self._warnings)
+        test.close()
+        with open(reject_path) as fp:
+            rejects = [json.loads(line) for line in fp]
+        self.assertEqual([reject['line'] for reject in rejects], [3, 5, 8, 9, 12], msg="Rejects not all written.")
+        self.assertEqual(rejects[0]['raw'], '{"si": "x-1"}', msg="Raw line not kept.")
+        self.assertEqual(rejects[1]['raw'], '{"si', msg="Raw bytes line not kept.")
+        self.assertEqual(rejects[3]['field'], 'dp', msg="Field not kept.")
+
+        # The file is started again for each read
+        test.start()
+        test.close()
+        self.assertEqual(os.path.getsize(reject_path), 0, msg="Reject file was not started again.")
@@ -7,8 +7,12 @@ This module contains a set of unit tests for the FileIO class.
 """
 
 
-from log_reader.FileIO import MyFileIO
+from log_reader.FileIO import MyFileIO, is_stream, new_checksum
 import os, shutil
+import hashlib
+import time
+import tempfile
+import threading
 import unittest
 
 
@@ -91,3 +95,210 @@ class TestFileIO(unittest.TestCase):
 
 
 
+
+    def test_iter_batches(self):
+        """
+        Test streaming the data inside of a file in batches.
+        """
+        test_obj = MyFileIO(self._test_log, buffer_size=4096)
+        self.assertEqual(test_obj.buffer_size, 4096, msg="Buffer size is not as expected: " + str(test_obj.buffer_size))
+        self.assertEqual(list(test_obj.iter_lines()), test_obj.get_file_contents(), msg="Streamed lines differ from the file contents.")
+
+        batches = list(test_obj.iter_batches(3000))
+        self.assertEqual([len(b) for b in batches], [3000, 3000, 3000, 1000], msg="Batches are not the expected sizes.")
+        self.assertEqual(sum(batches, []), test_obj.get_file_contents(), msg="Batched lines differ from the file contents.")
+
+        with self.assertRaises(AssertionError):
+            list(test_obj.iter_batches(0))
+        with self.assertRaises(AssertionError):
+            test_obj.buffer_size = -1
+
+    def test_read_metrics(self):
+        """
+        The bytes read recorded in the metrics are those of the file, also
+        for lines that are not ASCII.
+        """
+        from log_reader.Metrics import Metrics
+        path = self._test_log + '.utf8'
+        with open(path, 'wb') as fp:
+            fp.write('{"nm": "caf\u00e9.pdf"}\n{"nm": "\u65e5\u672c.pdf"}\n{"nm": "a.pdf"}\n'.encode('utf-8'))
+        try:
+            for read in [lambda test_obj: test_obj.get_file_contents(),
+                         lambda test_obj: list(test_obj.iter_batches(2)),
+                         lambda test_obj: list(test_obj.iter_batches(2, 0, os.path.getsize(path)))]:
+                metrics = Metrics()
+                read(MyFileIO(path, metrics=metrics))
+                self.assertEqual(metrics.stages['read']['bytes'], os.path.getsize(path),
+                                 msg="Bytes read are not the size of the file.")
+        finally:
+            os.remove(path)
+
+    def test_get_line_ranges(self):
+        """
+        Test splitting a file into byte ranges on line boundaries.
+        """
+        test_obj = MyFileIO(self._test_log)
+        contents = test_obj.get_file_contents()
+        for num_ranges in [1, 2, 7, 64]:
+            ranges = test_obj.get_line_ranges(num_ranges)
+            self.assertEqual(len(ranges), num_ranges, msg="Wrong number of ranges: " + str(len(ranges)))
+            self.assertEqual(ranges[0][0], 0, msg="First range does not start at 0.")
+            self.assertEqual(ranges[-1][1], test_obj.file_size, msg="Last range does not end at the file size.")
+
+            lines = []
+            for start, end in ranges:
+                lines += list(test_obj.iter_lines(start, end))
+            self.assertEqual(lines, contents, msg="Lines read by range differ from the file contents.")
+
+        # A file with fewer lines than ranges
+        with open(self._test_log, 'w') as fp:
+            fp.write('{"a": 1}\n{"a": 2}\n')
+        self.assertEqual(test_obj.get_line_ranges(8), [(0, 9), (9, 18)], msg="Ranges of a small file are not as expected.")
+
+    def test_compressed_files(self):
+        """
+        Test reading files compressed with gzip, bz2 and xz.
+        """
+        import gzip, bz2, lzma
+        contents = MyFileIO(self._test_log).get_file_contents()
+        with open(self._test_log, 'rb') as fp:
+            raw = fp.read()
+
+        for ext, compression, module in [('.gz', 'gzip', gzip), ('.bz2', 'bz2', bz2), ('.xz', 'xz', lzma)]:
+            # The magic bytes are used even when the name does not say
+            for path in [self._test_log + ext, self._test_log + '.log']:
+                with module.open(path, 'wb') as fp:
+                    fp.write(raw)
+                try:
+                    test_obj = MyFileIO(path)
+                    self.assertEqual(test_obj.compression, compression, msg="Compression not detected for " + path)
+                    self.assertEqual(test_obj.get_file_contents(), contents, msg="Decompressed contents differ for " + path)
+                    self.assertEqual(sum(test_obj.iter_batches(3000), []), contents, msg="Decompressed batches differ for " + path)
+                    self.assertEqual(test_obj.get_line_ranges(4), [(0, None)], msg="A compressed file can not be split.")
+                    self.assertLess(test_obj.file_size, len(raw), msg="File size is not the compressed size.")
+                    self.assertIsNone(test_obj.uncompressed_size, msg="Uncompressed size can not be known for " + path)
+                    with self.assertRaises(AssertionError):
+                        list(test_obj.iter_lines(100, 200))
+                finally:
+                    os.remove(path)
+
+        test_obj = MyFileIO(self._test_log)
+        self.assertEqual(test_obj.compression, None, msg="Plain file was detected as compressed.")
+        self.assertEqual(test_obj.uncompressed_size, test_obj.file_size, msg="Uncompressed size of a plain file is its size.")
+
+    def test_file_identity(self):
+        """
+        Test the helpers used to tell whether a file has changed.
+        """
+        test_obj = MyFileIO(self._test_log, buffer_size=100)
+        self.assertEqual(test_obj.file_id, (os.stat(self._test_log).st_dev, os.stat(self._test_log).st_ino))
+        self.assertEqual(len(test_obj.get_head_digest()), 64, msg="Head digest is not a sha256 hex digest.")
+        self.assertEqual(test_obj.get_last_line_end(), test_obj.file_size, msg="The file ends with a complete line.")
+
+        with open(self._test_log, 'a') as fp:
+            fp.write('{"partial": ')
+        self.assertEqual(test_obj.get_last_line_end(), test_obj.file_size - 12, msg="A partial last line was not left out.")
+        self.assertEqual(test_obj.get_last_line_end(test_obj.file_size - 5), test_obj.file_size - 5,
+                         msg="No newline after start was expected.")
+
+    def test_line_offsets(self):
+        """
+        Lines read from the offsets found are the lines of the file.
+        """
+        test_obj = MyFileIO(self._test_log, buffer_size=4096)
+        with open(self._test_log, 'r') as fp:
+            lines = fp.readlines()
+        offsets = test_obj.get_line_offsets()
+        self.assertEqual(len(offsets), len(lines), msg="Wrong number of line offsets found.")
+        self.assertEqual(test_obj.read_lines(int(offsets[1234]), 2), lines[1234:1236], msg="Wrong lines read at an offset.")
+
+        # One in every 100 lines, from line 501
+        some = test_obj.get_line_offsets(100, int(offsets[500]), None, 501)
+        self.assertEqual(list(some), list(offsets[500::100]), msg="Wrong offsets of every 100th line.")
+
+    def test_checksum(self):
+        """
+        The digest worked out while the file is read is that of its bytes,
+        as stored, for each backend and when it is compressed.
+        """
+        import gzip, zlib
+        with open(self._test_log, 'rb') as fp:
+            raw = fp.read()
+        with gzip.open(self._test_log + '.gz', 'wb') as fp:
+            fp.write(raw)
+        try:
+            for path in [self._test_log, self._test_log + '.gz']:
+                with open(path, 'rb') as fp:
+                    expected = hashlib.sha256(fp.read()).hexdigest()
+                test_obj = MyFileIO(path, buffer_size=4096, checksum='sha256')
+                self.assertIsNone(test_obj.digest, msg="A digest before the file was read.")
+                lines = sum(test_obj.iter_batches(3000), [])
+                self.assertEqual(lines, sum(MyFileIO(path).iter_batches(3000), []),
+                                 msg="The lines read changed with a checksum.")
+                self.assertEqual(test_obj.digest, expected, msg="Wrong digest of " + path)
+                self.assertEqual(test_obj.get_content_digest(), expected, msg="Wrong content digest of " + path)
+        finally:
+            os.remove(self._test_log + '.gz')
+
+        test_obj = MyFileIO(self._test_log, checksum='crc32')
+        test_obj.get_file_contents()
+        self.assertEqual(test_obj.digest, '%08x' % zlib.crc32(raw), msg="Wrong crc32 digest.")
+        list(test_obj.iter_lines(0, 1000))
+        self.assertIsNone(test_obj.digest, msg="A part of the file has a digest.")
+
+        with self.assertRaises(AssertionError):
+            new_checksum('rot13')
+
+    def test_stream(self):
+        """
+        A named pipe is read as a stream, as the lines are written to it.
+        """
+        with open(self._test_log, 'r') as fp:
+            lines = fp.readlines()[:1000]
+        pipe_dir = tempfile.mkdtemp()
+        pipe_path = os.path.join(pipe_dir, 'pipe')
+        os.mkfifo(pipe_path)
+
+        def write():
+            with open(pipe_path, 'w') as fp:
+                fp.writelines(lines[:500])
+                fp.flush()
+                time.sleep(0.5)
+                fp.writelines(lines[500:])
+        try:
+            test_obj = MyFileIO(pipe_path, buffer_size=4096)
+            self.assertTrue(test_obj.is_stream and is_stream('-'), msg="A pipe is not a stream.")
+            self.assertFalse(is_stream(self._test_log), msg="A file is a stream.")
+            self.assertIsNone(test_obj.compression, msg="A stream was peeked at.")
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            test_obj.checksum = 'md5'
+            batches = list(test_obj.iter_batches(300, max_wait=0.2))
+            writer.join()
+            self.assertEqual([line for batch in batches for line in batch], lines, msg="Wrong lines read from a pipe.")
+            self.assertTrue(any(len(batch) < 300 for batch in batches[:-1]),
+                            msg="No batch was given while waiting for lines.")
+            self.assertEqual(test_obj.digest, hashlib.md5(''.join(lines).encode()).hexdigest(),
+                             msg="Wrong digest of a stream.")
+        finally:
+            shutil.rmtree(pipe_dir)
+
+    def test_write(self):
+        """
+        Files are written, added to and compressed as asked.
+        """
+        out_dir = tempfile.mkdtemp()
+        try:
+            for name in ['out.txt', 'out.txt.gz', 'out.txt.bz2', 'out.txt.xz']:
+                test_obj = MyFileIO(os.path.join(out_dir, name))
+                test_obj.write('a\nb\n')
+                test_obj.write(b'c\n', append=True)
+                self.assertEqual(test_obj.get_file_contents(), ['a\n', 'b\n', 'c\n'], msg="Wrong contents written to " + name)
+                self.assertEqual(test_obj.compression, {'.txt': None, '.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}[test_obj.file_ext],
+                                 msg="Wrong compression written to " + name)
+
+            with self.assertRaises(AssertionError):
+                MyFileIO(os.path.join(out_dir, 'out.txt')).write('a', compression='zip')
+        finally:
+            shutil.rmtree(out_dir)
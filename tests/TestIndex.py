@@ -0,0 +1,72 @@
+"""
+Module:  TestIndex
+
+Description:
+
+This module contains a set of unit tests for the sidecar index.
+"""
+
+import os, shutil
+import unittest
+from log_reader.FileIO import MyFileIO
+from log_reader.Index import LogIndex
+
+
+class TestLogIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._test_log = os.path.join("/", "tmp", "test_index.json")
+        with open(self._test_log, "w") as fp:
+            for index in range(1000):
+                fp.write('{"n": %d}\n' % index)
+        self._rows = []
+        for index in range(1000):
+            self._rows.append({"sha": "%064x" % (index % 10), "uu": "u" + str(index % 7), "si": "s" + str(index),
+                               "ts": 1551140400 + index})
+
+    def tearDown(self):
+        for path in [self._test_log, self._test_log + ".index"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_lookup(self):
+        """
+        Lines are found by value and by time, from an index built in two
+        parts and saved.
+        """
+        my_file = MyFileIO(self._test_log)
+        index = LogIndex(self._test_log, every=64)
+        index.add_rows(range(1, 501), self._rows[:500])
+        other = LogIndex(self._test_log, every=64)
+        other.add_rows(range(1, 501), self._rows[500:])
+        index.merge(other, 500)
+        index.finish(my_file, 1000, my_file.file_size, "digest")
+        index.save()
+
+        index = LogIndex.load(self._test_log)
+        self.assertEqual(index.rows, 1000, msg="Wrong number of rows in the index.")
+        self.assertEqual(list(index.lookup("sha", "%064x" % 3)), list(range(4, 1001, 10)), msg="Wrong lines for a sha.")
+        self.assertEqual(list(index.lookup("si", "s999")), [1000], msg="Wrong line for a session.")
+        self.assertEqual(len(index.lookup("uu", "nobody")), 0, msg="Lines found for a value not in the log.")
+        self.assertEqual(list(index.lookup_range(1551140400 + 120, 1551140400 + 180)), list(range(121, 181)),
+                         msg="Wrong lines for a time range.")
+
+        located = index.locate([5, 70, 100])
+        self.assertEqual([(first, wanted) for offset, first, wanted in located], [(1, [5]), (65, [70, 100])])
+        lines = my_file.read_lines(located[1][0], 36)
+        self.assertEqual(lines[-1], '{"n": 99}\n', msg="Offset of a block is not the start of its first line.")
+
+    def test_status(self):
+        my_file = MyFileIO(self._test_log)
+        index = LogIndex(self._test_log)
+        index.finish(my_file, 1000, my_file.file_size, "digest")
+        self.assertEqual(index.status(my_file, "digest"), "current")
+        self.assertEqual(index.status(my_file, "other keys"), "stale")
+
+        with open(self._test_log, "a") as fp:
+            fp.write('{"n": 1000}\n')
+        self.assertEqual(index.status(MyFileIO(self._test_log), "digest"), "grown")
+
+        with open(self._test_log, "w") as fp:
+            fp.write('{"n": "replaced"}\n' * 1000)
+        self.assertEqual(index.status(MyFileIO(self._test_log), "digest"), "stale")
@@ -6,12 +6,24 @@ Description:
 Test the LogFileAnalyzer class.
 """
 
-import os, shutil
+import os, sys, shutil
+import glob
+import json
+import hashlib
+import tempfile
+import threading
 import unittest
+from io import StringIO
 import pandas
 from datetime import datetime
 from log_reader.LogFileAnalyzer import LogFileAnalyzer
 from log_reader.utilities import StrPattern
+from log_reader.Cache import FrameCache
+from log_reader.Metrics import Metrics
+from log_reader.Errors import ErrorCollector
+from log_reader.Dedup import ExactDeduplicator, BloomDeduplicator
+from log_reader.FileIO import MyFileIO, ChecksumError
+from log_reader.Writer import PartitionedWriter
 
 
 class TestLogFileAnalyzer(unittest.TestCase):
@@ -72,15 +84,15 @@ class TestLogFileAnalyzer(unittest.TestCase):
         with self.assertRaises(AssertionError):
             test.log_path = 9
         with self.assertRaises(AssertionError):
-        	test.log_path = os.path.join('/', 'bad_dir', 'bad_file.txt')
+            test.log_path = os.path.join('/', 'bad_dir', 'bad_file.txt')
         with self.assertRaises(AssertionError):
-        	test.log_path = pandas.DataFrame()
+            test.log_path = pandas.DataFrame()
   
         # Test invalid valid key values
         with self.assertRaises(AssertionError):
-        	test.valid_keys = 234.234
+            test.valid_keys = 234.234
         with self.assertRaises(AssertionError):
-        	test.valid_keys = [1,2,3,4,5]
+            test.valid_keys = [1,2,3,4,5]
 
         # Try and set data frame which is not allowed
         df = pandas.DataFrame()
@@ -88,7 +100,7 @@ class TestLogFileAnalyzer(unittest.TestCase):
             test.data_frame=df
 
     def test_validate_row(self):
-    	"""
+        """
         This test tests the protected method that does a lot of the grunt
         work verifing the values in a row of data
         """
@@ -149,19 +161,651 @@ class TestLogFileAnalyzer(unittest.TestCase):
                    
 
     def test_reading_a_file(self):
-    	"""
-    	Do test on reading the data from a file and validating it.
-    	"""
+        """
+        Do test on reading the data from a file and validating it.
+        """
         # Read a file with 9985 valid records in it.
         # The invalid ones that were reported have at least one field
         # that does not match the expected values we've used in the
         # example.
-    	test = LogFileAnalyzer(log_path=self._test_log)
-    	num_valid_records = test.read_and_validate()
+        test = LogFileAnalyzer(log_path=self._test_log)
+        num_valid_records = test.read_and_validate()
         self.assertEqual(num_valid_records, 9985, msg='The wrong number of valid records were found in the test file.')
 
         # TODO test with a number of bad files
 
+    def test_reading_in_batches(self):
+        """
+        Reading the file in small batches must give the same data frame
+        as reading it in one go.
+        """
+        test = LogFileAnalyzer(log_path=self._test_log)
+        test.read_and_validate()
+        whole = test.data_frame
+
+        test = LogFileAnalyzer(log_path=self._test_log, batch_size=999)
+        self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found in batches.')
+        self.assertTrue(whole.equals(test.data_frame), msg='Batched data frame differs from the unbatched one.')
+
+        with self.assertRaises(AssertionError):
+            test.batch_size = 0
+
+    def test_batch_validation(self):
+        """
+        Validating a batch at a time must find the same valid rows as
+        validating a row at a time.
+        """
+        test = LogFileAnalyzer(log_path=self._test_log)
+        test.read_and_validate()
+        by_row = test.data_frame
+
+        test = LogFileAnalyzer(log_path=self._test_log, validation_mode='batch', batch_size=2500)
+        self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found in batch mode.')
+        self.assertTrue(by_row.equals(test.data_frame), msg='Batch validated data frame differs from the row validated one.')
+
+        with self.assertRaises(AssertionError):
+            test.validation_mode = 'column'
+
+    def test_parallel_read(self):
+        """
+        Reading with several worker processes must give the same data
+        frame and warnings, with the same line numbers, as one process.
+        """
+        with open(self._test_log, 'a') as fp:
+            fp.write('this is not json\n')
+
+        results = []
+        for workers in [1, 3]:
+            test = LogFileAnalyzer(log_path=self._test_log, workers=workers, batch_size=1000)
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                num_valid_records = test.read_and_validate()
+                output = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+            results.append((test.data_frame, output, test.decode_errors))
+            self.assertEqual(num_valid_records, 9985, msg='The wrong number of valid records were found with workers=' + str(workers))
+
+        self.assertTrue(results[0][0].equals(results[1][0]), msg='Parallel data frame differs from the serial one.')
+        self.assertEqual(results[0][1], results[1][1], msg='Parallel warnings differ from the serial ones.')
+        self.assertIn('WARNING: line 285 has failed', results[1][1], msg='Warning line numbers do not match the file.')
+        self.assertIn('WARNING: line 10001 could not be decoded', results[1][1], msg='Warning line numbers do not match the file.')
+        self.assertEqual(results[1][2], 1, msg='The wrong number of decode errors were found.')
+
+        with self.assertRaises(AssertionError):
+            test.workers = 0
+
+    def test_compressed_read(self):
+        """
+        A gzip compressed log gives the same data frame as the plain one.
+        """
+        import gzip
+        test = LogFileAnalyzer(log_path=self._test_log)
+        test.read_and_validate()
+        plain = test.data_frame
+
+        compressed_log = self._test_log + '.gz'
+        with open(self._test_log, 'rb') as src:
+            with gzip.open(compressed_log, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        try:
+            for workers in [1, 2]:
+                test = LogFileAnalyzer(log_path=compressed_log, workers=workers)
+                self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found in a gzip file.')
+                self.assertTrue(plain.equals(test.data_frame), msg='Data frame read from gzip differs from the plain one.')
+        finally:
+            os.remove(compressed_log)
+
+    def test_incremental_read(self):
+        """
+        Only the lines added since the last incremental read are read, and
+        the counts cover the whole log.
+        """
+        test = LogFileAnalyzer(log_path=self._test_log)
+        test.read_and_validate()
+        expected = test.show_file_type_counts()
+
+        with open(self._test_log, 'r') as fp:
+            lines = fp.readlines()
+        checkpoint = self._test_log + '.checkpoint'
+        if os.path.exists(checkpoint): os.remove(checkpoint)
+        try:
+            # The last line is only half written
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines[:4000] + [lines[4000][:40]])
+            test = LogFileAnalyzer(log_path=self._test_log)
+            self.assertEqual(test.read_incremental(), 3993, msg='The wrong number of valid records in the first part.')
+
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines)
+            self.assertEqual(test.read_incremental(), 5992, msg='The wrong number of valid records in the second part.')
+            self.assertEqual(len(test.data_frame), 5992, msg='Data frame should only have the new rows.')
+            self.assertTrue(expected.equals(test.show_file_type_counts()), msg='Incremental counts differ from a full read.')
+            self.assertEqual(test.read_incremental(), 0, msg='Nothing new was added to the log.')
+
+            # Truncated, read from the start again
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines[:100])
+            self.assertEqual(test.read_incremental(), 100, msg='A truncated log was not read from the start.')
+            self.assertEqual(test.errors.notices, [self._test_log + ' was rotated or truncated, reading it from the start.'],
+                             msg='A truncated log was not noted.')
+
+            # Rotated, a new file with the same name
+            os.remove(self._test_log)
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines[700:900])
+            self.assertEqual(test.read_incremental(), 200, msg='A rotated log was not read from the start.')
+            self.assertEqual(test.show_file_type_counts().sum(), 200, msg='Counts were not started over for a rotated log.')
+        finally:
+            os.remove(checkpoint)
+
+    def test_streaming_counts(self):
+        """
+        A streaming read keeps only the counts, which must match the
+        counts from the full data frame.
+        """
+        test = LogFileAnalyzer(log_path=self._test_log)
+        test.read_and_validate()
+        full_frame = test.data_frame
+        ext_counts = test.show_file_type_counts()
+        dp_counts = test.show_disposition_counts()
+        self.assertEqual(dp_counts.sum(), 9985, msg='Sum of the dispositions is not the number of valid records.')
+
+        for workers in [1, 2]:
+            test = LogFileAnalyzer(log_path=self._test_log, streaming=True, workers=workers)
+            self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found streaming.')
+            self.assertTrue(ext_counts.equals(test.show_file_type_counts()), msg='Streamed ext counts differ.')
+            self.assertTrue(dp_counts.equals(test.show_disposition_counts()), msg='Streamed dp counts differ.')
+
+            # Only built when asked for
+            self.assertTrue(full_frame.equals(test.data_frame), msg='Data frame built after streaming differs.')
+
+    def test_analyze(self):
+        """
+        The reports are the same from the data frame, a streaming read and
+        the compact layout, and match pandas on the full data frame.
+        """
+        names = ['ext', 'dispositions', 'top_sha', 'users_per_business', 'sessions_per_business', 'pt_percentiles']
+        test = LogFileAnalyzer(log_path=self._test_log, reports=names)
+        test.read_and_validate()
+        reports = test.analyze()
+        frame = test.data_frame
+        self.assertEqual(list(reports.keys()), names, msg='Reports are not in the order asked for.')
+        self.assertTrue(reports['ext'].equals(test.show_file_type_counts()), msg='ext report differs.')
+        self.assertEqual(dict(reports['dispositions']), {'MALICIOUS': 4961, 'CLEAN': 5024},
+                         msg='Disposition counts differ.')
+        self.assertEqual(list(reports['top_sha']), list(frame['sha'].value_counts().head(10)),
+                         msg='Top sha counts differ.')
+        self.assertTrue(reports['users_per_business'].equals(frame.groupby('bg')['uu'].nunique()),
+                        msg='Users per business differ.')
+        self.assertEqual(list(reports['pt_percentiles']), list(frame['pt'].quantile([0.5, 0.9, 0.95, 0.99])),
+                         msg='Percentiles differ.')
+
+        for settings in [{'streaming': True}, {'streaming': True, 'workers': 2}, {'compact': True}]:
+            other = LogFileAnalyzer(log_path=self._test_log, reports=names, **settings)
+            other.read_and_validate()
+            for name, result in other.analyze().items():
+                self.assertTrue(result.equals(reports[name]), msg=name + ' differs with ' + str(settings))
+
+        with self.assertRaises(AssertionError):
+            LogFileAnalyzer(log_path=self._test_log, reports=['no such report'])
+
+    def test_windows(self):
+        """
+        The windows emitted by a streaming read are those of the data frame.
+        """
+        options = {'window': 3600, 'slide': 600}
+        test = LogFileAnalyzer(log_path=self._test_log, reports=['windows'], report_options=options)
+        test.read_and_validate()
+        expected = test.analyze()['windows']
+        self.assertEqual(list(expected['rows']), [9985] * 6, msg='Every row is in all six windows.')
+        self.assertTrue((test.data_frame['epoch'] == 1551140352).all(), msg='The ts were not normalized in the frame.')
+
+        emitted = []
+        test = LogFileAnalyzer(log_path=self._test_log, reports=['windows'], report_options=options,
+                               streaming=True, window_emit=emitted.append)
+        test.read_and_validate()
+        self.assertEqual(len(emitted), 6, msg='Windows were not emitted at the end of the log.')
+        self.assertEqual([window['rows'] for window in emitted], list(expected['rows']), msg='Streamed windows differ.')
+        self.assertEqual(len(test.analyze()['windows']), 0, msg='Emitted windows were kept.')
+
+    def test_incremental_windows(self):
+        """
+        A window with rows from two incremental reads is emitted once, with
+        the rows of both, and emitted windows are not kept in the checkpoint.
+        """
+        with open(self._test_log, 'r') as fp:
+            row = json.loads(fp.readline())
+        lines = []
+        for index in range(30):
+            row['ts'] = 1551140400 + 10 * index
+            lines.append(json.dumps(row) + '\n')
+        checkpoint = self._test_log + '.checkpoint'
+        if os.path.exists(checkpoint): os.remove(checkpoint)
+        emitted = []
+        try:
+            # The window of 00:02 to 00:03 has rows of both reads
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines[:15])
+            test = LogFileAnalyzer(log_path=self._test_log, reports=['windows'], report_options={'window': 60},
+                                   window_emit=emitted.append)
+            self.assertEqual(test.read_incremental(), 15, msg='The wrong number of valid records in the first part.')
+            self.assertEqual([window['rows'] for window in emitted], [6, 6], msg='Wrong windows after the first part.')
+
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines)
+            self.assertEqual(test.read_incremental(), 15, msg='The wrong number of valid records in the second part.')
+            self.assertEqual([window['rows'] for window in emitted], [6, 6, 6, 6],
+                             msg='A window across two reads was not emitted once with all of its rows.')
+            with open(checkpoint, 'r') as fp:
+                windows = [data for data in json.load(fp)['aggregates'] if data['type'] == 'window'][0]
+            self.assertEqual(windows['windows'], [], msg='Emitted windows were kept in the checkpoint.')
+            self.assertEqual(len(windows['panes']), 1, msg='Only the pane of the open window should be kept.')
+        finally:
+            os.remove(checkpoint)
+
+    def test_read_stream(self):
+        """
+        A log read from a pipe gives the results every so many lines, and
+        at the end the results of reading the whole log.
+        """
+        names = ['dispositions', 'approx_users_per_business']
+        test = LogFileAnalyzer(log_path=self._test_log, reports=names)
+        test.read_and_validate()
+        expected = test.analyze()
+
+        pipe_dir = tempfile.mkdtemp()
+        pipe_path = os.path.join(pipe_dir, 'pipe')
+        os.mkfifo(pipe_path)
+
+        def write():
+            with open(self._test_log, 'r') as source, open(pipe_path, 'w') as fp:
+                shutil.copyfileobj(source, fp)
+        writer = threading.Thread(target=write)
+        try:
+            emitted = []
+            test = LogFileAnalyzer(log_path=pipe_path, reports=names, batch_size=1000, errors=ErrorCollector(0))
+            writer.start()
+            self.assertEqual(test.read_stream(lambda lines, results: emitted.append((lines, results)), 2500), 9985,
+                             msg='The wrong number of valid records were found in the stream.')
+            writer.join()
+        finally:
+            shutil.rmtree(pipe_dir)
+        self.assertEqual([lines for lines, results in emitted], [3000, 6000, 9000, 10000],
+                         msg='Results were not given every 2500 lines.')
+        self.assertEqual(emitted[0][1]['dispositions'].sum(), 2995, msg='Wrong counts part way through the stream.')
+        for name, result in emitted[-1][1].items():
+            self.assertTrue(result.equals(expected[name]), msg=name + ' differs in the stream.')
+        self.assertEqual(test.errors.total, 15, msg='Failed lines of the stream were not collected.')
+        self.assertIsNone(test.data_frame, msg='The rows of a stream were kept.')
+
+    def test_dedup(self):
+        """
+        Lines written again are skipped and counted, the same with a Bloom
+        filter, with workers and across incremental reads.
+        """
+        with open(self._test_log, 'r') as fp:
+            lines = fp.readlines()
+        with open(self._test_log, 'a') as fp:
+            fp.writelines(lines[:100])
+
+        test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0))
+        self.assertEqual(test.read_and_validate(), 10085, msg='Duplicates were skipped without dedup.')
+        for dedup in [ExactDeduplicator(keys=None), BloomDeduplicator(keys=None, max_bytes=1024 * 1024)]:
+            for settings in [{}, {'streaming': True}, {'workers': 2}]:
+                test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0), dedup=dedup, **settings)
+                self.assertEqual(test.read_and_validate(), 9985, msg='Duplicates were kept with ' + str(settings))
+                self.assertEqual(dedup.duplicates, 100, msg='Duplicates were not counted with ' + str(settings))
+                self.assertEqual(dedup.samples[0], 10001, msg='Wrong line of the first duplicate.')
+                self.assertEqual(len(test.data_frame), 9985, msg='Duplicates in the data frame.')
+
+        checkpoint = self._test_log + '.checkpoint'
+        try:
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines[:5000])
+            dedup = ExactDeduplicator()
+            test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0), dedup=dedup)
+            test.read_incremental()
+            with open(self._test_log, 'a') as fp:
+                fp.writelines(lines[:100])
+            self.assertEqual(LogFileAnalyzer(log_path=self._test_log, dedup=ExactDeduplicator()).read_incremental(), 0,
+                             msg='Rows of the last incremental read were not skipped.')
+            with open(checkpoint, 'r') as fp:
+                seen = json.load(fp)['dedup']['seen']
+            seen_path = checkpoint + '.0.dedup'
+            self.assertEqual(os.path.getsize(seen_path), seen['size'], msg='The rows seen were not kept next to the checkpoint.')
+            self.assertLess(os.path.getsize(checkpoint), 4096, msg='The rows seen were kept in the checkpoint.')
+
+            # Without new rows the rows seen are not written again
+            os.utime(seen_path, (0, 0))
+            LogFileAnalyzer(log_path=self._test_log, dedup=ExactDeduplicator()).read_incremental()
+            self.assertEqual(os.path.getmtime(seen_path), 0, msg='Unchanged rows seen were written again.')
+
+            # A Bloom filter is written to a new file and the old one removed
+            for number in [1, 2]:
+                with open(self._test_log, 'a') as fp:
+                    fp.writelines(lines[5000 + number * 100:5100 + number * 100])
+                test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0),
+                                       dedup=BloomDeduplicator(max_bytes=1024 * 1024))
+                test.read_incremental()
+                self.assertEqual(glob.glob(checkpoint + '.*.dedup'), [checkpoint + '.' + str(number) + '.dedup'],
+                                 msg='Wrong files of rows seen.')
+            whole = BloomDeduplicator(max_bytes=1024 * 1024)
+            LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0), dedup=whole).read_and_validate()
+            self.assertEqual(test.dedup.duplicates, whole.duplicates, msg='Rows seen by the Bloom filter were not loaded.')
+        finally:
+            os.remove(checkpoint)
+            for path in glob.glob(checkpoint + '.*.dedup'):
+                os.remove(path)
+
+    def test_export(self):
+        """
+        The valid rows are written out as they are read, a file for each
+        dp, the same rows as the data frame, without the duplicates.
+        """
+        with open(self._test_log, 'r') as fp:
+            lines = fp.readlines()
+        with open(self._test_log, 'a') as fp:
+            fp.writelines(lines[:100])
+        out_dir = tempfile.mkdtemp()
+        try:
+            test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0), dedup=ExactDeduplicator(keys=None))
+            with PartitionedWriter(os.path.join(out_dir, '{part}.csv.gz'), partition_by='dp') as writer:
+                self.assertEqual(test.export(writer), 9985, msg='Wrong number of rows exported.')
+            self.assertIsNone(test.data_frame, msg='The rows were kept.')
+            self.assertEqual(test.errors.total, 15, msg='The failed lines were not collected.')
+
+            test.read_and_validate()
+            for dp, path in writer.files.items():
+                exported = pandas.read_csv(path)
+                expected = test.data_frame[test.data_frame['dp'] == int(dp)]
+                self.assertEqual(list(exported['sha']), list(expected['sha']), msg='Wrong rows exported for dp ' + dp)
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_read_sample(self):
+        """
+        A sample gives estimates close to the counts of the whole log, the
+        same for the same seed, and the counts themselves when it is all
+        of the log.
+        """
+        test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0))
+        test.read_and_validate()
+        counts = test.show_disposition_counts()
+
+        self.assertGreater(test.read_sample(fraction=0.2, block_size=4096, seed=1), 0, msg='Nothing was sampled.')
+        self.assertIsNotNone(test.data_frame, msg='The data frame of the read was dropped.')
+        sample = test.sample
+        self.assertEqual(sample.method, 'offsets', msg='A plain file was not sampled by offsets.')
+        self.assertLess(sample.lines_read, 4000, msg='Too much of the log was read.')
+        result = sample.estimate('dp')
+        for dp, count in counts.items():
+            self.assertLess(abs(result['estimate'][dp] - count), 500, msg='Estimate too far off for dp ' + str(dp))
+            self.assertLess(result['low'][dp], result['high'][dp], msg='No interval for dp ' + str(dp))
+        test.read_sample(fraction=0.2, block_size=4096, seed=1)
+        self.assertTrue(test.sample.frame.equals(sample.frame), msg='The same seed sampled other rows.')
+
+        test.read_sample(fraction=1.0)
+        self.assertEqual(list(test.sample.estimate('dp')['estimate']), list(counts), msg='A full sample was scaled.')
+        self.assertEqual(test.errors.total, 15, msg='The failed lines were not collected.')
+
+        # A reservoir of a compressed log keeps the line numbers of its failures
+        import gzip
+        with open(self._test_log, 'rb') as fp:
+            raw = fp.read()
+        with gzip.open(self._test_log + '.gz', 'wb') as fp:
+            fp.write(raw)
+        try:
+            errors = ErrorCollector(0)
+            test = LogFileAnalyzer(log_path=self._test_log + '.gz', errors=errors, batch_size=1000)
+            test.read_sample(num_lines=20000)
+            self.assertEqual(test.sample.method, 'reservoir', msg='A compressed file was not sampled by lines.')
+            self.assertEqual(list(test.sample.estimate('dp')['estimate']), list(counts), msg='A full reservoir was scaled.')
+            self.assertIn('(lines 285, 685,', errors.summary(), msg='Wrong line numbers of failures in a reservoir.')
+        finally:
+            os.remove(self._test_log + '.gz')
+
+    def test_query(self):
+        """
+        Rows found with the index are the rows of the data frame, and the
+        index is extended when the log grows.
+        """
+        index_path = self._test_log + '.index'
+        with open(self._test_log) as fp:
+            lines = fp.readlines()
+        try:
+            full = LogFileAnalyzer(log_path=self._test_log)
+            full.read_and_validate()
+            frame = full.data_frame
+            uu = frame['uu'].iloc[0]
+
+            with open(self._test_log, 'w') as fp:
+                fp.writelines(lines[:4000])
+            test = LogFileAnalyzer(log_path=self._test_log, index=True)
+            test.read_and_validate()
+            self.assertTrue(os.path.exists(index_path), msg='The index was not saved next to the log.')
+            self.assertEqual(len(test.query(uu=uu)), (frame['uu'][:3993] == uu).sum(), msg='Wrong rows for a user.')
+
+            with open(self._test_log, 'a') as fp:
+                fp.writelines(lines[4000:])
+            found = test.query(uu=uu)
+            expected = frame[frame['uu'] == uu].reset_index(drop=True)
+            self.assertTrue(found.reset_index(drop=True).equals(expected), msg='Rows found differ after the log grew.')
+            self.assertEqual(found.index[0], 1, msg='Rows are not indexed by line number.')
+
+            found = test.query(sha=frame['sha'].iloc[10], uu=frame['uu'].iloc[10])
+            self.assertEqual(list(found.index), [11], msg='Wrong row for a sha and user.')
+            self.assertEqual(len(test.query(start=1551140352, end=1551140353)), 9985, msg='Wrong rows for a time.')
+            self.assertEqual(len(test.query(start='2019-03-01 00:00:00')), 0, msg='Rows found after the last ts.')
+        finally:
+            if os.path.exists(index_path):
+                os.remove(index_path)
+
+    def test_cached_read(self):
+        """
+        The second read of an unchanged log comes from the cache.
+        """
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = FrameCache(cache_dir)
+            test = LogFileAnalyzer(log_path=self._test_log, cache=cache)
+            self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found.')
+            self.assertEqual(len([name for name in os.listdir(cache_dir) if name.endswith('.frame')]), 1,
+                             msg='The data frame was not stored in the cache.')
+
+            cached = LogFileAnalyzer(log_path=self._test_log, cache=cache)
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                self.assertEqual(cached.read_and_validate(), 9985, msg='The wrong number of valid records were cached.')
+                output = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+            self.assertEqual(output, '', msg='Warnings were printed for a cached read.')
+            self.assertTrue(test.data_frame.equals(cached.data_frame), msg='Cached data frame differs.')
+
+            # A change to valid_keys means a new entry
+            cached.valid_keys = dict(cached.valid_keys, nm={"type": str, "min_len": 5})
+            cached.read_and_validate()
+            self.assertEqual(len([name for name in os.listdir(cache_dir) if name.endswith('.frame')]), 2,
+                             msg='Changed valid_keys used the old cache entry.')
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_expected_digest(self):
+        """
+        The log is checked against a digest as it is read, and the cache
+        finds its frame by the digest without reading it.
+        """
+        with open(self._test_log, 'rb') as fp:
+            expected = hashlib.sha256(fp.read()).hexdigest()
+        test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0), workers=2)
+        self.assertEqual(test.read_and_validate(expected), 9985, msg='The wrong number of valid records were found.')
+        self.assertEqual(test.digest, expected, msg='Wrong digest of the log.')
+        with self.assertRaises(ChecksumError):
+            test.read_and_validate('0' * 64)
+        self.assertIsNone(test.data_frame, msg='Rows of a log with the wrong digest were kept.')
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = FrameCache(cache_dir, content_hash=True)
+            test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0), cache=cache)
+            test.read_and_validate()
+            self.assertEqual(cache.known_digest(self._test_log), expected, msg='The digest of the read was not kept.')
+
+            # Touched, but the same content
+            os.utime(self._test_log, None)
+            for cached in [FrameCache(cache_dir), cache]:
+                metrics = Metrics()
+                test = LogFileAnalyzer(log_path=self._test_log, errors=ErrorCollector(0), cache=cached, metrics=metrics)
+                self.assertEqual(test.read_and_validate(expected), 9985, msg='The wrong number of valid records were cached.')
+                self.assertNotIn('read', metrics.stages, msg='The log was read when its digest was given.')
+                self.assertEqual(test.digest, expected, msg='Wrong digest of a cached log.')
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_compact_read(self):
+        """
+        The compact layout has the same rows and counts in less memory.
+        """
+        test = LogFileAnalyzer(log_path=self._test_log, batch_size=3000)
+        compact = LogFileAnalyzer(log_path=self._test_log, batch_size=3000, compact=True)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found.')
+            self.assertEqual(compact.read_and_validate(), 9985, msg='The wrong number of compact records were found.')
+        finally:
+            sys.stdout = stdout
+
+        self.assertIsInstance(compact.data_frame['ext'].dtype, pandas.CategoricalDtype, msg='ext is not categorical.')
+        self.assertEqual(list(compact.data_frame['nm']), list(test.data_frame['nm']), msg='Rows are not the same.')
+        self.assertEqual(dict(compact.show_file_type_counts()), dict(test.show_file_type_counts()),
+                         msg='File type counts are not the same.')
+        self.assertLess(compact.memory_per_row(), test.memory_per_row() / 2, msg='Compact frame is not smaller.')
+
+    def test_metrics(self):
+        """
+        Each stage of a read is recorded in the metrics.
+        """
+        metrics = Metrics()
+        test = LogFileAnalyzer(log_path=self._test_log, batch_size=3000, metrics=metrics)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found.')
+        finally:
+            sys.stdout = stdout
+        test.show_file_type_counts()
+
+        stages = metrics.stages
+        for stage in ['read', 'parse', 'validate', 'extension', 'data frame', 'concat', 'total', 'type counts']:
+            self.assertIn(stage, stages, msg='Stage ' + stage + ' was not recorded.')
+        self.assertEqual(stages['read']['calls'], 4, msg='Each batch read should be recorded.')
+        self.assertEqual(stages['parse']['rows_in'], 10000, msg='Lines parsed were not recorded.')
+        self.assertEqual(stages['validate']['rows_out'], 9985, msg='Valid rows were not recorded.')
+        self.assertEqual(stages['total']['rows_out'], 9985, msg='Total rows were not recorded.')
+
+        # Metrics are for the last read only
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            test.read_and_validate()
+        finally:
+            sys.stdout = stdout
+        self.assertIsNot(stages, metrics.stages, msg='Metrics were not reset.')
+        self.assertEqual(metrics.stages['parse']['rows_in'], 10000, msg='Metrics of the last read were added up.')
+
+    def test_error_collection(self):
+        """
+        Failed lines are counted by reason and written to a reject file
+        without a warning for each one.
+        """
+        reject_path = os.path.join('/', 'tmp', 'test_rejects.jsonl')
+        errors = ErrorCollector(max_warnings=0, reject_path=reject_path)
+        test = LogFileAnalyzer(log_path=self._test_log, batch_size=3000, errors=errors)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found.')
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        try:
+            self.assertEqual(output, '', msg='Warnings were printed.')
+            self.assertEqual(errors.total, 15, msg='The wrong number of failures were collected.')
+            self.assertEqual(errors.counts[('si', 'does not match expected pattern')], 6, msg='Wrong count for si.')
+            self.assertEqual(errors.samples[('sha', 'does not match expected pattern')], [6482, 9374, 9941],
+                             msg='Wrong sample lines for sha.')
+            with open(reject_path) as fp:
+                rejects = [json.loads(line) for line in fp]
+            self.assertEqual(len(rejects), 15, msg='Not every rejected line was written.')
+            with open(self._test_log) as fp:
+                lines = fp.read().splitlines()
+            self.assertEqual(rejects[0]['raw'], lines[rejects[0]['line'] - 1], msg='Rejected line is not the raw line.')
+        finally:
+            os.remove(reject_path)
+
+    def test_multi_file_read(self):
+        """
+        A directory or glob pattern of logs is read as one.
+        """
+        log_dir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(log_dir, 'b'))
+            with open(self._test_log) as fp:
+                lines = fp.readlines()
+            with open(os.path.join(log_dir, 'a.json'), 'w') as fp:
+                fp.writelines(lines[:3000])
+            with open(os.path.join(log_dir, 'b', 'c.json'), 'w') as fp:
+                fp.writelines(lines[3000:])
+            with open(os.path.join(log_dir, 'a.json.checkpoint'), 'w') as fp:
+                fp.write('{}')
+
+            single = LogFileAnalyzer(log_path=self._test_log)
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                single.read_and_validate()
+                results = []
+                for log_path, workers in [(log_dir, 1), (log_dir, 2), (os.path.join(log_dir, '*', '*.json'), 1)]:
+                    test = LogFileAnalyzer(log_path=log_path, workers=workers)
+                    sys.stdout = StringIO()
+                    results.append((test, test.read_and_validate(), sys.stdout.getvalue()))
+            finally:
+                sys.stdout = stdout
+
+            test, num_valid, output = results[0]
+            self.assertEqual(test.log_files, [os.path.join(log_dir, 'a.json'), os.path.join(log_dir, 'b', 'c.json')],
+                             msg='Wrong log files found in the directory.')
+            self.assertEqual(num_valid, 9985, msg='The wrong number of valid records were found.')
+            self.assertTrue(test.data_frame.equals(single.data_frame), msg='Data frame differs from a single file.')
+            self.assertEqual(dict(test.show_file_type_counts()), dict(single.show_file_type_counts()),
+                             msg='File type counts differ from a single file.')
+            self.assertEqual(test.file_results[os.path.join(log_dir, 'a.json')], {'lines': 3000, 'valid': 2995, 'failed': 5},
+                             msg='Wrong results for the first file.')
+            self.assertIn(os.path.join(log_dir, 'b', 'c.json') + ' line 62 has failed', output,
+                          msg='Warning does not name the file.')
+            self.assertEqual(results[1][1:], results[0][1:], msg='Workers changed the results.')
+            self.assertEqual(results[2][1], 6990, msg='Glob pattern did not find the one file.')
+        finally:
+            shutil.rmtree(log_dir)
+
+    def test_reading_malformed_lines(self):
+        """
+        Lines that are not JSON are counted and skipped rather than
+        stopping the read.
+        """
+        with open(self._test_log, 'a') as fp:
+            fp.write('this is not json\n')
+            fp.write('\n')
+            fp.write('{"nm": "unfinished\n')
+
+        test = LogFileAnalyzer(log_path=self._test_log)
+        self.assertEqual(test.read_and_validate(), 9985, msg='The wrong number of valid records were found.')
+        self.assertEqual(test.decode_errors, 2, msg='The wrong number of decode errors were found.')
+
     def test_show_ext_coung(self):
         """
         Do tests on the function that shows the file extensions.
@@ -0,0 +1,58 @@
+"""
+Module:  TestMetrics
+
+Description:
+
+This module contains a set of unit tests for the Metrics class.
+"""
+
+import os
+import json
+import unittest
+from log_reader.Metrics import Metrics
+from log_reader.FileIO import MyFileIO
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_record_and_merge(self):
+        test = Metrics()
+        test.record('parse', test.start(), rows_in=10, rows_out=8)
+        test.record('parse', test.start(), rows_in=5, rows_out=5, num_bytes=100)
+        test.record('validate', test.start(), rows_in=13, rows_out=12)
+        self.assertEqual(list(test.stages.keys()), ['parse', 'validate'], msg="Stages are not in the order recorded.")
+        parse = test.stages['parse']
+        self.assertEqual((parse['calls'], parse['rows_in'], parse['rows_out'], parse['bytes']), (2, 15, 13, 100),
+                         msg="Stage values were not added up.")
+        self.assertGreater(parse['peak_rss'], 0, msg="Peak memory was not kept.")
+
+        other = Metrics()
+        other.record('parse', other.start(), rows_in=1, rows_out=1)
+        other.record('read', other.start(), rows_out=1)
+        test.merge(other)
+        self.assertEqual(test.stages['parse']['rows_in'], 16, msg="Merged stage was not added.")
+        self.assertEqual(test.stages['read']['rows_out'], 1, msg="New stage was not merged.")
+
+        values = json.loads(json.dumps(test.to_dict()))
+        self.assertIn('rows_per_second', values['validate'], msg="Throughput missing from to_dict().")
+        self.assertEqual(len(test.report().splitlines()), 4, msg="Report should have a line per stage.")
+
+        test.reset()
+        self.assertEqual(len(test.stages), 0, msg="Stages were not reset.")
+
+    def test_profile(self):
+        self.assertEqual(Metrics().profile_stats(), '', msg="Profile stats without profile set.")
+        test = Metrics(profile=True)
+        test.enable_profiler()
+        sorted(range(1000), key=lambda value: -value)
+        test.disable_profiler()
+        self.assertIn('function calls', test.profile_stats(), msg="Profile stats were not kept.")
+
+    def test_file_read(self):
+        log_path = os.path.join(os.path.abspath(os.path.basename(__file__) + "/../data/"), "log.json")
+        test = Metrics()
+        my_file = MyFileIO(log_path, metrics=test)
+        lines = sum(len(batch) for batch in my_file.iter_batches(3000))
+        read = test.stages['read']
+        self.assertEqual((read['calls'], read['rows_out']), (4, lines), msg="Batches read were not recorded.")
+        self.assertEqual(read['bytes'], my_file.file_size, msg="Bytes read were not recorded.")
@@ -0,0 +1,74 @@
+"""
+Module:  TestSampling
+
+Description:
+
+This module contains a set of unit tests for the samples of a log.
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+from log_reader.Sampling import LogSample, Reservoir, pick_blocks
+
+
+class TestSampling(unittest.TestCase):
+
+    def test_pick_blocks(self):
+        """
+        The blocks are picked once each, in file order, the same for the
+        same seed.
+        """
+        num_blocks, picked = pick_blocks(1000 * 4096 + 1, 0.1, 4096, 7)
+        self.assertEqual((num_blocks, len(picked)), (1001, 100), msg="Wrong number of blocks picked.")
+        self.assertEqual(list(picked), sorted(set(picked)), msg="Blocks picked twice or out of order.")
+        self.assertEqual(list(picked), list(pick_blocks(1000 * 4096 + 1, 0.1, 4096, 7)[1]), msg="The seed was not used.")
+        self.assertEqual(len(pick_blocks(4096 * 3, 0.01, 4096, 7)[1]), 2, msg="Fewer than two blocks picked.")
+
+        with self.assertRaises(AssertionError):
+            pick_blocks(4096, 1.5, 4096, 7)
+
+    def test_reservoir(self):
+        """
+        Every line is as likely to be kept, whatever the batches.
+        """
+        test = Reservoir(3)
+        test.add(['a', 'b'])
+        self.assertEqual((test.lines, test.line_nos), (['a', 'b'], [1, 2]), msg="The first lines were not kept.")
+
+        kept = np.zeros(100)
+        for seed in range(400):
+            test = Reservoir(10, seed)
+            for first in range(0, 100, 30):
+                test.add(list(range(first, min(first + 30, 100))))
+            self.assertEqual(test.count, 100, msg="Wrong number of lines counted.")
+            self.assertEqual(sorted(line + 1 for line in test.lines), sorted(test.line_nos), msg="Wrong line numbers kept.")
+            kept[test.lines] += 1
+        # Each line is kept 40 times on average
+        self.assertLess(abs(kept[:50].mean() - kept[50:].mean()), 5, msg="The first lines are kept more often.")
+
+        other = Reservoir(10, 399)
+        other.add(list(range(100)))
+        self.assertEqual(other.lines, test.lines, msg="The batches changed the lines kept.")
+
+    def test_estimate(self):
+        """
+        Counts are scaled by the clusters not read, with an interval that
+        narrows to nothing when every cluster is read.
+        """
+        frame = pd.DataFrame({'ext': ['pdf', 'pdf', 'exe', 'pdf', 'exe', 'exe']})
+        test = LogSample('offsets', 0, frame, [0, 0, 0, 1, 1, 1], 10, 2, 6)
+        result = test.estimate('ext')
+        self.assertEqual(list(result.index), ['exe', 'pdf'], msg="Wrong values counted.")
+        self.assertEqual(list(result['sampled']), [3, 3], msg="Wrong counts of the sample.")
+        self.assertEqual(list(result['estimate']), [15, 15], msg="Wrong counts scaled up.")
+        # The mean of each is 1.5 with a variance of 0.5, so an error of 10 * sqrt(0.5 / 2 * 0.8)
+        self.assertEqual(list(result['high']), [15 + int(round(1.96 * 10 * np.sqrt(0.2)))] * 2, msg="Wrong interval.")
+        self.assertEqual(test.estimate()['estimate']['valid'], 30, msg="Wrong count of the valid rows.")
+
+        test = LogSample('offsets', 0, frame, [0, 0, 0, 1, 1, 1], 2, 2, 6)
+        result = test.estimate('ext')
+        self.assertTrue((result['low'] == result['high']).all(), msg="A full sample has an interval.")
+
+        empty = LogSample('reservoir', 0, pd.DataFrame([]), [], 0, 0, 0)
+        self.assertEqual(len(empty.estimate('ext')), 0, msg="Counts found in an empty sample.")
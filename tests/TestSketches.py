@@ -0,0 +1,76 @@
+"""
+Module:  TestSketches
+
+Description:
+
+This module contains a set of unit tests for the sketches.
+"""
+
+import json
+import unittest
+import numpy as np
+from log_reader.Sketches import HyperLogLog, CountMinSketch, hash_values
+
+
+class TestHyperLogLog(unittest.TestCase):
+
+    def test_count(self):
+        """
+        The count must be within a few standard errors, for few values
+        and for many.
+        """
+        for num_values in [10, 1000, 100000]:
+            sketch = HyperLogLog(0.01)
+            sketch.add(hash_values(range(num_values)))
+            self.assertLess(abs(sketch.count() - num_values), max(1, 3 * sketch.error * num_values),
+                            msg="Count of " + str(num_values) + " values is too far off: " + str(sketch.count()))
+
+    def test_merge_and_save(self):
+        first = HyperLogLog(0.02)
+        first.add(hash_values(range(0, 6000)))
+        second = HyperLogLog(0.02)
+        second.add(hash_values(range(4000, 10000)))
+        second = HyperLogLog.from_dict(json.loads(json.dumps(second.to_dict())))
+        first.merge(second)
+
+        both = HyperLogLog(0.02)
+        both.add(hash_values(range(10000)))
+        self.assertEqual(first.count(), both.count(), msg="Merged count differs from the count of all values.")
+
+        with self.assertRaises(AssertionError):
+            first.merge(HyperLogLog(0.01))
+
+    def test_hashes(self):
+        """
+        Values are hashed by their text, the same in every run.
+        """
+        self.assertTrue((hash_values([1, "a"]) == hash_values(["1", "a"])).all(), msg="Hashes differ for the same text.")
+        self.assertEqual(hash_values([]).dtype, np.uint64, msg="Hashes are not 64 bit.")
+
+
+class TestCountMinSketch(unittest.TestCase):
+
+    def test_estimate(self):
+        """
+        Estimates are never less than the true counts, and within the
+        error of the total.
+        """
+        values = ["common"] * 500 + ["less"] * 50 + [str(value) for value in range(5000)]
+        sketch = CountMinSketch(0.001, 0.99)
+        sketch.add(hash_values(values))
+        estimates = sketch.estimate(hash_values(["common", "less", "7"]))
+        for estimate, expected in zip(estimates, [500, 50, 1]):
+            self.assertGreaterEqual(estimate, expected, msg="Estimate is less than the true count.")
+            self.assertLessEqual(estimate, expected + sketch.error * sketch.total, msg="Estimate is too far off.")
+        self.assertEqual(sketch.total, len(values), msg="Total is not the number of values.")
+
+    def test_merge_and_save(self):
+        first = CountMinSketch(0.01)
+        first.add(hash_values(["a", "b"]), [3, 4])
+        second = CountMinSketch(0.01)
+        second.add(hash_values(["a"]), [5])
+        first.merge(CountMinSketch.from_dict(json.loads(json.dumps(second.to_dict()))))
+        self.assertEqual(list(first.estimate(hash_values(["a", "b"]))), [8, 4], msg="Merged counts are not as expected.")
+
+        with self.assertRaises(AssertionError):
+            first.merge(CountMinSketch(0.001))
@@ -0,0 +1,152 @@
+"""
+Module:  TestValidator
+
+Description:
+
+This module contains a set of unit tests for the SchemaValidator class.
+"""
+
+import unittest
+from datetime import datetime
+from log_reader.Validator import SchemaValidator, TimestampNormalizer, parse_timestamp, parse_epoch, parse_epochs, \
+    _compile_column_check
+from log_reader.utilities import StrPattern
+
+
+class TestSchemaValidator(unittest.TestCase):
+
+    def setUp(self):
+        """
+        A small schema with one key of each type.
+        """
+        self._valid_keys = { "a": {"type": str, "max_len": 10, "min_len": 2},
+                             "b": {"type": int, "min": -10, "max": 10, "values": range(-20, 20)},
+                             "c": {"type": StrPattern, "pattern" : r"([\w.]+)@([\w.]+)"},
+                             "d": {"type": datetime, "min" : 1000 },
+                             "e": {"type": float, "min": 0.0},
+                           }
+        self._row = {"a": "some text", "b": 0, "c": "me@somewhere.com", "d": "2019-05-22 10:30:23", "e": 1.5}
+
+    def test_valid_row(self):
+        test = SchemaValidator(self._valid_keys)
+        self.assertEqual(test.validate(self._row), (True, ''), msg="Valid row was not accepted.")
+        self.assertEqual([key for key, check in test.checks], list(self._valid_keys.keys()),
+                         msg="Checks are not in the order of valid_keys.")
+
+    def test_error_messages(self):
+        """
+        The reason a row is not valid, with one bad value at a time.
+        """
+        test = SchemaValidator(self._valid_keys)
+        cases = [("a", "", 'a value "" must be longer than 2 characters.'),
+                 ("a", "01234567890", 'a value "01234567890" must be shorter than 10 characters.'),
+                 ("b", 11, 'b value "11" must be smaller than 10'),
+                 ("b", -11, 'b value "-11" must be greater than -10'),
+                 ("b", 30, 'b value is "30" exepcted to be one of ' + str(range(-20, 20))),
+                 ("b", "x", 'b value "x" is not in the expected format.'),
+                 ("c", "a non email", 'c value "a non email" does not match expected pattern.'),
+                 ("c", 42, 'c value "42" does not match expected pattern.'),
+                 ("d", 0, 'd value "' + str(datetime.fromtimestamp(0)) + '" must be after 1000'),
+                 ("d", "Apr 1, 2019", 'd value "Apr 1, 2019" is not in the expected format.'),
+                 ("e", -0.5, 'e value "-0.5" must be greater than 0.0'),
+                ]
+        for key, value, expected in cases:
+            row = dict(self._row)
+            row[key] = value
+            self.assertEqual(test.validate(row), (False, expected), msg="Unexpected result for " + key + "=" + str(value))
+            # Cached results must give the same answer a second time
+            self.assertEqual(test.validate(row), (False, expected), msg="Unexpected cached result for " + key + "=" + str(value))
+            self.assertEqual(test.validate(self._row), (True, ''), msg="Valid row was not accepted after " + key + "=" + str(value))
+
+    def test_keys(self):
+        test = SchemaValidator(self._valid_keys)
+        row = dict(self._row)
+        row["f"] = 1
+        self.assertEqual(test.validate(row), (False, "extra keys found."))
+        del row["a"]
+        self.assertEqual(test.validate(row), (False, "extra keys found."))
+        del row["f"]
+        self.assertEqual(test.validate(row), (False, "not all keys found."))
+        self.assertEqual(test.validate({}), (False, "not all keys found."))
+
+        test = SchemaValidator({"a": {"type": list}})
+        self.assertEqual(test.validate({"a": []}), (False, "Unrecognized value type: " + str(list)))
+
+        with self.assertRaises(AssertionError):
+            SchemaValidator({"d": {"type": datetime, "max": "today"}})
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp(1551140352), datetime.fromtimestamp(1551140352))
+        self.assertEqual(parse_timestamp("1551140352"), datetime.fromtimestamp(1551140352))
+        self.assertEqual(parse_timestamp("2019-05-22 10:30:23"), datetime(2019, 5, 22, 10, 30, 23))
+        self.assertEqual(parse_timestamp("Apr 1, 2019"), None)
+        self.assertEqual(parse_timestamp(None), None)
+
+    def test_parse_epoch(self):
+        """
+        Both formats give the same seconds since the epoch, one at a time
+        and for a whole column.
+        """
+        local = int(datetime(2019, 5, 22, 10, 30, 23).timestamp())
+        values = [1551140352, "1551140352", "2019-05-22 10:30:23", datetime(2019, 5, 22, 10, 30, 23), "Apr 1, 2019"]
+        expected = [1551140352, 1551140352, local, local, None]
+        self.assertEqual([parse_epoch(value) for value in values], expected)
+        self.assertEqual(list(parse_epochs(values)), [1551140352, 1551140352, local, local, -1])
+
+    def test_timestamp_normalizer(self):
+        """
+        The normalizer gives what parse_epoch() does, parsing each string
+        once while it is remembered.
+        """
+        values = [1551140352, "1551140352", "2019-05-22 10:30:23", "2019-05-22 10:30:23", "2019-5-22 10:30:23",
+                  "2019-02-30 10:00:00", datetime(2019, 5, 22, 10, 30, 23), "Apr 1, 2019", None]
+        test = TimestampNormalizer(cache_size=2)
+        self.assertEqual([test.normalize(value) for value in values], [parse_epoch(value) for value in values])
+        self.assertEqual(list(test.normalize_all(values)), list(parse_epochs(values)))
+
+        test = TimestampNormalizer(cache_size=2)
+        for value in ["2019-05-22 10:30:23", "2019-05-22 10:30:24"] * 3 + ["2019-05-22 10:30:25", "2019-05-22 10:30:23"]:
+            test.normalize(value)
+        self.assertEqual((test.hits, test.misses), (4, 4), msg="Values were not remembered, or too many were.")
+
+        # The validator normalizes the values it checks
+        validator = SchemaValidator(self._valid_keys)
+        validator.validate(dict(self._row, d="2019-05-22 10:30:23"))
+        self.assertEqual(validator.normalizer.misses, 1, msg="The validator did not use its normalizer.")
+
+    def test_validate_batch(self):
+        """
+        Validating a batch a column at a time must give the same result
+        as validating each row.
+        """
+        test = SchemaValidator(self._valid_keys)
+        bad_values = {"a": ["", "01234567890", 5, None],
+                      "b": [11, -11, "x", 2.5, None],
+                      "c": ["a non email", 42, None],
+                      "d": [0, 1000, "Apr 1, 2019", "1551140352", "2019-02-30 10:00:00", 10**20, None],
+                      "e": [-0.5, "1.5", "x", None]}
+        rows = [dict(self._row)]
+        for key, values in bad_values.items():
+            for value in values:
+                row = dict(self._row)
+                row[key] = value
+                rows.append(row)
+        rows.append({"a": "ab"})
+        rows.append(dict(self._row, f=1))
+
+        valid, reasons = test.validate_batch(rows)
+        expected = [test.validate(row) for row in rows]
+        self.assertEqual(list(zip([bool(ok) for ok in valid], reasons)), expected,
+                         msg="Batch validation differs from row validation.")
+        valid, reasons = test.validate_batch([])
+        self.assertEqual((len(valid), reasons), (0, []))
+
+        # A ts column with both formats only flags the values that are not valid
+        check = _compile_column_check(self._valid_keys["d"])
+        column = [1551140352, "2019-05-22 10:30:23", 500, "1551140352", True, 1.5e9, "2019-02-30 10:00:00", None]
+        self.assertEqual(list(check(column)), [False, False, True, True, True, True, True, True],
+                         msg="The ts column check flagged the wrong values.")
+        rows = [dict(self._row, d=value) for value in column]
+        valid, reasons = test.validate_batch(rows)
+        self.assertEqual(list(zip([bool(ok) for ok in valid], reasons)), [test.validate(row) for row in rows],
+                         msg="Batch validation of mixed ts differs from row validation.")
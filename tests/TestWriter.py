@@ -0,0 +1,67 @@
+"""
+Module:  TestWriter
+
+Description:
+
+This module contains a set of unit tests for the PartitionedWriter class.
+"""
+
+import os, shutil
+import json
+import time
+import tempfile
+import unittest
+from log_reader.FileIO import MyFileIO
+from log_reader.Writer import PartitionedWriter
+
+
+class TestPartitionedWriter(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Copy the test log to a tmp directory.
+        """
+        source_file = os.path.join(os.path.abspath(os.path.basename(__file__) + "/../data/"), "log.json")
+        self._test_log = os.path.join("/", "tmp", "test_writer.json")
+        shutil.copyfile(source_file, self._test_log)
+
+    def tearDown(self):
+        os.remove(self._test_log)
+
+    def test_write_rows(self):
+        """
+        Rows are written to a file for each value of the key, as many
+        buffers as it takes, and read back as they were.
+        """
+        with open(self._test_log, 'r') as fp:
+            rows = [json.loads(line) for line in fp.readlines()[:3000]]
+        out_dir = tempfile.mkdtemp()
+        try:
+            with PartitionedWriter(os.path.join(out_dir, 'dp', '{part}.jsonl.gz'), partition_by='dp',
+                                   buffer_size=4096) as test_obj:
+                for first in range(0, len(rows), 1000):
+                    test_obj.write_rows(rows[first:first + 1000])
+            self.assertEqual(test_obj.rows_written, 3000, msg="Wrong number of rows written.")
+            self.assertEqual(sorted(test_obj.files), sorted(set(str(row['dp']) for row in rows)), msg="Wrong partitions.")
+            for part, path in test_obj.files.items():
+                written = [json.loads(line) for line in MyFileIO(path).get_file_contents()]
+                self.assertEqual(written, [row for row in rows if str(row['dp']) == part], msg="Wrong rows written to " + path)
+
+            # One header for each file, and the values of the columns only
+            with PartitionedWriter(os.path.join(out_dir, 'rows.csv'), columns=['sha', 'dp'], buffer_size=4096) as test_obj:
+                test_obj.write_rows(rows)
+            written = MyFileIO(test_obj.files[None]).get_file_contents()
+            self.assertEqual(written[0], 'sha,dp\n', msg="Wrong CSV header.")
+            self.assertEqual(written[1:], [row['sha'] + ',' + str(row['dp']) + '\n' for row in rows], msg="Wrong CSV rows.")
+
+            with PartitionedWriter(os.path.join(out_dir, '{part}.jsonl'), partition_by='date') as test_obj:
+                test_obj.write_rows([{'ts': 0}, {'ts': '2019-02-26 01:02:03'}, {'ts': 'never'}])
+            self.assertEqual(sorted(test_obj.files), sorted(['1970-01-01' if time.localtime(0).tm_year == 1970 else '1969-12-31',
+                                                             '2019-02-26', 'unknown']), msg="Wrong date partitions.")
+        finally:
+            shutil.rmtree(out_dir)
+
+        with self.assertRaises(AssertionError):
+            PartitionedWriter('/tmp/rows.jsonl', partition_by='dp')
+        with self.assertRaises(AssertionError):
+            PartitionedWriter('/tmp/rows.parquet', fmt='parquet')